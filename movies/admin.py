@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Actor, Director, Movie, Series, Episode, Advertisement
+from .models import Category, Actor, Director, Movie, Series, Season, Episode, Advertisement, RelatedMovie, RelatedSeries, TrendingScore
 
 
 @admin.register(Category)
@@ -32,19 +32,29 @@ class MovieAdmin(admin.ModelAdmin):
 
 @admin.register(Series)
 class SeriesAdmin(admin.ModelAdmin):
-    list_display = ['title', 'director', 'category', 'release_date', 'status', 'seasons_count', 'created_at']
+    list_display = ['title', 'director', 'category', 'release_date', 'status', 'seasons_count', 'views_count', 'created_at']
     list_filter = ['status', 'category', 'release_date', 'created_at']
     search_fields = ['title', 'director__name']
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'release_date'
 
 
+@admin.register(Season)
+class SeasonAdmin(admin.ModelAdmin):
+    list_display = ['series', 'number', 'title', 'created_at']
+    list_select_related = ['series']
+    search_fields = ['series__title', 'title']
+    raw_id_fields = ['series']
+
+
 @admin.register(Episode)
 class EpisodeAdmin(admin.ModelAdmin):
-    list_display = ['series', 'episode_number', 'title', 'release_date', 'created_at']
+    list_display = ['series', 'season', 'episode_number', 'title', 'release_date', 'views_count', 'created_at']
     list_filter = ['series', 'release_date', 'created_at']
+    list_select_related = ['series', 'season__series']
     search_fields = ['title', 'series__title']
     prepopulated_fields = {'slug': ('title',)}
+    autocomplete_fields = ['season']
     date_hierarchy = 'release_date'
 
 
@@ -54,3 +64,24 @@ class AdvertisementAdmin(admin.ModelAdmin):
     list_filter = ['ad_type', 'is_active', 'start_date', 'end_date']
     search_fields = ['title']
     date_hierarchy = 'created_at'
+
+
+@admin.register(RelatedMovie)
+class RelatedMovieAdmin(admin.ModelAdmin):
+    list_display = ['movie', 'rank', 'related', 'score', 'computed_at']
+    search_fields = ['movie__title', 'related__title']
+    raw_id_fields = ['movie', 'related']
+
+
+@admin.register(RelatedSeries)
+class RelatedSeriesAdmin(admin.ModelAdmin):
+    list_display = ['series', 'rank', 'related', 'score', 'computed_at']
+    search_fields = ['series__title', 'related__title']
+    raw_id_fields = ['series', 'related']
+
+
+@admin.register(TrendingScore)
+class TrendingScoreAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'category', 'score', 'updated_at']
+    list_filter = ['category']
+    raw_id_fields = ['movie', 'series']
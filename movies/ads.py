@@ -0,0 +1,103 @@
+"""
+In-process schedule of advertisements.
+
+All active ads that have not ended yet are loaded in one query and kept in
+memory. The set of ads that are live right now is recomputed from memory only
+when the clock passes the next ``start_date``/``end_date`` boundary, so pages
+render without touching the Advertisement table. Saving or deleting an ad
+invalidates the schedule (see ``movies.signals``); other worker processes pick
+the change up within ``ADS_SCHEDULE_MAX_AGE`` seconds.
+"""
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Advertisement
+
+
+class AdSchedule:
+    """Active ads indexed by time, able to answer "what is live at ``now``"."""
+
+    def __init__(self, ads):
+        self.ads = ads
+
+    @classmethod
+    def load(cls, now):
+        ads = Advertisement.objects.filter(is_active=True, end_date__gte=now).order_by('-created_at')
+        return cls(list(ads))
+
+    def live(self, now):
+        return [ad for ad in self.ads if ad.start_date <= now <= ad.end_date]
+
+    def next_boundary(self, now):
+        """First moment after ``now`` at which the live set can change"""
+        boundaries = [ad.start_date for ad in self.ads if ad.start_date > now]
+        # end_date is inclusive, the ad drops out just after it
+        boundaries += [ad.end_date + timedelta(microseconds=1) for ad in self.ads if ad.end_date >= now]
+        return min(boundaries, default=None)
+
+
+class AdResolver:
+    """Caches the schedule and the live set until something changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._schedule = None
+            self._loaded_at = None
+            self._live = []
+            self._live_until = None
+
+    def _max_age(self):
+        return getattr(settings, 'ADS_SCHEDULE_MAX_AGE', 60)
+
+    def active_ads(self, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            if self._schedule is None or time.monotonic() - self._loaded_at > self._max_age():
+                self._schedule = AdSchedule.load(now)
+                self._loaded_at = time.monotonic()
+                self._live_until = now
+            if self._live_until is not None and now >= self._live_until:
+                self._live = self._schedule.live(now)
+                self._live_until = self._schedule.next_boundary(now)
+            return self._live
+
+    def version(self, now=None):
+        """Token that changes whenever the live set of ads or one of them changes.
+
+        Computed from the ads themselves so that every worker process
+        holding the same schedule gives the same token.
+        """
+        live = self.active_ads(now)
+        digest = hashlib.md5(usedforsecurity=False)
+        for ad in live:
+            digest.update(repr((ad.pk, ad.ad_type, ad.title, ad.content, ad.image.name, ad.url)).encode())
+        return digest.hexdigest()[:16]
+
+
+resolver = AdResolver()
+
+
+def get_active_ads(now=None):
+    """Ads that are live right now, newest first"""
+    return resolver.active_ads(now)
+
+
+def get_active_ads_by_type(now=None):
+    """Live ads grouped by ``ad_type``"""
+    ads_by_type = {}
+    for ad in get_active_ads(now):
+        ads_by_type.setdefault(ad.ad_type, []).append(ad)
+    return ads_by_type
+
+
+def invalidate_ads():
+    resolver.invalidate()
@@ -0,0 +1,333 @@
+"""
+Read-only JSON API over the catalog.
+
+``/api/<resource>/`` lists a resource and ``/api/<resource>/<key>/`` returns
+one object of it. Query parameters:
+
+* ``fields=title,slug`` returns only those fields of the resource, and
+  ``fields[<relation>]=name`` only those of an included relation. Only the
+  columns the requested fields need are loaded.
+* ``include=category,actors`` embeds related objects, one level deep.
+  To-one relations are joined with ``select_related`` and each to-many
+  relation is loaded with one ``prefetch_related`` query, so a page costs
+  one query plus one per to-many include however many objects it holds.
+* ``cursor`` and ``limit`` page through lists on a unique sort key (see
+  ``movies.pagination``); the ``links`` of a page hold ready-made URLs.
+* Lists of titles and episodes can be narrowed with ``category=<slug>`` or
+  ``series=<slug>``.
+
+Successful responses carry a strong ETag computed from the body, so clients
+revalidate with ``If-None-Match`` and get an empty 304 when nothing changed.
+"""
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, set_response_etag
+from django.views.decorators.http import require_GET
+
+from .models import Movie, Series, Episode, Category, Actor, Director
+from .pagination import DEFAULT_ORDERING, paginate
+
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Field:
+    """An API field computed by ``value(obj)`` from the model ``columns``"""
+
+    def __init__(self, columns, value):
+        self.columns = columns
+        self.value = value
+
+
+def column(name):
+    return Field((name,), lambda obj: getattr(obj, name))
+
+
+def file_url(name):
+    return Field((name,), lambda obj: getattr(obj, name).url if getattr(obj, name) else None)
+
+
+def page_url(*columns):
+    return Field(columns, lambda obj: obj.get_absolute_url())
+
+
+AVERAGE_RATING = Field(('rating_sum', 'rating_count'), lambda obj: obj.average_rating)
+
+
+class Relation:
+    """A relation that ``include=`` can embed"""
+
+    def __init__(self, resource, many=False, remote_field=None, ordering=None):
+        self.resource = resource
+        self.many = many
+        # Reverse foreign keys need the remote column to attach prefetched rows
+        self.remote_field = remote_field
+        self.ordering = ordering
+
+
+class Resource:
+    def __init__(self, model, fields, relations=None, queryset=None, lookup='pk',
+                 ordering=('id',), filters=None):
+        self.model = model
+        self.fields = fields
+        self.relations = relations or {}
+        self.queryset = queryset if queryset is not None else model.objects.all()
+        self.lookup = lookup
+        self.ordering = ordering
+        self.filters = filters or {}
+
+    def columns(self, fields):
+        """Model columns needed to compute ``fields``"""
+        columns = {self.model._meta.pk.name}
+        if self.lookup != 'pk':
+            columns.add(self.lookup)
+        for name in fields:
+            columns.update(self.fields[name].columns)
+        return columns
+
+
+PERSON_FIELDS = {
+    'id': column('id'),
+    'name': column('name'),
+    'bio': column('bio'),
+    'birth_date': column('birth_date'),
+    'image': file_url('image'),
+}
+
+TITLE_FIELDS = {
+    'id': column('id'),
+    'slug': column('slug'),
+    'title': column('title'),
+    'description': column('description'),
+    'release_date': column('release_date'),
+    'poster': file_url('poster'),
+    'trailer_url': column('trailer_url'),
+    'average_rating': AVERAGE_RATING,
+    'rating_count': column('rating_count'),
+    'views_count': column('views_count'),
+    'created_at': column('created_at'),
+    'updated_at': column('updated_at'),
+    'url': page_url('slug'),
+}
+
+TITLE_RELATIONS = {
+    'category': Relation('categories'),
+    'director': Relation('directors'),
+    'actors': Relation('actors', many=True),
+}
+
+RESOURCES = {
+    'movies': Resource(
+        Movie,
+        {**TITLE_FIELDS, 'duration': column('duration')},
+        TITLE_RELATIONS,
+        queryset=Movie.objects.filter(status='published'),
+        lookup='slug',
+        ordering=DEFAULT_ORDERING,
+        filters={'category': 'category__slug'},
+    ),
+    'series': Resource(
+        Series,
+        {**TITLE_FIELDS, 'seasons_count': column('seasons_count')},
+        {
+            **TITLE_RELATIONS,
+            'episodes': Relation('episodes', many=True, remote_field='series', ordering=('episode_number',)),
+        },
+        queryset=Series.objects.filter(status='published'),
+        lookup='slug',
+        ordering=DEFAULT_ORDERING,
+        filters={'category': 'category__slug'},
+    ),
+    'episodes': Resource(
+        Episode,
+        {
+            'id': column('id'),
+            'slug': column('slug'),
+            'title': column('title'),
+            'description': column('description'),
+            'season_number': Field(('season__number',), lambda obj: obj.season_number()),
+            'episode_number': column('episode_number'),
+            'duration': column('duration'),
+            'release_date': column('release_date'),
+            'average_rating': AVERAGE_RATING,
+            'rating_count': column('rating_count'),
+            'views_count': column('views_count'),
+            'created_at': column('created_at'),
+            'updated_at': column('updated_at'),
+            'url': page_url('episode_number', 'series__slug'),
+        },
+        {'series': Relation('series')},
+        queryset=Episode.objects.filter(series__status='published'),
+        lookup='slug',
+        filters={'series': 'series__slug'},
+    ),
+    'categories': Resource(
+        Category,
+        {
+            'id': column('id'),
+            'slug': column('slug'),
+            'name': column('name'),
+            'description': column('description'),
+            'url': page_url('slug'),
+        },
+        lookup='slug',
+        ordering=('name', 'id'),
+    ),
+    'actors': Resource(Actor, PERSON_FIELDS, ordering=('name', 'id')),
+    'directors': Resource(Director, PERSON_FIELDS, ordering=('name', 'id')),
+}
+
+
+def parse_names(value, allowed, what):
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ApiError(f"Unknown {what}: {', '.join(unknown)}")
+    return names
+
+
+def parse_query(resource, params):
+    """``(fields, includes, fields of each include)`` requested in ``params``"""
+    fields = list(resource.fields)
+    if 'fields' in params:
+        fields = parse_names(params['fields'], resource.fields, 'fields')
+
+    includes = []
+    if 'include' in params:
+        includes = parse_names(params['include'], resource.relations, 'includes')
+
+    included_fields = {}
+    for name in includes:
+        target = RESOURCES[resource.relations[name].resource]
+        key = f'fields[{name}]'
+        included_fields[name] = (
+            parse_names(params[key], target.fields, f'fields of {name}') if key in params else list(target.fields)
+        )
+    for key in params:
+        if key.startswith('fields[') and key[7:-1] not in includes:
+            raise ApiError(f'{key} given without include={key[7:-1]}')
+    return fields, includes, included_fields
+
+
+def load_only(queryset, columns):
+    """Load just ``columns``, joining the models of ``relation__column`` ones"""
+    joins = {column.split('__')[0] for column in columns if '__' in column}
+    return queryset.select_related(*joins).only(*columns, *joins)
+
+
+def build_queryset(resource, fields, includes, included_fields):
+    """The resource's queryset loading just what the response needs"""
+    columns = resource.columns(fields) | {field.lstrip('-') for field in resource.ordering}
+    prefetches = []
+    for name in includes:
+        relation = resource.relations[name]
+        target = RESOURCES[relation.resource]
+        target_columns = target.columns(included_fields[name])
+        if relation.many:
+            if relation.remote_field:
+                target_columns.add(relation.remote_field)
+            queryset = load_only(target.model.objects.all(), target_columns)
+            if relation.ordering:
+                queryset = queryset.order_by(*relation.ordering)
+            prefetches.append(Prefetch(name, queryset=queryset))
+        else:
+            columns.update(f'{name}__{column}' for column in target_columns)
+    return load_only(resource.queryset, columns).prefetch_related(*prefetches)
+
+
+def serialize(resource, obj, fields, includes=(), included_fields=None):
+    data = {name: resource.fields[name].value(obj) for name in fields}
+    for name in includes:
+        relation = resource.relations[name]
+        target = RESOURCES[relation.resource]
+        if relation.many:
+            data[name] = [serialize(target, related, included_fields[name]) for related in getattr(obj, name).all()]
+        else:
+            related = getattr(obj, name)
+            data[name] = serialize(target, related, included_fields[name]) if related is not None else None
+    return data
+
+
+def json_response(request, payload, status=200):
+    response = JsonResponse(payload, status=status, json_dumps_params={'separators': (',', ':')})
+    if status != 200:
+        return response
+    # Strong ETag from the body; a matching If-None-Match gets a 304
+    set_response_etag(response)
+    patch_cache_control(response, no_cache=True)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
+
+
+def get_resource(name):
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise ApiError(f'Unknown resource {name!r}, use one of: {", ".join(RESOURCES)}', status=404)
+
+
+def api_view(view):
+    """Turn ApiError into a JSON error response"""
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as e:
+            return json_response(request, {'error': str(e)}, status=e.status)
+    wrapper.__name__ = view.__name__
+    wrapper.__doc__ = view.__doc__
+    return wrapper
+
+
+@require_GET
+@api_view
+def resource_list(request, resource):
+    """One page of a catalog resource"""
+    resource = get_resource(resource)
+    fields, includes, included_fields = parse_query(resource, request.GET)
+
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit must be a number')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f'limit must be between 1 and {MAX_LIMIT}')
+
+    queryset = build_queryset(resource, fields, includes, included_fields)
+    for param, lookup in resource.filters.items():
+        if request.GET.get(param):
+            queryset = queryset.filter(**{lookup: request.GET[param]})
+
+    page = paginate(queryset, request.GET.get('cursor'), limit, resource.ordering)
+
+    def link(cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return f'{request.path}?{params.urlencode()}'
+
+    return json_response(request, {
+        'data': [serialize(resource, obj, fields, includes, included_fields) for obj in page],
+        'links': {'next': link(page.next_cursor), 'previous': link(page.previous_cursor)},
+    })
+
+
+@require_GET
+@api_view
+def resource_detail(request, resource, key):
+    """One object of a catalog resource, by slug (or id where there is none)"""
+    resource = get_resource(resource)
+    fields, includes, included_fields = parse_query(resource, request.GET)
+    queryset = build_queryset(resource, fields, includes, included_fields)
+    if resource.lookup == 'pk' and not key.isdigit():
+        raise ApiError('Not found', status=404)
+    obj = queryset.filter(**{resource.lookup: key}).first()
+    if obj is None:
+        raise ApiError('Not found', status=404)
+    return json_response(request, {'data': serialize(resource, obj, fields, includes, included_fields)})
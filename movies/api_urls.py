@@ -0,0 +1,9 @@
+from django.urls import path
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('<slug:resource>/', api.resource_list, name='list'),
+    path('<slug:resource>/<str:key>/', api.resource_detail, name='detail'),
+]
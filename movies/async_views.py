@@ -0,0 +1,173 @@
+"""
+Async versions of the detail pages, for deployments served over ASGI.
+
+A sync view runs its queries one after another. These views look the title
+up first, then run the queries that only depend on it concurrently, each in
+a worker thread with its own database connection. Data that is only shown
+inside a cached fragment is loaded only when that fragment is missing, so
+warm pages stay as cheap as their sync versions. ``ASYNC_VIEWS`` switches
+``movies.urls`` and the home page over to these views; leave it off under
+WSGI, where each async view would get an event loop of its own.
+
+Every worker thread keeps a database connection of its own, so give the
+databases a ``CONN_MAX_AGE`` (the settings do when ``ASYNC_VIEWS`` is on);
+with the default of 0 each batch of queries opens a new connection.
+"""
+import asyncio
+from contextlib import nullcontext
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.db.models import prefetch_related_objects
+from django.shortcuts import render, get_object_or_404
+
+from .ads import get_active_ads
+from .conditional import detail_validators, not_modified, set_validators
+from .fragments import fragment_context, missing_fragments
+from .models import Movie, Series, Episode
+from .recommendations import related_movies_for, related_series_for
+from .seasons import episode_window, season_context
+from .view_counter import record_view
+from moviewebsite.middleware import current_stats
+from user_interactions.models import Rating, Review
+
+
+def in_thread(func, *args, **kwargs):
+    """Run ``func`` in a worker thread of its own, so calls can overlap"""
+    # The request's instrumentation only wraps the connections of its own thread
+    stats = current_stats()
+
+    def run():
+        try:
+            with stats.instrument() if stats is not None else nullcontext():
+                return func(*args, **kwargs)
+        finally:
+            # Worker threads never see request_finished, honour CONN_MAX_AGE here
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)()
+
+
+def _user_rating(user, obj):
+    if not user.is_authenticated:
+        return None
+    return Rating.objects.filter(user=user, **{obj._meta.model_name: obj}).first()
+
+
+def _reviews(obj):
+    return list(
+        Review.objects.filter(**{obj._meta.model_name: obj}).select_related('user').order_by('-created_at')
+    )
+
+
+def _cached_fragments(objects, names):
+    context = fragment_context(*objects)
+    return context, missing_fragments(names, objects[0], context['fragment_version'])
+
+
+async def detail_page(request, template_name, obj, fragments, versioned=None, extra_context=None, loaders=()):
+    """Render the detail page of ``obj``.
+
+    ``fragments`` maps the names of the page's cached fragments to the
+    context variable they read and a loader for it. Loaders of missing
+    fragments run concurrently; the others are passed as they are, so a
+    fragment expiring just before rendering still gets its data lazily.
+    A ``None`` variable means the loader only warms ``obj`` (prefetching).
+    ``loaders`` return context for uncached parts of the page and run along
+    with the fragment loaders.
+    Anonymous visitors whose copy is current get a 304 before any loader
+    runs (see ``movies.conditional``).
+    """
+    request.user = await request.auser()  # so templates don't load the user again
+    versioned = versioned or (obj,)
+    (fragment_vars, missing), user_rating, advertisements, _ = await asyncio.gather(
+        in_thread(_cached_fragments, versioned, list(fragments)),
+        in_thread(_user_rating, request.user, obj),
+        in_thread(get_active_ads),
+        in_thread(record_view, obj),
+    )
+    validators = await in_thread(
+        detail_validators, request, obj, fragment_vars['fragment_version'], *versioned[1:]
+    )
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+
+    context = {
+        'user_rating': user_rating,
+        # Average rating is stored on the content itself
+        'avg_rating': obj.average_rating,
+        'advertisements': advertisements,
+        **fragment_vars,
+    }
+    for name, loader in fragments.values():
+        if name:
+            context[name] = loader
+
+    names = [fragment for fragment in fragments if fragment in missing]
+    loaded = await asyncio.gather(
+        *(in_thread(fragments[fragment][1]) for fragment in names),
+        *(in_thread(loader) for loader in loaders),
+    )
+    for fragment, value in zip(names, loaded):
+        name = fragments[fragment][0]
+        if name:
+            context[name] = value
+    for value in loaded[len(names):]:
+        context.update(value)
+    context.update(extra_context or {})
+    # Fragment loaders left to the template run while it renders
+    response = await in_thread(render, request, template_name, context)
+    return set_validators(response, validators)
+
+
+async def movie_detail(request, slug):
+    """Display details for a specific movie"""
+    movie = await in_thread(
+        get_object_or_404,
+        Movie.objects.select_related('category', 'director'),
+        slug=slug,
+        status='published'
+    )
+    return await detail_page(request, 'movies/detail.html', movie, {
+        'movie_body': (None, partial(prefetch_related_objects, [movie], 'actors')),
+        'movie_reviews': ('reviews', partial(_reviews, movie)),
+        'movie_related': ('related_movies', partial(related_movies_for, movie)),
+    }, extra_context={'movie': movie})
+
+
+async def series_detail(request, slug):
+    """Display details for a specific series"""
+    series = await in_thread(
+        get_object_or_404,
+        Series.objects.select_related('category', 'director'),
+        slug=slug,
+        status='published'
+    )
+    return await detail_page(request, 'movies/series_detail.html', series, {
+        'series_body': (None, partial(prefetch_related_objects, [series], 'actors')),
+        'series_reviews': ('reviews', partial(_reviews, series)),
+        'series_related': ('related_series', partial(related_series_for, series)),
+    }, extra_context={'series': series}, loaders=[
+        partial(season_context, series, request.GET.get('season'), request.GET.get('cursor')),
+    ])
+
+
+async def episode_detail(request, series_slug, episode_number):
+    """Display details for a specific episode"""
+    # The series comes along in the same query
+    episode = await in_thread(
+        get_object_or_404,
+        Episode.objects.select_related('series', 'season'),
+        series__slug=series_slug,
+        series__status='published',
+        episode_number=episode_number
+    )
+    series = episode.series
+    return await detail_page(request, 'movies/episode_detail.html', episode, {
+        'episode_reviews': ('reviews', partial(_reviews, episode)),
+        'episode_list': (
+            'other_episodes',
+            partial(episode_window, series, episode),
+        ),
+    }, versioned=(episode, series), extra_context={'series': series, 'episode': episode})
@@ -0,0 +1,229 @@
+"""
+Typeahead suggestions for the search box.
+
+Published movie and series titles and actor and director names are held in
+memory as two parallel sorted arrays: every normalized token (lower case,
+accents stripped) and the entry it belongs to. A query keeps the entries
+having a token that starts with each of its words, the last one possibly
+typed halfway, found by bisecting the arrays for the longest word, so
+answering costs no query and grows with the number of matches, not with
+the catalog.
+
+Matches are ranked by popularity: a title weighs its views, a person the
+views of the published titles they appear in or direct. Names starting with
+the query come before names that only contain a word starting with it.
+
+The index is built in a background thread (``movies.rebuilding``) started
+when the worker serves its first request, so it is usually ready before
+anybody types; suggestions asked for earlier get none. Saves and deletions
+update it in place (see ``movies.signals``), and are replayed onto an index
+being built in case it read them too early. Weights are
+refreshed, and edits made by other workers or bulk imports picked up, by
+rebuilding it every ``AUTOCOMPLETE_MAX_AGE`` seconds and after an import;
+suggestions keep coming from the previous index until the new one is ready.
+"""
+import heapq
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import Q, Sum
+from django.urls import reverse
+
+from .models import Movie, Series, Actor, Director
+from .rebuilding import BackgroundIndex
+from .search import TOKEN_RE
+
+
+Entry = namedtuple('Entry', ['kind', 'label', 'url', 'weight', 'tokens', 'normalized'])
+
+KINDS = {Movie: 'movie', Series: 'series', Actor: 'actor', Director: 'director'}
+
+
+def normalize(text):
+    """Lower case ``text`` without accents"""
+    decomposed = unicodedata.normalize('NFKD', (text or '').lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def words(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def person_url(kind, pk):
+    return f"{reverse('movies:movies_list')}?{kind}={pk}"
+
+
+def make_entry(kind, label, url, weight):
+    label_words = words(label)
+    return Entry(kind, label, url, weight or 0, frozenset(label_words), ' '.join(label_words))
+
+
+def title_entry(obj):
+    return make_entry(KINDS[type(obj)], obj.title, obj.get_absolute_url(), obj.views_count)
+
+
+def person_entry(kind, pk, name, weight):
+    return make_entry(kind, name, person_url(kind, pk), weight)
+
+
+def person_weights(model, pks=None):
+    """``{pk: views}`` of the published titles each person appears in or directs"""
+    people = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    weights = {}
+    # One query per relation, as joining both would multiply the rows
+    for relation in ('movie', 'series'):
+        rows = people.annotate(
+            views=Sum(f'{relation}__views_count', filter=Q(**{f'{relation}__status': 'published'}))
+        ).values_list('pk', 'views')
+        for pk, views in rows:
+            weights[pk] = weights.get(pk, 0) + (views or 0)
+    return weights
+
+
+def load_entries():
+    """``{(kind, pk): Entry}`` of everything suggested"""
+    entries = {}
+    for model in (Movie, Series):
+        for obj in model.objects.filter(status='published').only('pk', 'title', 'slug', 'views_count'):
+            entries[KINDS[model], obj.pk] = title_entry(obj)
+    for model in (Actor, Director):
+        weights = person_weights(model)
+        for pk, name in model.objects.values_list('pk', 'name'):
+            entries[KINDS[model], pk] = person_entry(KINDS[model], pk, name, weights.get(pk))
+    return entries
+
+
+class PrefixIndex:
+    """Entries and the sorted token arrays pointing at them"""
+
+    def __init__(self, entries):
+        self.entries = dict(entries)
+        pairs = sorted((token, key) for key, entry in self.entries.items() for token in entry.tokens)
+        self.tokens = [token for token, _ in pairs]
+        self.owners = [key for _, key in pairs]
+
+    def _positions(self, token, key):
+        start = bisect_left(self.tokens, token)
+        end = bisect_right(self.tokens, token, lo=start)
+        return [index for index in range(start, end) if self.owners[index] == key]
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for token in entry.tokens:
+            for index in reversed(self._positions(token, key)):
+                del self.tokens[index]
+                del self.owners[index]
+
+    def add(self, key, entry):
+        self.remove(key)
+        self.entries[key] = entry
+        for token in entry.tokens:
+            index = bisect_right(self.tokens, token)
+            self.tokens.insert(index, token)
+            self.owners.insert(index, key)
+
+    def prefixed(self, prefix):
+        """Keys of the entries having a token that starts with ``prefix``"""
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + '\U0010ffff', lo=start)
+        return set(self.owners[start:end])
+
+    def suggest(self, query, limit):
+        terms = words(query)
+        if not terms:
+            return []
+        # The longest word narrows the candidates most, the others filter them
+        longest = max(terms, key=len)
+        others = [term for term in terms if term != longest]
+        normalized = ' '.join(terms)
+        matches = []
+        for key in self.prefixed(longest):
+            entry = self.entries[key]
+            if others and not all(any(token.startswith(term) for token in entry.tokens) for term in others):
+                continue
+            matches.append((entry.normalized.startswith(normalized), entry.weight, -len(entry.label), key))
+        return [self.entries[match[3]] for match in heapq.nlargest(limit, matches)]
+
+
+class Autocomplete(BackgroundIndex):
+    """The prefix index of this worker, rebuilt in the background when too old"""
+
+    def __init__(self):
+        super().__init__()
+        # Edits made while a build is in flight, which it may have read too early
+        self._updates = None
+
+    def build(self):
+        return PrefixIndex(load_entries())
+
+    def max_age(self):
+        return getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 600)
+
+    def starting(self):
+        self._updates = []
+
+    def ready(self, index):
+        for key, entry in self._updates:
+            self._apply(index, key, entry)
+        self._updates = None
+        return index
+
+    def built(self):
+        """Whether there is an index, or one being built, to keep up to date"""
+        return self._index is not None or self._updates is not None
+
+    def suggest(self, query, limit):
+        index = self.get()
+        if index is None:
+            return []  # until the first build is ready
+        with self._lock:
+            return index.suggest(query, limit)
+
+    def _apply(self, index, key, entry):
+        if entry is None:
+            index.remove(key)
+        else:
+            index.add(key, entry)
+
+    def update(self, key, entry):
+        """Add, replace or (``entry`` being None) drop one entry of a built index"""
+        with self._lock:
+            if self._updates is not None:
+                self._updates.append((key, entry))
+            if self._index is not None:
+                self._apply(self._index, key, entry)
+
+
+autocomplete = Autocomplete()
+
+
+def suggest(query, limit=None):
+    """The best ``limit`` entries matching ``query`` as it is being typed"""
+    if len(normalize(query).strip()) < getattr(settings, 'AUTOCOMPLETE_MIN_LENGTH', 2):
+        return []
+    return autocomplete.suggest(query, limit or getattr(settings, 'AUTOCOMPLETE_LIMIT', 8))
+
+
+def refresh_title(model, obj):
+    """Show a saved movie or series, or hide it when unpublished"""
+    key = (KINDS[model], obj.pk)
+    autocomplete.update(key, title_entry(obj) if obj.status == 'published' else None)
+
+
+def refresh_person(model, obj):
+    if not autocomplete.built():
+        return
+    weight = person_weights(model, [obj.pk]).get(obj.pk)
+    autocomplete.update((KINDS[model], obj.pk), person_entry(KINDS[model], obj.pk, obj.name, weight))
+
+
+def remove(model, pk):
+    autocomplete.update((KINDS[model], pk), None)
+
+
+def invalidate_autocomplete():
+    autocomplete.invalidate()
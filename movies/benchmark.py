@@ -0,0 +1,133 @@
+"""
+Latency benchmark of the sync and async home and detail views.
+
+The sync path goes through the WSGI handler with one thread per concurrent
+client, as a threaded WSGI server would; the async path goes through the
+ASGI handler with one task per client on a single event loop. A local
+SQLite database answers in microseconds, which hides what running queries
+concurrently buys, so :func:`add_query_latency` can make every query wait
+as if the database were across the network.
+"""
+import asyncio
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches
+
+from .models import Movie, Series, Episode
+
+
+def default_urls():
+    """Home page plus the newest published movie, series and episode"""
+    urls = ['/']
+    published = {'status': 'published'}
+    for obj in (
+        Movie.objects.filter(**published).order_by('-created_at').first(),
+        Series.objects.filter(**published).order_by('-created_at').first(),
+        Episode.objects.filter(series__status='published').select_related('series').order_by('-id').first(),
+    ):
+        if obj is not None:
+            urls.append(obj.get_absolute_url())
+    return urls
+
+
+def add_query_latency(seconds):
+    """Delay every query on every connection, including ones opened later"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(install, weak=False)
+    for connection in connections.all():
+        install(connection)
+
+
+def use_async_views(enabled):
+    """Rebuild the URL configuration with or without ``ASYNC_VIEWS``"""
+    with override_settings(ASYNC_VIEWS=enabled):
+        importlib.reload(importlib.import_module('movies.urls'))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+def _check(url, response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{url} returned {response.status_code}')
+
+
+def run_sync(url, requests, concurrency, cold=False):
+    """Latencies in seconds of ``requests`` GETs of ``url`` through WSGI"""
+    local = threading.local()
+
+    def get(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+        if cold:
+            cache.clear()
+        started = time.perf_counter()
+        response = local.client.get(url)
+        elapsed = time.perf_counter() - started
+        _check(url, response)
+        return elapsed
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(get, range(requests)))
+
+
+def run_async(url, requests, concurrency, cold=False):
+    """Latencies in seconds of ``requests`` GETs of ``url`` through ASGI"""
+    async def main():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def get():
+            async with slots:
+                if cold:
+                    cache.clear()
+                started = time.perf_counter()
+                response = await client.get(url)
+                elapsed = time.perf_counter() - started
+                _check(url, response)
+                return elapsed
+
+        return await asyncio.gather(*(get() for _ in range(requests)))
+
+    return asyncio.run(main())
+
+
+def summarize(latencies, wall_time):
+    """Percentiles in milliseconds plus throughput"""
+    values = sorted(latencies)
+
+    def percentile(p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    return {
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': values[-1] * 1000,
+        'rps': len(values) / wall_time,
+    }
+
+
+def benchmark(url, mode, requests, concurrency, cold=False, warmup=5):
+    """Summary of ``requests`` GETs of ``url`` through the ``'sync'`` or ``'async'`` path"""
+    run = run_async if mode == 'async' else run_sync
+    # The test clients send Host: testserver
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        run(url, warmup, 1)
+        started = time.perf_counter()
+        latencies = run(url, requests, concurrency, cold)
+    return summarize(latencies, time.perf_counter() - started)
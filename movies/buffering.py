@@ -0,0 +1,138 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# Every buffer of the process, in creation order
+_buffers = []
+
+
+class FlushingBuffer:
+    """Thread-safe in-process write buffer that is drained in batches.
+
+    Subclasses decide how a new item is merged into the pending batch and how
+    a drained batch is written. The buffer flushes itself when it is older than
+    ``flush_interval`` seconds or holds more than ``max_pending`` keys, which
+    bounds both write frequency and how much data a crash can lose. A daemon
+    thread, started by the first ``add()``, flushes a buffer that stopped
+    receiving anything; ``WRITE_BUFFER_BACKGROUND_FLUSH = False`` leaves
+    flushing to requests and process exit.
+    """
+
+    def __init__(self, flush_interval=10, max_pending=1000):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._timer = None
+        _buffers.append(self)
+
+    def merge(self, pending, key, value):
+        """Fold ``value`` into the pending batch under ``key``"""
+        raise NotImplementedError
+
+    def write(self, batch):
+        """Persist a drained batch"""
+        raise NotImplementedError
+
+    def requeue(self, pending, batch):
+        """Put a batch that failed to write back into the pending batch"""
+        for key, value in batch.items():
+            self.merge(pending, key, value)
+
+    def add(self, key, value):
+        """Buffer a value, flushing if the buffer is due"""
+        with self._lock:
+            self.merge(self._pending, key, value)
+            due = (
+                len(self._pending) >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+            self._start_timer()
+        if due:
+            self.flush()
+
+    def _start_timer(self):
+        """Start the flushing thread unless it runs already; call with the lock held"""
+        if not getattr(settings, 'WRITE_BUFFER_BACKGROUND_FLUSH', True):
+            return
+        # A forked worker inherits the thread object but not the thread
+        if self._timer is None or not self._timer.is_alive():
+            self._timer = threading.Thread(target=self._run, name=f'{type(self).__name__}-flush', daemon=True)
+            self._timer.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                wait = self._last_flush + self.flush_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            try:
+                self.flush()
+            finally:
+                # The thread's own connections, not those of any request
+                connections.close_all()
+            # Still due if another thread was flushing; let it finish
+            time.sleep(min(self.flush_interval, 1))
+
+    def pending(self):
+        """Return a copy of the batch that has not been written yet"""
+        with self._lock:
+            return dict(self._pending)
+
+    def discard(self):
+        """Drop everything buffered so far without writing it"""
+        with self._lock:
+            self._pending = {}
+
+    def flush(self):
+        """Write everything buffered so far"""
+        # Only one thread writes at a time; others keep buffering meanwhile.
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._last_flush = time.monotonic()
+            if not batch:
+                return
+            try:
+                self.write(batch)
+            except Exception:
+                logger.exception('Failed to flush %s, re-queueing %d keys', type(self).__name__, len(batch))
+                with self._lock:
+                    self.requeue(self._pending, batch)
+        finally:
+            self._flush_lock.release()
+
+
+def flush_all(passes=3):
+    """Write what every buffer holds.
+
+    Writing one buffer can feed another (flushed views are trending events),
+    so buffers are flushed again until all are empty, at most ``passes``
+    times in case a write keeps failing.
+    """
+    for _ in range(passes):
+        for buffer in list(_buffers):
+            buffer.flush()
+        if not any(buffer.pending() for buffer in _buffers):
+            return
+
+
+def discard_all():
+    """Drop what every buffer holds, for tests"""
+    for buffer in _buffers:
+        buffer.discard()
+
+
+atexit.register(flush_all)
@@ -0,0 +1,115 @@
+"""
+Conditional GET for the catalog pages.
+
+Every anonymous visitor gets the same HTML for a detail or category page, so
+those responses carry an ETag, and a browser or CDN revalidating its copy
+gets an empty 304 without the page being rendered. The ETag is a hash of
+data that is at hand or cheap to read:
+
+* the title's ``updated_at`` and stored rating totals (rating changes do not
+  touch ``updated_at``), or on a category page the latest ``updated_at``,
+  number and rating totals of its titles,
+* the time of its latest review, with the number of reviews so that
+  deletions count too,
+* the fragment versions of the page (``movies.fragments``), which are bumped
+  when episodes, cast, reviews or related titles change,
+* the version of the live ads (``movies.ads``),
+* ``PAGE_ETAG_RELEASE``, to be changed on deploy so template edits show up.
+
+No Last-Modified date is sent: ratings, fragment bumps and ads ending change
+the page without a time to show for it, and a client revalidating with
+If-Modified-Since alone would be told its stale copy is current.
+
+Logged-in users see their own rating, forms and CSRF tokens, and a page with
+pending messages shows them, so those requests always get a full response.
+"""
+import hashlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, F, Max, Sum
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .ads import resolver
+from .models import Movie, Series
+from user_interactions.models import Review
+
+
+Validators = namedtuple('Validators', ['etag'])
+
+
+def is_shared_page(request):
+    """Whether ``request`` gets the page every anonymous visitor gets"""
+    return not request.user.is_authenticated and not len(messages.get_messages(request))
+
+
+def conditional_page(request):
+    return getattr(settings, 'CONDITIONAL_PAGES', True) and is_shared_page(request)
+
+
+def page_validators(*parts):
+    """Validators of a page built from ``parts``"""
+    digest = hashlib.md5(usedforsecurity=False)
+    digest.update(repr((getattr(settings, 'PAGE_ETAG_RELEASE', ''), resolver.version(), parts)).encode())
+    return Validators(f'"{digest.hexdigest()}"')
+
+
+def detail_validators(request, obj, fragment_version, *shown):
+    """Validators of the detail page of ``obj``, also showing the titles ``shown``; None for personal pages"""
+    if not conditional_page(request):
+        return None
+    reviews = Review.objects.filter(**{obj._meta.model_name: obj}).aggregate(
+        latest=Max('updated_at'), count=Count('id')
+    )
+    titles = (obj, *shown)
+    return page_validators(
+        [(title._meta.label, title.pk, title.updated_at, title.rating_sum, title.rating_count) for title in titles],
+        reviews['latest'],
+        reviews['count'],
+        fragment_version,
+    )
+
+
+def category_validators(request, category, trending=()):
+    """Validators of a category page showing the ``trending`` titles; None for personal pages"""
+    if not conditional_page(request):
+        return None
+    totals = [
+        model.objects.filter(category=category, status='published').aggregate(
+            latest=Max('updated_at'),
+            count=Count('id'),
+            # The cards show each title's average rating
+            ratings=Sum('rating_sum'),
+            raters=Sum('rating_count'),
+            # Weighted per title, so ratings moving between titles show too
+            checksum=Sum(F('rating_sum') * F('id') + F('rating_count')),
+        )
+        for model in (Movie, Series)
+    ]
+    return page_validators(
+        category.pk,
+        category.name,
+        category.description,
+        [sorted(total.items()) for total in totals],
+        [(title._meta.label, title.pk) for title in trending],
+    )
+
+
+def not_modified(request, validators):
+    """A 304 response when the client's copy is still current, else None"""
+    if validators is None:
+        return None
+    response = get_conditional_response(request, etag=validators.etag)
+    if response is not None:
+        set_validators(response, validators)
+    return response
+
+
+def set_validators(response, validators):
+    """Send ``validators`` with ``response``, which caches must revalidate"""
+    if validators is None:
+        return response
+    response.headers.setdefault('ETag', validators.etag)
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -1,12 +1,9 @@
-from .models import Advertisement
-from django.utils import timezone
+from .ads import get_active_ads, get_active_ads_by_type
 
 
 def ads_processor(request):
     """Context processor to add active advertisements to all templates"""
-    active_ads = Advertisement.objects.filter(
-        is_active=True,
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    )
-    return {'active_ads': active_ads}
\ No newline at end of file
+    return {
+        'active_ads': get_active_ads(),
+        'active_ads_by_type': get_active_ads_by_type(),
+    }
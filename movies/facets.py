@@ -0,0 +1,361 @@
+"""
+Faceted browsing of the movie list.
+
+The movie list filters by genre, year, decade, duration, rating, director
+and cast, several values of a facet meaning any of them, and shows next to
+every value how many movies picking it would leave. Those counts come from
+an in-memory index of the published movies rather than from the database:
+each movie has a position, newest first, and each facet value the set of
+positions it covers, held as a Python integer used as a bitset. Filtering
+is a few ANDs and ORs of bitsets and every count a ``bit_count()``, so a
+page costs the same however many filters are combined. The count of a
+value applies every picked facet but its own.
+
+Directors and actors have too many values for a bitset each; only the
+``FACET_PEOPLE_LIMIT`` with most movies, and people picked in the request,
+get one, built from their list of positions.
+
+The first build starts in a background thread (``movies.rebuilding``)
+when the worker serves its first request; a request needing the index
+before it is ready waits for it. It is rebuilt in the background
+when a movie, its cast, a genre or a person is edited (see
+``movies.signals``) or a feed is imported. Rating and view changes do not
+invalidate it, so each worker also rebuilds it every ``FACET_INDEX_MAX_AGE``
+seconds. Requests use the previous index until the new one is ready, and
+matching movies are loaded from the database by primary key and still
+filtered on being published.
+"""
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Category, Director, Actor, Movie
+from .pagination import DEFAULT_ORDERING
+from .rebuilding import BackgroundIndex
+
+
+DURATIONS = [
+    # (value, label, minutes from, minutes to)
+    ('short', 'Under 90 min', 0, 90),
+    ('standard', '90 min to 2 hours', 90, 120),
+    ('long', '2 to 2.5 hours', 120, 150),
+    ('epic', 'Over 2.5 hours', 150, None),
+]
+
+RATINGS = [
+    ('4', '4 stars and up'),
+    ('3', '3 to 4 stars'),
+    ('2', '2 to 3 stars'),
+    ('1', '1 to 2 stars'),
+    ('unrated', 'Not rated yet'),
+]
+
+
+class Facet:
+    def __init__(self, name, label, sparse=False):
+        self.name = name
+        self.label = label
+        # One bitset per value only for the most common values
+        self.sparse = sparse
+
+
+FACETS = [
+    Facet('category', 'Genre'),
+    Facet('decade', 'Decade'),
+    Facet('year', 'Year'),
+    Facet('duration', 'Duration'),
+    Facet('rating', 'Rating'),
+    Facet('director', 'Director', sparse=True),
+    Facet('actor', 'Cast', sparse=True),
+]
+
+FACET_NAMES = [facet.name for facet in FACETS]
+
+PEOPLE = {'director': Director, 'actor': Actor}
+
+
+def duration_bucket(minutes):
+    for value, _, start, end in DURATIONS:
+        if end is None or minutes < end:
+            return value
+
+
+def rating_band(rating_sum, rating_count):
+    if not rating_count:
+        return 'unrated'
+    return str(max(1, min(int(rating_sum / rating_count), 4)))
+
+
+def to_bitset(positions, size):
+    """Integer with the bits at ``positions`` set"""
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def selected_facets(params):
+    """``{facet: [values]}`` picked in the query string ``params``"""
+    selected = {}
+    for name in FACET_NAMES:
+        values = [value for value in params.getlist(name) if value]
+        if values:
+            selected[name] = list(dict.fromkeys(values))
+    return selected
+
+
+class FacetIndex:
+    """Bitsets of the published movies, positioned newest first"""
+
+    def __init__(self):
+        rows = list(
+            Movie.objects.filter(status='published')
+            .order_by(*DEFAULT_ORDERING)
+            .values_list('pk', 'category_id', 'release_date', 'duration', 'director_id', 'rating_sum', 'rating_count')
+        )
+        self.ids = [row[0] for row in rows]
+        self.size = len(rows)
+        self.all = (1 << self.size) - 1
+        self.positions = {pk: position for position, pk in enumerate(self.ids)}
+
+        postings = {name: defaultdict(list) for name in FACET_NAMES}
+        averages = []
+        for position, (pk, category_id, released, duration, director_id, rating_sum, rating_count) in enumerate(rows):
+            postings['category'][str(category_id)].append(position)
+            postings['decade'][str(released.year // 10 * 10)].append(position)
+            postings['year'][str(released.year)].append(position)
+            postings['duration'][duration_bucket(duration)].append(position)
+            postings['rating'][rating_band(rating_sum, rating_count)].append(position)
+            if director_id:
+                postings['director'][str(director_id)].append(position)
+            averages.append(rating_sum / rating_count if rating_count else 0.0)
+        # Read in the order of the link table's unique index, which covers both columns
+        links = Movie.actors.through.objects.order_by('movie_id', 'actor_id').values_list('movie_id', 'actor_id')
+        for movie_id, actor_id in links:
+            position = self.positions.get(movie_id)
+            if position is not None:
+                postings['actor'][str(actor_id)].append(position)
+
+        # Best rated first, newest first among equals, unrated last
+        self.by_rating = sorted(range(self.size), key=lambda position: (-averages[position], position))
+
+        limit = getattr(settings, 'FACET_PEOPLE_LIMIT', 15)
+        self.postings = {}
+        self.bitsets = {}
+        self.shown = {}
+        for facet in FACETS:
+            values = postings[facet.name]
+            if facet.sparse:
+                self.postings[facet.name] = {value: tuple(positions) for value, positions in values.items()}
+                values = dict(sorted(values.items(), key=lambda item: -len(item[1]))[:limit])
+            self.bitsets[facet.name] = {value: to_bitset(positions, self.size) for value, positions in values.items()}
+            self.shown[facet.name] = list(values)
+
+        self._labels_lock = threading.Lock()
+        self.labels = {
+            'category': {str(pk): name for pk, name in Category.objects.values_list('pk', 'name')},
+            'duration': {value: label for value, label, _, _ in DURATIONS},
+            'rating': dict(RATINGS),
+        }
+        for name, model in PEOPLE.items():
+            self.labels[name] = {
+                str(pk): person for pk, person in model.objects.filter(pk__in=self.shown[name]).values_list('pk', 'name')
+            }
+        self.sort_values()
+
+    def sort_values(self):
+        """Order the values of each facet as the page lists them"""
+        self.shown['category'].sort(key=lambda value: self.labels['category'].get(value, ''))
+        self.shown['decade'].sort(key=int, reverse=True)
+        self.shown['year'].sort(key=int, reverse=True)
+        self.shown['duration'].sort(key=[value for value, _, _, _ in DURATIONS].index)
+        self.shown['rating'].sort(key=[value for value, _ in RATINGS].index)
+
+    def bitset(self, name, value):
+        found = self.bitsets[name].get(value)
+        if found is None:
+            found = to_bitset(self.postings.get(name, {}).get(value, ()), self.size)
+        return found
+
+    def label(self, name, value):
+        if name == 'decade':
+            return f'{value}s'
+        if name == 'year':
+            return value
+        labels = self.labels[name]
+        if value not in labels and name in PEOPLE and value.isdigit():
+            # Someone picked outside the most common people. Requests share
+            # the index, so the labels are replaced, never changed in place
+            found = {str(pk): person for pk, person in PEOPLE[name].objects.filter(pk=value).values_list('pk', 'name')}
+            with self._labels_lock:
+                labels = self.labels[name] = {**self.labels[name], **found}
+        return labels.get(value)
+
+    def browse(self, selected, restrict=None):
+        """Bitset of the movies matching ``selected`` and ``{facet: [(value, count)]}``"""
+        base = self.all if restrict is None else restrict
+        picked = {}
+        for name, values in selected.items():
+            mask = 0
+            for value in values:
+                mask |= self.bitset(name, value)
+            picked[name] = mask
+
+        matches = base
+        for mask in picked.values():
+            matches &= mask
+
+        counts = {}
+        for facet in FACETS:
+            others = base
+            for name, mask in picked.items():
+                if name != facet.name:
+                    others &= mask
+            values = self.shown[facet.name] + [
+                value for value in selected.get(facet.name, ()) if value not in self.shown[facet.name]
+            ]
+            counts[facet.name] = [(value, (others & self.bitset(facet.name, value)).bit_count()) for value in values]
+            if facet.sparse:
+                counts[facet.name].sort(key=lambda item: -item[1])
+        return matches, counts
+
+    def restriction(self, ids):
+        """Bitset of the movies ``ids``"""
+        return to_bitset([self.positions[pk] for pk in ids if pk in self.positions], self.size)
+
+
+class FacetResults:
+    """Movies of a bitset, loaded a slice at a time like ``movies.search.SearchResults``"""
+
+    def __init__(self, queryset, index, matches, order=None):
+        self.queryset = queryset
+        self.index = index
+        self.total = matches.bit_count()
+        # Bit i of ``matches`` is character i
+        self.bits = bin(matches)[:1:-1]
+        self.order = order
+
+    def __len__(self):
+        return self.total
+
+    def count(self):
+        return self.total
+
+    def _positions(self, stop):
+        bits = self.bits
+        positions = []
+        if self.order is None:
+            position = bits.find('1')
+            while position != -1 and len(positions) < stop:
+                positions.append(position)
+                position = bits.find('1', position + 1)
+        else:
+            for position in self.order:
+                if position < len(bits) and bits[position] == '1':
+                    positions.append(position)
+                    if len(positions) >= stop:
+                        break
+        return positions
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            stop = self.total if index.stop is None else index.stop
+            ids = [self.index.ids[position] for position in self._positions(stop)[index.start or 0:stop]]
+            objects = self.queryset.in_bulk(ids)
+            return [objects[pk] for pk in ids if pk in objects]
+        return self[index:index + 1][0]
+
+
+class Browse:
+    """Outcome of one faceted request"""
+
+    def __init__(self, index, selected, matches, counts, order):
+        self.index = index
+        self.selected = selected
+        self.matches = matches
+        self.counts = counts
+        self.order = order
+
+    def results(self, queryset):
+        return FacetResults(queryset, self.index, self.matches, self.order)
+
+    def facets(self, params):
+        """Facets and their values as the template lists them, with links picking or dropping each value"""
+        facets = []
+        for facet in FACETS:
+            picked = self.selected.get(facet.name, [])
+            values = []
+            for value, count in self.counts[facet.name]:
+                label = self.index.label(facet.name, value)
+                if label is None or not (count or value in picked):
+                    continue
+                values.append({
+                    'value': value,
+                    'label': label,
+                    'count': count,
+                    'selected': value in picked,
+                    'url': toggle_url(params, facet.name, value),
+                })
+            if values:
+                facets.append({'name': facet.name, 'label': facet.label, 'values': values})
+        return facets
+
+
+def toggle_url(params, name, value):
+    """Query string of ``params`` with ``value`` of ``name`` picked, or dropped if it was"""
+    params = params.copy()
+    params.pop('cursor', None)
+    values = params.getlist(name)
+    params.setlist(name, [other for other in values if other != value] if value in values else values + [value])
+    return f'?{params.urlencode()}'
+
+
+def clear_url(params):
+    """Query string of ``params`` without any facet"""
+    params = params.copy()
+    for name in ['cursor'] + FACET_NAMES:
+        params.pop(name, None)
+    return f'?{params.urlencode()}'
+
+
+class FacetIndexCache(BackgroundIndex):
+    """The facet index of this worker, rebuilt in the background when too old or invalidated"""
+
+    def build(self):
+        return FacetIndex()
+
+    def max_age(self):
+        return getattr(settings, 'FACET_INDEX_MAX_AGE', 300)
+
+    def get(self):
+        index = super().get()
+        if index is None:
+            # No previous index to serve: wait for the first one rather than filter nothing
+            self.wait()
+            index = self._index
+        if index is None:
+            self.rebuild()  # the background build failed; raise its error here
+            index = self._index
+        return index
+
+
+facet_index = FacetIndexCache()
+
+
+def browse_movies(selected, rating_order=False, search=None):
+    """Apply the facets ``selected`` to the published movies, or to the ``search`` results"""
+    index = facet_index.get()
+    restrict = order = None
+    if search is not None:
+        # Search results keep their relevance order
+        restrict = index.restriction(search.ids)
+        order = [index.positions[pk] for pk in search.ids if pk in index.positions]
+    elif rating_order:
+        order = index.by_rating
+    matches, counts = index.browse(selected, restrict)
+    return Browse(index, selected, matches, counts, order)
+
+
+def invalidate_facets():
+    facet_index.invalidate()
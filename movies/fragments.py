@@ -0,0 +1,66 @@
+"""
+Version tokens for cached template fragments.
+
+The catalog parts of the detail pages are wrapped in ``{% cache %}`` blocks
+keyed by ``fragment_version``, a token stored in the cache for every object
+plus one per model. Bumping a token (see ``movies.signals``) makes every
+fragment rendered with the old one unreachable, so nothing has to be
+deleted and entries simply age out after ``FRAGMENT_CACHE_TIMEOUT``. The
+tokens must live in a cache shared by all workers for bumps to reach them.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, cache, caches
+from django.core.cache.utils import make_template_fragment_key
+
+
+def _key(model, pk='*'):
+    return f'fragment-version:{model._meta.label_lower}:{pk}'
+
+
+def _token():
+    return uuid.uuid4().hex[:12]
+
+
+def object_version(obj):
+    """Current token for ``obj``, combined with its model-wide token"""
+    model = obj._meta.concrete_model
+    keys = [_key(model), _key(model, obj.pk)]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # add() keeps whichever token another worker stored first
+            cache.add(key, _token(), timeout=None)
+            found[key] = cache.get(key)
+    return '.'.join(found[key] or '' for key in keys)
+
+
+def fragment_context(*objects):
+    """Template variables for the ``{% cache %}`` blocks of a page showing ``objects``"""
+    return {
+        'fragment_timeout': getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 3600),
+        'fragment_version': '-'.join(object_version(obj) for obj in objects),
+    }
+
+
+def missing_fragments(names, obj, version):
+    """Which of the fragments ``names`` keyed by ``obj.pk`` and ``version`` are not cached"""
+    # Same lookup as the {% cache %} tag
+    try:
+        fragment_cache = caches['template_fragments']
+    except InvalidCacheBackendError:
+        fragment_cache = caches['default']
+    keys = {make_template_fragment_key(name, [obj.pk, version]): name for name in names}
+    found = fragment_cache.get_many(keys)
+    return {name for key, name in keys.items() if key not in found}
+
+
+def bump(model, pks):
+    """Invalidate the fragments of the given objects"""
+    cache.set_many({_key(model, pk): _token() for pk in pks}, timeout=None)
+
+
+def bump_all(model):
+    """Invalidate the fragments of every object of ``model``"""
+    cache.set(_key(model), _token(), timeout=None)
@@ -0,0 +1,117 @@
+"""
+Precomputed home page content.
+
+The home page shows the trending titles, the newest published movies and
+series and the first categories. HomeSnapshot keeps them in memory as plain
+dicts with the URLs and poster markup already resolved, so a visit runs no
+query and no per-poster storage check. Publishing, unpublishing or editing a
+featured title and editing a category drop the snapshot (see
+``movies.signals``) and the next request rebuilds it. Other worker processes
+pick the change up within ``HOME_SNAPSHOT_MAX_AGE`` seconds, which also
+bounds how old the trending list, the ratings on the page and the poster
+markup of freshly resized posters can get.
+
+Anonymous visitors all get the same page, so its rendered HTML is kept as
+well, for the current set of live ads.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .ads import resolver
+from .models import Movie, Series, Category
+from .templatetags.images import responsive_img
+from .trending import top_titles
+
+
+FEATURED_COUNT = 6
+CATEGORY_COUNT = 8
+
+
+def _title(obj):
+    return {
+        'title': obj.title,
+        'url': obj.get_absolute_url(),
+        'poster': responsive_img(obj.poster, 'card', alt=obj.title, css_class='w-full h-64 object-cover'),
+        'release_date': obj.release_date,
+        'average_rating': obj.average_rating,
+    }
+
+
+def build_home_context():
+    """Template context of the home page, as plain data"""
+    featured_movies = list(
+        Movie.objects.filter(status='published').order_by('-created_at', '-id')[:FEATURED_COUNT]
+    )
+    featured_series = list(
+        Series.objects.filter(status='published').order_by('-created_at', '-id')[:FEATURED_COUNT]
+    )
+    categories = Category.objects.all()[:CATEGORY_COUNT]
+    return {
+        'trending': [_title(title) for title in top_titles(FEATURED_COUNT)],
+        'featured_movies': [_title(movie) for movie in featured_movies],
+        'featured_series': [_title(series) for series in featured_series],
+        'categories': [{'name': category.name, 'url': category.get_absolute_url()} for category in categories],
+        # What the snapshot shows, so that edits to other titles leave it alone
+        'featured': (
+            {(Movie, movie.pk) for movie in featured_movies} | {(Series, series.pk) for series in featured_series}
+        ),
+    }
+
+
+class HomeSnapshot:
+    """Caches the home page context, and its HTML for anonymous visitors, until something changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._context = None
+            self._built_at = None
+            self._page = None
+
+    def _max_age(self):
+        return getattr(settings, 'HOME_SNAPSHOT_MAX_AGE', 300)
+
+    def context(self):
+        with self._lock:
+            if self._context is None or time.monotonic() - self._built_at > self._max_age():
+                self._context = build_home_context()
+                self._built_at = time.monotonic()
+                self._page = None
+            return self._context
+
+    def features(self, model, pk):
+        """Whether the current snapshot shows the given title"""
+        context = self._context
+        return context is not None and (model, pk) in context['featured']
+
+    def page(self, render):
+        """HTML of the anonymous home page, ``render(context)`` producing it when missing"""
+        context = self.context()
+        ads_version = resolver.version()
+        page = self._page
+        if page is None or page[0] is not context or page[1] != ads_version:
+            page = (context, ads_version, render(context))
+            with self._lock:
+                if self._context is context:
+                    self._page = page
+        return page[2]
+
+
+snapshot = HomeSnapshot()
+
+
+def home_context():
+    return snapshot.context()
+
+
+def anonymous_home_page(render):
+    return snapshot.page(render)
+
+
+def invalidate_home():
+    snapshot.invalidate()
@@ -0,0 +1,173 @@
+"""
+Resized JPEG and WebP derivatives of posters and headshots.
+
+Every uploaded image gets a set of smaller copies, one per width in
+``VARIANTS``, stored next to each other under ``derivatives/``. Names are
+derived from the original file name, so templates can build ``srcset``
+attributes without touching the database (see the ``responsive_img`` tag).
+Images are never upscaled; a manifest written after the copies records the
+width each one really has, for the ``srcset`` descriptors, and marks the
+set as complete.
+
+Resizing is kept out of the web workers: ``manage.py build_image_derivatives
+--watch`` generates the derivatives of new uploads as they appear (or run
+it without ``--watch`` from cron), and pages show the original image until
+then. ``IMAGE_DERIVATIVES_ASYNC = False`` resizes during the upload request
+instead, for development.
+"""
+import json
+import posixpath
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+
+# Models and image fields that get derivatives
+IMAGE_FIELDS = (
+    ('movies.Movie', 'poster'),
+    ('movies.Series', 'poster'),
+    ('movies.Actor', 'image'),
+    ('movies.Director', 'image'),
+)
+
+# Widths generated for each use of an image
+VARIANTS = {
+    'thumb': (64, 128),
+    'card': (320, 640),
+    'detail': (960, 1600),
+}
+
+# Rendered width of each use, for the ``sizes`` attribute
+SIZES = {
+    'thumb': '64px',
+    'card': '(min-width: 1280px) 20vw, (min-width: 1024px) 25vw, (min-width: 768px) 33vw, (min-width: 640px) 50vw, 100vw',
+    'detail': '(min-width: 1024px) 66vw, 100vw',
+}
+
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+}
+
+# Transparent areas are flattened onto the card background (Tailwind gray-800)
+BACKGROUND = (31, 41, 55)
+
+
+# Seconds before images without derivatives are looked for in storage again
+MISSING_RECHECK = 30
+
+
+def derivative_name(name, variant, width, ext):
+    root, _ = posixpath.splitext(name)
+    return f'derivatives/{root}/{variant}-{width}.{ext}'
+
+
+def manifest_name(name):
+    root, _ = posixpath.splitext(name)
+    return f'derivatives/{root}/widths.json'
+
+
+_widths = {}  # name -> {variant: [real width of each of VARIANTS[variant]]}
+_missing = {}  # name -> when its manifest was last found missing
+
+
+def derivative_widths(name):
+    """Real widths of the derivatives of ``name``, or None until they have all been generated"""
+    widths = _widths.get(name)
+    if widths is not None:
+        return widths
+    checked_at = _missing.get(name)
+    if checked_at is not None and time.monotonic() - checked_at < MISSING_RECHECK:
+        return None
+    manifest = manifest_name(name)
+    try:
+        if default_storage.exists(manifest):
+            with default_storage.open(manifest, 'rb') as f:
+                widths = json.load(f)
+    except (OSError, ValueError):
+        widths = None
+    if widths is None:
+        _missing[name] = time.monotonic()
+        return None
+    _missing.pop(name, None)
+    _widths[name] = widths
+    return widths
+
+
+def derivatives_ready(name):
+    """Whether the derivatives of ``name`` have been generated"""
+    return derivative_widths(name) is not None
+
+
+def save_file(target, content):
+    if default_storage.exists(target):
+        default_storage.delete(target)
+    default_storage.save(target, ContentFile(content))
+
+
+def generate_derivatives(name, force=False):
+    """Write every derivative of the stored image ``name``; returns how many were written"""
+    if not force and derivatives_ready(name):
+        return 0
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            flattened = Image.new('RGB', image.size, BACKGROUND)
+            flattened.paste(image, mask=image.getchannel('A'))
+            image = flattened
+        else:
+            image = image.convert('RGB')
+
+    written = 0
+    widths = {}
+    for variant, targets in VARIANTS.items():
+        widths[variant] = []
+        for width in targets:
+            # Never upscale, the browser does that just as well
+            width_px = min(width, image.width)
+            height_px = max(1, round(image.height * width_px / image.width))
+            resized = image.resize((width_px, height_px), Image.LANCZOS)
+            for ext, (fmt, options) in FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, fmt, **options)
+                save_file(derivative_name(name, variant, width, ext), buffer.getvalue())
+                written += 1
+            widths[variant].append(width_px)
+    # Written last, it marks the set as complete
+    save_file(manifest_name(name), json.dumps(widths).encode())
+    _widths[name] = widths
+    _missing.pop(name, None)
+    return written
+
+
+def queue_derivatives(fieldfile):
+    """Have derivatives generated for an uploaded image"""
+    if not fieldfile or derivatives_ready(fieldfile.name):
+        return
+    if not getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        name = fieldfile.name
+        transaction.on_commit(lambda: generate_derivatives(name))
+    # Otherwise ``build_image_derivatives --watch`` picks the upload up
+
+
+def image_name(image):
+    """Storage name of a FieldFile or a plain name string"""
+    if isinstance(image, str):
+        return image
+    return getattr(image, 'name', None) or ''
+
+
+def srcset(name, variant, ext):
+    """``srcset`` of the derivatives of ``name``, described by their real widths"""
+    entries = {}
+    for width, real_width in zip(VARIANTS[variant], derivative_widths(name)[variant]):
+        # Copies of a small image can all have its width; the smallest file will do
+        entries.setdefault(real_width, derivative_name(name, variant, width, ext))
+    return ', '.join(f'{default_storage.url(target)} {real_width}w' for real_width, target in entries.items())
@@ -0,0 +1,345 @@
+"""
+Bulk catalog import from partner feeds.
+
+Feeds are JSON lines or CSV files with one movie, series or episode per
+record (``type`` column/key). Records are read lazily and written in
+batches: categories, directors and actors are resolved through in-memory
+name maps, catalog rows are upserted by slug (episodes by series and
+number, in the season given by ``season`` or ten to a season) with
+``bulk_create``/``bulk_update``, and actor links are written
+straight to the M2M through tables. Bulk writes skip model signals, so the
+search index and cached page fragments are refreshed explicitly for every
+batch.
+
+Fields left out of a record keep their current value on existing rows.
+List values (``actors``) may be a JSON list or a ``|`` separated string.
+"""
+import csv
+import json
+import os
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from . import fragments, search
+from .autocomplete import invalidate_autocomplete
+from .facets import invalidate_facets
+from .home import invalidate_home
+from .models import Category, Director, Actor, Movie, Series, Episode, default_season_number
+from .seasons import ensure_seasons
+
+
+RECORD_TYPES = ('series', 'movie', 'episode')  # series first, episodes may refer to them
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def read_records(path, fmt=None, skip=0):
+    """Yield ``(number, record)`` pairs from a JSON lines or CSV file, after ``skip`` records"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            rows = ({key: value for key, value in row.items() if value not in (None, '')} for row in csv.DictReader(f))
+        else:
+            rows = (line for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            if number <= skip:
+                continue
+            if fmt != 'csv':
+                try:
+                    row = json.loads(row)
+                except ValueError as e:
+                    row = InvalidRecord(f'Invalid JSON: {e}')
+            yield number, row
+
+
+def split_names(value):
+    if isinstance(value, str):
+        value = value.split('|')
+    return [name.strip() for name in value or () if name and name.strip()]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['records']
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, records):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'records': records, 'saved_at': timezone.now().isoformat()}, f)
+    os.replace(tmp, path)
+
+
+class NameMap:
+    """``name -> pk`` for a lookup model, missing names are created in bulk"""
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = dict(model.objects.values_list('name', 'pk').order_by('-pk'))
+
+    def ensure(self, names):
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            created = self.model.objects.bulk_create([self.model(name=name) for name in sorted(missing)])
+            self.ids.update((obj.name, obj.pk) for obj in created)
+
+    def __getitem__(self, name):
+        return self.ids[name]
+
+
+class CategoryMap:
+    """Categories matched by slug or name, created on first use"""
+
+    def __init__(self):
+        self.ids = {}
+        for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug'):
+            self.ids[slug] = self.ids[slugify(name)] = pk
+
+    def ensure(self, names):
+        for name in names:
+            key = slugify(name)
+            if key not in self.ids:
+                category, _ = Category.objects.get_or_create(slug=key, defaults={'name': name})
+                self.ids[key] = category.pk
+
+    def __getitem__(self, name):
+        return self.ids[slugify(name)]
+
+
+class CatalogImporter:
+    """Upserts batches of feed records, keeping running counts in ``stats``"""
+
+    FIELDS = {
+        Movie: ['title', 'description', 'release_date', 'duration', 'trailer_url', 'status'],
+        Series: ['title', 'description', 'release_date', 'trailer_url', 'status', 'seasons_count'],
+        Episode: ['title', 'slug', 'description', 'duration', 'release_date', 'video_file'],
+    }
+    REQUIRED = {
+        Movie: ['title', 'release_date', 'duration', 'category_id'],
+        Series: ['title', 'release_date', 'category_id'],
+        Episode: ['title', 'release_date', 'duration'],
+    }
+    INTEGER_FIELDS = ('duration', 'seasons_count', 'episode_number', 'season')
+    STATUSES = ('draft', 'published')
+
+    def __init__(self):
+        self.categories = CategoryMap()
+        self.directors = NameMap(Director)
+        self.actors = NameMap(Actor)
+        self.stats = {'created': 0, 'updated': 0, 'skipped': 0}
+
+    def import_batch(self, records):
+        """Write one batch in a single transaction; returns ``(number, error)`` for skipped records"""
+        errors = []
+        grouped = {kind: {} for kind in RECORD_TYPES}
+        for number, record in records:
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                if not isinstance(record, dict):
+                    raise InvalidRecord('Record is not an object')
+                kind = record.get('type')
+                if kind not in grouped:
+                    raise InvalidRecord(f'Unknown type {kind!r}')
+                key = self.record_key(kind, record)
+                self.check_names(record)
+            except InvalidRecord as e:
+                errors.append((number, str(e)))
+                continue
+            # A later record for the same item replaces an earlier one
+            grouped[kind].pop(key, None)
+            grouped[kind][key] = (number, record)
+
+        with transaction.atomic():
+            self.resolve_names(grouped['series'], grouped['movie'])
+            errors += self.upsert_titles(Series, grouped['series'])
+            errors += self.upsert_titles(Movie, grouped['movie'])
+            errors += self.upsert_episodes(grouped['episode'])
+        self.stats['skipped'] += len(errors)
+        return errors
+
+    def record_key(self, kind, record):
+        if kind == 'episode':
+            series = record.get('series')
+            if not series or not isinstance(series, str):
+                raise InvalidRecord('Episode without a series slug')
+            return series, self.convert('episode_number', record.get('episode_number'))
+        slug = record.get('slug') or slugify(record.get('title', ''))
+        if not slug or not isinstance(slug, str):
+            raise InvalidRecord('Record needs a slug or a title')
+        return slug
+
+    def check_names(self, record):
+        """Reject names that are not text before they reach the name maps"""
+        for field in ('category', 'director'):
+            value = record.get(field)
+            if value is not None and not isinstance(value, str):
+                raise InvalidRecord(f'Invalid {field} {value!r}')
+        actors = record.get('actors')
+        if actors is not None and not isinstance(actors, str) and not (
+            isinstance(actors, list) and all(isinstance(name, str) for name in actors)
+        ):
+            raise InvalidRecord(f'Invalid actors {actors!r}')
+
+    def convert(self, field, value):
+        if field == 'release_date':
+            try:
+                date = parse_date(str(value))
+            except ValueError:
+                date = None
+            if date is None:
+                raise InvalidRecord(f'Invalid release_date {value!r}')
+            return date
+        if field in self.INTEGER_FIELDS:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise InvalidRecord(f'Invalid {field} {value!r}')
+        if field == 'status' and value not in self.STATUSES:
+            raise InvalidRecord(f'Invalid status {value!r}')
+        return value
+
+    def resolve_names(self, *groups):
+        categories, directors, actors = set(), set(), set()
+        for items in groups:
+            for _, record in items.values():
+                if record.get('category'):
+                    categories.add(record['category'])
+                if record.get('director'):
+                    directors.add(record['director'].strip())
+                actors.update(split_names(record.get('actors')))
+        self.categories.ensure(categories)
+        self.directors.ensure(directors)
+        self.actors.ensure(actors)
+
+    def apply(self, obj, record, created):
+        model = type(obj)
+        for field in self.FIELDS[model]:
+            if field in record:
+                setattr(obj, field, self.convert(field, record[field]))
+        if record.get('category'):
+            obj.category_id = self.categories[record['category']]
+        if 'director' in record:
+            director = (record['director'] or '').strip()
+            obj.director_id = self.directors[director] if director else None
+        if created:
+            missing = [field for field in self.REQUIRED[model] if getattr(obj, field) in (None, '')]
+            if missing:
+                raise InvalidRecord(f'New {model.__name__.lower()} is missing {", ".join(missing)}')
+
+    def upsert_titles(self, model, items):
+        """Upsert movies or series keyed by slug"""
+        if not items:
+            return []
+        errors = []
+        existing = model.objects.in_bulk(list(items), field_name='slug')
+        to_create, to_update, cast = [], [], {}
+        for slug, (number, record) in items.items():
+            obj = existing.get(slug)
+            created = obj is None
+            if created:
+                obj = model(slug=slug)
+            try:
+                self.apply(obj, record, created)
+            except InvalidRecord as e:
+                errors.append((number, str(e)))
+                continue
+            (to_create if created else to_update).append(obj)
+            if 'actors' in record:
+                cast[slug] = {self.actors[name] for name in split_names(record['actors'])}
+
+        now = timezone.now()
+        for obj in to_update:
+            obj.updated_at = now  # bulk_update does not apply auto_now
+        model.objects.bulk_create(to_create, batch_size=500)
+        model.objects.bulk_update(
+            to_update, self.FIELDS[model] + ['category', 'director', 'updated_at'], batch_size=500
+        )
+        saved = to_create + to_update
+        pks = {obj.slug: obj.pk for obj in saved}
+        self.link_actors(model, {pks[slug]: actor_ids for slug, actor_ids in cast.items() if slug in pks})
+        search.index_objects(model, saved)
+        fragments.bump(model, [obj.pk for obj in to_update])
+        # bulk_create and bulk_update send no signals
+        invalidate_home()
+        invalidate_autocomplete()
+        invalidate_facets()
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        return errors
+
+    def link_actors(self, model, cast):
+        """Replace the actors of each ``pk`` in ``cast`` through the M2M table"""
+        if not cast:
+            return
+        through = model.actors.through
+        source = f'{model._meta.model_name}_id'
+        pks = list(cast)
+        for start in range(0, len(pks), 500):
+            through.objects.filter(**{f'{source}__in': pks[start:start + 500]}).delete()
+        through.objects.bulk_create(
+            [through(**{source: pk, 'actor_id': actor_id}) for pk, actor_ids in cast.items() for actor_id in actor_ids],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def upsert_episodes(self, items):
+        """Upsert episodes keyed by series slug and episode number"""
+        if not items:
+            return []
+        errors = []
+        series_ids = dict(Series.objects.filter(slug__in={slug for slug, _ in items}).values_list('slug', 'pk'))
+        existing = {
+            (episode.series_id, episode.episode_number): episode
+            for episode in Episode.objects.filter(
+                series_id__in=series_ids.values(),
+                episode_number__in={number for _, number in items},
+            )
+        }
+        to_create, to_update, seasons = [], [], []
+        for (series_slug, episode_number), (number, record) in items.items():
+            series_id = series_ids.get(series_slug)
+            if series_id is None:
+                errors.append((number, f'Unknown series {series_slug!r}'))
+                continue
+            episode = existing.get((series_id, episode_number))
+            created = episode is None
+            if created:
+                episode = Episode(
+                    series_id=series_id,
+                    episode_number=episode_number,
+                    slug=slugify(f'{series_slug}-episode-{episode_number}'),
+                )
+            try:
+                self.apply(episode, record, created)
+                if 'season' in record:
+                    seasons.append((episode, (series_id, self.convert('season', record['season']))))
+                elif created:
+                    seasons.append((episode, (series_id, default_season_number(episode_number))))
+            except InvalidRecord as e:
+                errors.append((number, str(e)))
+                continue
+            (to_create if created else to_update).append(episode)
+
+        season_ids = ensure_seasons(key for _, key in seasons)
+        for episode, key in seasons:
+            episode.season_id = season_ids[key]
+        now = timezone.now()
+        for episode in to_update:
+            episode.updated_at = now  # bulk_update does not apply auto_now
+        Episode.objects.bulk_create(to_create, batch_size=500)
+        Episode.objects.bulk_update(to_update, self.FIELDS[Episode] + ['season', 'updated_at'], batch_size=500)
+        search.index_objects(Episode, to_create + to_update)
+        fragments.bump(Episode, [episode.pk for episode in to_update])
+        fragments.bump(Series, {episode.series_id for episode in to_create + to_update})
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        return errors
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from movies.benchmark import add_query_latency, benchmark, default_urls, use_async_views
+
+
+class Command(BaseCommand):
+    help = 'Compare tail latency of the sync (WSGI) and async (ASGI) home and detail views'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'urls',
+            nargs='*',
+            help='Paths to request, the home page and the newest movie, series and episode by default',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per path and view flavour',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Requests in flight at once',
+        )
+        parser.add_argument(
+            '--latency-ms',
+            type=float,
+            default=0,
+            help='Simulated database round trip added to every query',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Clear the cache before every request so no fragment is cached',
+        )
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or default_urls()
+        if options['latency_ms']:
+            add_query_latency(options['latency_ms'] / 1000)
+
+        self.stdout.write(f"{'path':<40} {'views':<6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'req/s':>8}")
+        try:
+            for mode in ('sync', 'async'):
+                use_async_views(mode == 'async')
+                for url in urls:
+                    result = benchmark(url, mode, options['requests'], options['concurrency'], options['cold'])
+                    self.stdout.write(
+                        f"{url:<40} {mode:<6} {result['p50']:>8.1f} {result['p95']:>8.1f} "
+                        f"{result['p99']:>8.1f} {result['max']:>8.1f} {result['rps']:>8.1f}"
+                    )
+        finally:
+            use_async_views(getattr(settings, 'ASYNC_VIEWS', False))
+
+        self.stdout.write('Latencies in milliseconds')
+        if not connections['default'].settings_dict['CONN_MAX_AGE']:
+            self.stdout.write(self.style.WARNING(
+                'CONN_MAX_AGE is 0: the async views opened a database connection per query batch, '
+                'which ASYNC_VIEWS avoids by keeping them open'
+            ))
+        self.stdout.write(self.style.SUCCESS('Benchmark completed successfully!'))
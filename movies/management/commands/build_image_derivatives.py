@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from movies.images import IMAGE_FIELDS, generate_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate resized JPEG and WebP derivatives of posters and headshots'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes, one per CPU by default',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate derivatives that already exist',
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running and process new uploads, looking for them every SECONDS',
+        )
+
+    def image_names(self):
+        names = set()
+        for label, field in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True))
+        return names
+
+    def build(self, pool, names, force=False):
+        written = failed = 0
+        futures = {pool.submit(generate_derivatives, name, force): name for name in sorted(names)}
+        for future in as_completed(futures):
+            try:
+                written += future.result()
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{futures[future]}: {e}')
+        self.stdout.write(f'Wrote {written} derivatives, {failed} images failed')
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            names = self.image_names()
+            self.stdout.write(f'Processing {len(names)} images')
+            self.build(pool, names, options['force'])
+            if not options['watch']:
+                self.stdout.write(self.style.SUCCESS('Image derivatives built successfully!'))
+                return
+
+            self.stdout.write(f"Watching for new images every {options['watch']:g}s")
+            # A replaced upload is stored under a new name, so new names are all there is to do;
+            # images that failed are tried again when the command restarts
+            seen = names
+            while True:
+                time.sleep(options['watch'])
+                close_old_connections()
+                new = self.image_names() - seen
+                if new:
+                    self.stdout.write(f'Processing {len(new)} new images')
+                    self.build(pool, new)
+                    seen |= new
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from movies.recommendations import KINDS, build_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Compute related movies and series from ratings, watch history and downloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=sorted(KINDS) + ['all'],
+            default='all',
+            help='Which catalog to build neighbours for',
+        )
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=20,
+            help='Number of neighbours to keep per item',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Only recompute items with new interactions since the last build',
+        )
+
+    def handle(self, *args, **options):
+        kinds = sorted(KINDS) if options['kind'] == 'all' else [options['kind']]
+        for kind in kinds:
+            started = time.monotonic()
+            items, rows = build_neighbours(kind, top_k=options['top_k'], incremental=options['incremental'])
+            self.stdout.write(
+                f'{kind}: updated neighbours of {items} items ({rows} rows) in {time.monotonic() - started:.1f}s'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Recommendations built successfully!'))
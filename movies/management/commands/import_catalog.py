@@ -0,0 +1,68 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from movies.importer import CatalogImporter, read_checkpoint, read_records, write_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Import movies, series and episodes from a JSON lines or CSV feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file, .csv or JSON lines')
+        parser.add_argument(
+            '--format',
+            choices=['jsonl', 'csv'],
+            help='Feed format, guessed from the file extension by default',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of records written per transaction',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Progress file, defaults to <path>.checkpoint',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the records recorded in the checkpoint by an earlier run',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'No such file: {path}')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        skip = read_checkpoint(checkpoint) if options['resume'] else 0
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}')
+
+        importer = CatalogImporter()
+        records = read_records(path, options['format'], skip=skip)
+        done = skip
+        started = time.monotonic()
+        while True:
+            batch = list(islice(records, options['batch_size']))
+            if not batch:
+                break
+            for number, error in importer.import_batch(batch):
+                self.stderr.write(f'Record {number} skipped: {error}')
+            done = batch[-1][0]
+            # Only committed batches are recorded, a crash re-imports at most one batch
+            write_checkpoint(checkpoint, done)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{done} records, {(done - skip) / elapsed:.0f} rows/s')
+
+        elapsed = time.monotonic() - started
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        stats = importer.stats
+        self.stdout.write(
+            f"Created {stats['created']}, updated {stats['updated']}, skipped {stats['skipped']} "
+            f"in {elapsed:.1f}s ({(done - skip) / max(elapsed, 1e-9):.0f} rows/s)"
+        )
+        self.stdout.write(self.style.SUCCESS('Catalog imported successfully!'))
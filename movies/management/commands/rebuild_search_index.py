@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from movies import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for movies, series and episodes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Number of rows to index per batch',
+        )
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            self.stdout.write('This database has no full-text backend, searches use LIKE matching.')
+            return
+
+        for model in search.SEARCHABLE_MODELS:
+            total = search.rebuild_index(model, batch_size=options['batch_size'])
+            self.stdout.write(f'Indexed {total} {model.__name__} rows')
+
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt successfully!'))
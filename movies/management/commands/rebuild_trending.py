@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from movies.trending import rebuild_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute the trending leaderboard from ratings, downloads and watch history'
+
+    def handle(self, *args, **options):
+        scored = rebuild_scores()
+        self.stdout.write(f'Scored {scored} titles')
+        self.stdout.write(self.style.SUCCESS('Trending leaderboard rebuilt successfully!'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from moviewebsite.routers import REPLICA_DB_ALIAS, replica_configured
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the replica file (local stand-in for replication)'
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError(f'No {REPLICA_DB_ALIAS!r} database configured, set REPLICA_DB_NAME')
+        primary = connections[DEFAULT_DB_ALIAS]
+        replica = connections[REPLICA_DB_ALIAS]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite files can be copied, real replicas are kept in sync by the database server')
+
+        replica.close()
+        replica.ensure_connection()
+        primary.ensure_connection()
+        primary.connection.backup(replica.connection)
+        replica.close()
+
+        self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}")
+        self.stdout.write(self.style.SUCCESS('Replica synced successfully!'))
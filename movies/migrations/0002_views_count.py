@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='series',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
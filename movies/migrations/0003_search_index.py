@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+TABLES = ['movies_movie', 'movies_series', 'movies_episode']
+
+
+def create_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            if connection.vendor == 'sqlite':
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5("
+                    "title, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+                )
+                cursor.execute(
+                    f'INSERT INTO {table}_search (rowid, title, description) '
+                    f'SELECT id, title, description FROM {table}'
+                )
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table}_search ('
+                    f'object_id bigint PRIMARY KEY REFERENCES {table} (id) ON DELETE CASCADE, '
+                    'document tsvector NOT NULL)'
+                )
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_document ON {table}_search USING GIN (document)')
+                cursor.execute(
+                    f'INSERT INTO {table}_search (object_id, document) '
+                    f"SELECT id, setweight(to_tsvector('english', title), 'A') || "
+                    f"setweight(to_tsvector('english', description), 'B') FROM {table}"
+                )
+
+
+def drop_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_views_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
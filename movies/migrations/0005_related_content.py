@@ -0,0 +1,45 @@
+# Generated by Django 6.0.2 on 2026-10-18 07:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedMovie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='movies.movie')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='movies.movie')),
+            ],
+            options={
+                'ordering': ['movie', 'rank'],
+                'unique_together': {('movie', 'rank')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedSeries',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='movies.series')),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='movies.series')),
+            ],
+            options={
+                'verbose_name_plural': 'Related series',
+                'ordering': ['series', 'rank'],
+                'unique_together': {('series', 'rank')},
+            },
+        ),
+    ]
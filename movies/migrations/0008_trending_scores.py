@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_episode_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='movies.category')),
+                ('movie', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+                ('series', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.series')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='trending_score_idx'), models.Index(fields=['category', '-score'], name='trending_category_score_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('movie__isnull', False)), fields=('movie',), name='trending_movie_unique'), models.UniqueConstraint(condition=models.Q(('series__isnull', False)), fields=('series',), name='trending_series_unique')],
+            },
+        ),
+    ]
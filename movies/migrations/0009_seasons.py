@@ -0,0 +1,53 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_seasons(apps, schema_editor):
+    # Seasons were derived from the episode number, ten episodes to a season
+    Season = apps.get_model('movies', 'Season')
+    Episode = apps.get_model('movies', 'Episode')
+    numbers = set()
+    for series_id, episode_number in Episode.objects.values_list('series_id', 'episode_number').iterator():
+        numbers.add((series_id, (episode_number - 1) // 10 + 1))
+    Season.objects.bulk_create(
+        [Season(series_id=series_id, number=number) for series_id, number in sorted(numbers)],
+        batch_size=500,
+    )
+    for season in Season.objects.all().iterator():
+        Episode.objects.filter(
+            series_id=season.series_id,
+            episode_number__gte=(season.number - 1) * 10 + 1,
+            episode_number__lte=season.number * 10,
+        ).update(season=season)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_trending_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('title', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seasons', to='movies.series')),
+            ],
+            options={
+                'ordering': ['series', 'number'],
+                'unique_together': {('series', 'number')},
+            },
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='season',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='episodes', to='movies.season'),
+        ),
+        migrations.RunPython(backfill_seasons, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_seasons'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='episode',
+            name='season',
+            field=models.ForeignKey(blank=True, help_text='Leave empty to group episodes ten per season', on_delete=django.db.models.deletion.CASCADE, related_name='episodes', to='movies.season'),
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['series', 'season', 'episode_number'], name='episode_season_idx'),
+        ),
+    ]
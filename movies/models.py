@@ -1,4 +1,7 @@
 from django.db import models
+from django.core.exceptions import ValidationError
+from django.db.models import F, FloatField
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.models import User
 from django.urls import reverse
 
@@ -17,7 +20,7 @@ class Category(models.Model):
         return self.name
 
     def get_absolute_url(self):
-        return reverse('category_detail', kwargs={'slug': self.slug})
+        return reverse('movies:category_detail', kwargs={'slug': self.slug})
 
 
 class Actor(models.Model):
@@ -40,7 +43,49 @@ class Director(models.Model):
         return self.name
 
 
-class Movie(models.Model):
+class CatalogQuerySet(models.QuerySet):
+    RATING_ORDERING = ('-rating_average', '-created_at', '-id')
+
+    def order_by_rating(self):
+        """Order by the stored average rating, unrated content last"""
+        average = Coalesce(F('rating_sum') * 1.0 / NullIf(F('rating_count'), 0), 0.0)
+        return self.annotate(
+            rating_average=models.ExpressionWrapper(average, output_field=FloatField())
+        ).order_by(*self.RATING_ORDERING)
+
+
+class RatingAggregate(models.Model):
+    """Rating totals stored on the rated content.
+
+    Kept up to date by ``user_interactions.ratings`` whenever a rating is
+    written and rebuilt by ``manage.py rebuild_rating_aggregates``.
+    """
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_count_1 = models.PositiveIntegerField(default=0)
+    rating_count_2 = models.PositiveIntegerField(default=0)
+    rating_count_3 = models.PositiveIntegerField(default=0)
+    rating_count_4 = models.PositiveIntegerField(default=0)
+    rating_count_5 = models.PositiveIntegerField(default=0)
+
+    objects = CatalogQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
+    @property
+    def rating_histogram(self):
+        """Number of 1 to 5 star ratings, in that order"""
+        return [getattr(self, f'rating_count_{stars}') for stars in range(1, 6)]
+
+
+class Movie(RatingAggregate):
     STATUS_CHOICES = (
         ('draft', 'Draft'),
         ('published', 'Published'),
@@ -64,15 +109,28 @@ class Movie(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Published movies newest first, as listed and paginated
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='published'),
+                name='movie_published_idx',
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(status='published'),
+                name='movie_category_published_idx',
+            ),
+        ]
         
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
-        return reverse('movie_detail', kwargs={'slug': self.slug})
+        return reverse('movies:movie_detail', kwargs={'slug': self.slug})
     
 
-class Series(models.Model):
+class Series(RatingAggregate):
     STATUS_CHOICES = (
         ('draft', 'Draft'),
         ('published', 'Published'),
@@ -91,19 +149,62 @@ class Series(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     seasons_count = models.PositiveIntegerField(default=1)
+    views_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Published series newest first, as listed and paginated
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(status='published'),
+                name='series_published_idx',
+            ),
+            models.Index(
+                fields=['category', '-created_at', '-id'],
+                condition=models.Q(status='published'),
+                name='series_category_published_idx',
+            ),
+        ]
         
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
-        return reverse('series_detail', kwargs={'slug': self.slug})
+        return reverse('movies:series_detail', kwargs={'slug': self.slug})
 
 
-class Episode(models.Model):
+class Season(models.Model):
+    series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name='seasons')
+    number = models.PositiveIntegerField()
+    title = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['series', 'number']
+        unique_together = ('series', 'number')
+        
+    def __str__(self):
+        return f"{self.series.title} - Season {self.number}"
+    
+    def get_absolute_url(self):
+        return f"{self.series.get_absolute_url()}?season={self.number}"
+
+
+def default_season_number(episode_number):
+    """Season of an episode saved without one: ten episodes per season, as before seasons were stored"""
+    return ((episode_number - 1) // 10) + 1
+
+
+class Episode(RatingAggregate):
     series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name='episodes')
+    season = models.ForeignKey(
+        Season,
+        on_delete=models.CASCADE,
+        related_name='episodes',
+        blank=True,
+        help_text="Leave empty to group episodes ten per season",
+    )
     episode_number = models.PositiveIntegerField()
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
@@ -112,18 +213,105 @@ class Episode(models.Model):
     release_date = models.DateField()
     video_file = models.FileField(upload_to='episodes/')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    views_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['episode_number']
         unique_together = ('series', 'episode_number')
+        indexes = [
+            # Episodes of one season in order, as the series page lists them
+            models.Index(fields=['series', 'season', 'episode_number'], name='episode_season_idx'),
+        ]
         
     def __str__(self):
         return f"{self.series.title} - S{self.season_number()}E{self.episode_number}: {self.title}"
     
+    def get_absolute_url(self):
+        return reverse('movies:episode_detail', kwargs={
+            'series_slug': self.series.slug,
+            'episode_number': self.episode_number,
+        })
+    
     def season_number(self):
-        # Assuming episodes are grouped by seasons based on episode number ranges
-        # This is a simplified approach - in a real app, you might have a Season model
-        return ((self.episode_number - 1) // 10) + 1
+        """Number of the episode's season; load episodes with ``select_related('season')`` or each call runs a query"""
+        return self.season.number
+    
+    def clean(self):
+        if self.season_id is not None and self.series_id is not None and self.season.series_id != self.series_id:
+            raise ValidationError({'season': "This season belongs to another series."})
+    
+    def save(self, *args, **kwargs):
+        if self.season_id is None:
+            self.season, _ = Season.objects.get_or_create(
+                series_id=self.series_id, number=default_season_number(self.episode_number)
+            )
+        super().save(*args, **kwargs)
+
+
+class RelatedMovie(models.Model):
+    """Precomputed neighbour of a movie, written by ``manage.py build_recommendations``"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['movie', 'rank']
+        unique_together = ('movie', 'rank')
+
+    def __str__(self):
+        return f"{self.movie} -> {self.related} ({self.score:.3f})"
+
+
+class RelatedSeries(models.Model):
+    """Precomputed neighbour of a series, written by ``manage.py build_recommendations``"""
+    series = models.ForeignKey(Series, on_delete=models.CASCADE, related_name='neighbours')
+    related = models.ForeignKey(Series, on_delete=models.CASCADE, related_name='neighbour_of')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "Related series"
+        ordering = ['series', 'rank']
+        unique_together = ('series', 'rank')
+
+    def __str__(self):
+        return f"{self.series} -> {self.related} ({self.score:.3f})"
+
+
+class TrendingScore(models.Model):
+    """Time-decayed popularity of a movie or series, kept by ``movies.trending``"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    series = models.ForeignKey(Series, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Copied from the title so that per-category leaderboards read one index
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Natural log of the forward-decayed sum of event weights
+    score = models.FloatField(null=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['movie'],
+                condition=models.Q(movie__isnull=False),
+                name='trending_movie_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['series'],
+                condition=models.Q(series__isnull=False),
+                name='trending_series_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+            models.Index(fields=['category', '-score'], name='trending_category_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trending score of {self.movie or self.series}"
 
 
 class Advertisement(models.Model):
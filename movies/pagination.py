@@ -0,0 +1,212 @@
+"""
+Cursor pagination for catalog listings.
+
+``KeysetPaginator`` pages through a queryset by remembering the sort key of
+the first and last row on the page instead of an OFFSET, so every page costs
+one indexed range query no matter how deep it is, and no COUNT(*) is issued.
+Cursors are opaque URL-safe tokens.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q, QuerySet
+
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # Keep microseconds; DjangoJSONEncoder truncates them, which would
+        # make the cursor compare unequal to the row it was taken from.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(direction, values)`` or ``(None, None)`` for a bad token"""
+    if not cursor:
+        return None, None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data)
+    except (ValueError, TypeError, binascii.Error):
+        return None, None
+    if not isinstance(values, (list, int)):
+        return None, None
+    return direction, values
+
+
+def estimate_count(queryset, cap=1000):
+    """Cheaply estimate how many rows ``queryset`` returns.
+
+    PostgreSQL answers from the planner's row estimate; other databases
+    count at most ``cap`` rows.
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset[:cap].count()
+
+
+class KeysetPage:
+    """One page of results with opaque cursors to its neighbours"""
+
+    def __init__(self, paginator, object_list, next_cursor=None, previous_cursor=None):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def estimated_count(self):
+        return self.paginator.estimated_count()
+
+
+class KeysetPaginator:
+    """Paginate a queryset on a unique sort key such as ``(created_at, id)``"""
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.descending = [field.startswith('-') for field in self.ordering]
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def _after(self, values, backwards=False):
+        """Rows strictly after ``values`` in sort order (before if ``backwards``)"""
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            lookup = 'lt' if self.descending[index] != backwards else 'gt'
+            term = Q(**{f'{field}__{lookup}': values[index]})
+            for previous in range(index):
+                term &= Q(**{self.fields[previous]: values[previous]})
+            condition |= term
+        # A redundant bound on the leading field lets the database seek into
+        # an index on the sort key instead of walking it from the start
+        lookup = 'lte' if self.descending[0] != backwards else 'gte'
+        return Q(**{f'{self.fields[0]}__{lookup}': values[0]}) & condition
+
+    def _sort_field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _parse(self, values):
+        """Cursor values as the sort fields' types, or None when they are not valid ones"""
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        try:
+            parsed = [self._sort_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (ValidationError, ValueError, TypeError):
+            return None
+        return None if None in parsed else parsed
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def get_page(self, cursor=None):
+        direction, values = decode_cursor(cursor)
+        values = self._parse(values)
+        if values is None:
+            direction = None
+
+        limit = self.per_page + 1
+        if direction == 'p':
+            rows = list(self.queryset.filter(self._after(values, backwards=True))
+                        .order_by(*self._reversed_ordering())[:limit])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            queryset = self.queryset
+            if direction == 'n':
+                queryset = queryset.filter(self._after(values))
+            rows = list(queryset.order_by(*self.ordering)[:limit])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = direction == 'n'
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor('n', self._key(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor('p', self._key(rows[0]))
+        return KeysetPage(self, rows, next_cursor, previous_cursor)
+
+    def estimated_count(self):
+        return estimate_count(self.queryset)
+
+
+class SequencePaginator:
+    """Cursor pagination over a bounded, already ranked sequence.
+
+    Used for search results, whose relevance order has no column to seek on;
+    the sequence only holds matching ids, so an offset into it is cheap.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        direction, offset = decode_cursor(cursor)
+        if direction != 'o' or not isinstance(offset, int) or offset < 0:
+            offset = 0
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        next_cursor = previous_cursor = None
+        if len(rows) > self.per_page:
+            next_cursor = encode_cursor('o', offset + self.per_page)
+        if offset > 0:
+            previous_cursor = encode_cursor('o', max(offset - self.per_page, 0))
+        return KeysetPage(self, rows[:self.per_page], next_cursor, previous_cursor)
+
+    def estimated_count(self):
+        return len(self.object_list)
+
+
+def paginate(object_list, cursor, per_page=12, ordering=DEFAULT_ORDERING):
+    """Return the page of ``object_list`` that ``cursor`` points at"""
+    if isinstance(object_list, QuerySet):
+        paginator = KeysetPaginator(object_list, per_page, ordering)
+    else:
+        paginator = SequencePaginator(object_list, per_page)
+    return paginator.get_page(cursor)
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundIndex:
+    """An in-memory index of this worker, rebuilt by a background thread.
+
+    Subclasses say how an index is built and how old it may get. ``get()``
+    returns the current index and, when it is missing, too old or
+    invalidated, starts a daemon thread building the next one; requests keep
+    reading the current index meanwhile and the new one replaces it whole
+    once ready. Until the first build completes there is no index and
+    ``get()`` returns None; ``warm()`` starts that build ahead of the first
+    request needing the index. ``INDEX_BACKGROUND_BUILD = False`` builds on
+    the request instead, as tests need.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._built_at = None
+        # Bumped by invalidate(), so that a build started before it is not taken as current
+        self._generation = 0
+        self._builder = None
+
+    def build(self):
+        """A new index, read from the database"""
+        raise NotImplementedError
+
+    def max_age(self):
+        """Seconds before the index is rebuilt"""
+        raise NotImplementedError
+
+    def starting(self):
+        """Called with the lock held when a build starts"""
+
+    def ready(self, index):
+        """Called with the lock held on a new index before it replaces the current one"""
+        return index
+
+    def invalidate(self):
+        """Rebuild the index, still serving the current one until the new one is ready"""
+        with self._lock:
+            self._generation += 1
+            self._built_at = None
+
+    def _due(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.max_age()
+
+    def get(self):
+        """The current index, None before the first build completes"""
+        with self._lock:
+            if not self._due():
+                return self._index
+            if getattr(settings, 'INDEX_BACKGROUND_BUILD', True):
+                self._build_in_background()
+                return self._index
+        self.rebuild()
+        with self._lock:
+            return self._index
+
+    def warm(self):
+        """Start building in the background if the index is due, without waiting for it"""
+        with self._lock:
+            if self._due() and getattr(settings, 'INDEX_BACKGROUND_BUILD', True):
+                self._build_in_background()
+
+    def _build_in_background(self):
+        """Start a builder thread unless one is running; call with the lock held"""
+        if self._builder is None or not self._builder.is_alive():
+            self._builder = threading.Thread(
+                target=self._run, args=(self._start(),), name=f'{type(self).__name__}-build', daemon=True
+            )
+            self._builder.start()
+
+    def wait(self, timeout=None):
+        """Wait for a build in flight to finish"""
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def _start(self):
+        """Begin a build; call with the lock held"""
+        self.starting()
+        return self._generation
+
+    def rebuild(self, generation=None):
+        """Build a new index and swap it in"""
+        if generation is None:
+            with self._lock:
+                generation = self._start()
+        index = self.build()
+        with self._lock:
+            self._index = self.ready(index)
+            if generation == self._generation:
+                self._built_at = time.monotonic()
+
+    def _run(self, generation):
+        try:
+            self.rebuild(generation)
+        except Exception:
+            logger.exception('Failed to build %s', type(self).__name__)
+        finally:
+            # The thread's own connections, not those of any request
+            connections.close_all()
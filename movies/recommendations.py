@@ -0,0 +1,145 @@
+"""
+"Related" rails for movie and series pages.
+
+Neighbours are computed offline by ``manage.py build_recommendations`` from
+ratings, watch history and downloads (see ``movies.similarity``). They are
+stored in RelatedMovie/RelatedSeries, which the detail views read with one
+indexed query. Items without neighbours yet fall back to other titles in the
+same category.
+"""
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import fragments
+from .models import Movie, Series, RelatedMovie, RelatedSeries
+from user_interactions.models import Rating, WatchHistory, Download
+
+
+# Relative weight of each kind of interaction
+RATING_WEIGHT = 1.0  # scaled by stars / 5
+WATCH_WEIGHT = 1.0  # scaled by progress, at least 10%
+DOWNLOAD_WEIGHT = 1.0
+
+
+def related_movies_for(movie, limit=6):
+    """Published neighbours of ``movie``, or same-category movies if it has none"""
+    related = list(
+        Movie.objects.filter(neighbour_of__movie=movie, status='published')
+        .order_by('neighbour_of__rank')[:limit]
+    )
+    if related:
+        return related
+    return list(Movie.objects.filter(
+        category_id=movie.category_id,
+        status='published'
+    ).exclude(id=movie.id)[:limit])
+
+
+def related_series_for(series, limit=6):
+    """Published neighbours of ``series``, or same-category series if it has none"""
+    related = list(
+        Series.objects.filter(neighbour_of__series=series, status='published')
+        .order_by('neighbour_of__rank')[:limit]
+    )
+    if related:
+        return related
+    return list(Series.objects.filter(
+        category_id=series.category_id,
+        status='published'
+    ).exclude(id=series.id)[:limit])
+
+
+def _movie_interactions(since=None):
+    """``(user_id, movie_id, weight)`` rows, only those after ``since`` if given"""
+    ratings = Rating.objects.filter(movie__isnull=False)
+    watches = WatchHistory.objects.filter(movie__isnull=False)
+    downloads = Download.objects.filter(movie__isnull=False)
+    if since:
+        ratings = ratings.filter(created_at__gte=since)
+        watches = watches.filter(watched_at__gte=since)
+        downloads = downloads.filter(download_date__gte=since)
+    for user_id, item_id, stars in ratings.values_list('user_id', 'movie_id', 'rating').iterator():
+        yield user_id, item_id, RATING_WEIGHT * stars / 5
+    for user_id, item_id, progress in watches.values_list('user_id', 'movie_id', 'progress').iterator():
+        yield user_id, item_id, WATCH_WEIGHT * max(progress, 10.0) / 100
+    for user_id, item_id in downloads.values_list('user_id', 'movie_id').iterator():
+        yield user_id, item_id, DOWNLOAD_WEIGHT
+
+
+def _series_interactions(since=None):
+    """``(user_id, series_id, weight)`` rows; episode activity counts for its series"""
+    ratings = Rating.objects.filter(series__isnull=False)
+    episode_ratings = Rating.objects.filter(episode__isnull=False)
+    watches = WatchHistory.objects.filter(episode__isnull=False)
+    downloads = Download.objects.filter(episode__isnull=False)
+    if since:
+        ratings = ratings.filter(created_at__gte=since)
+        episode_ratings = episode_ratings.filter(created_at__gte=since)
+        watches = watches.filter(watched_at__gte=since)
+        downloads = downloads.filter(download_date__gte=since)
+    for user_id, item_id, stars in ratings.values_list('user_id', 'series_id', 'rating').iterator():
+        yield user_id, item_id, RATING_WEIGHT * stars / 5
+    for user_id, item_id, stars in episode_ratings.values_list('user_id', 'episode__series_id', 'rating').iterator():
+        yield user_id, item_id, RATING_WEIGHT * stars / 5
+    for user_id, item_id, progress in watches.values_list('user_id', 'episode__series_id', 'progress').iterator():
+        yield user_id, item_id, WATCH_WEIGHT * max(progress, 10.0) / 100
+    for user_id, item_id in downloads.values_list('user_id', 'episode__series_id').iterator():
+        yield user_id, item_id, DOWNLOAD_WEIGHT
+
+
+KINDS = {
+    'movie': (RelatedMovie, Movie, _movie_interactions),
+    'series': (RelatedSeries, Series, _series_interactions),
+}
+
+
+def build_neighbours(kind, top_k=20, incremental=False):
+    """Recompute stored neighbours for ``kind`` ('movie' or 'series').
+
+    A full build replaces every row. An incremental build only recomputes
+    items that were rated, watched or downloaded since the previous build.
+    Returns ``(items_updated, rows_written)``.
+    """
+    import numpy as np
+    from .similarity import item_neighbours
+
+    relation, model, interactions = KINDS[kind]
+    source_field = model._meta.model_name
+    since = relation.objects.aggregate(last=Max('computed_at'))['last'] if incremental else None
+    targets = None
+    if since:
+        targets = {item_id for _, item_id, _ in interactions(since)}
+        if not targets:
+            return 0, 0
+
+    rows = list(interactions())
+    data = np.array(rows, dtype=float).reshape(-1, 3)
+    sources, neighbours, scores, ranks = item_neighbours(
+        data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2],
+        top_k=top_k, targets=targets,
+    )
+
+    computed_at = timezone.now()
+    objects = [
+        relation(**{f'{source_field}_id': int(source)}, related_id=int(neighbour),
+                 score=float(score), rank=int(rank), computed_at=computed_at)
+        for source, neighbour, score, rank in zip(sources, neighbours, scores, ranks)
+    ]
+    with transaction.atomic():
+        if targets is None:
+            relation.objects.all().delete()
+        else:
+            targets = list(targets)
+            for start in range(0, len(targets), 500):
+                relation.objects.filter(**{f'{source_field}_id__in': targets[start:start + 500]}).delete()
+        relation.objects.bulk_create(objects, batch_size=1000)
+
+    # The related rails are part of the cached detail fragments
+    if targets is None:
+        fragments.bump_all(model)
+    else:
+        fragments.bump(model, targets)
+
+    updated = len(targets) if targets is not None else len(set(sources.tolist()))
+    return updated, len(objects)
@@ -0,0 +1,225 @@
+"""
+Full-text search over movies, series and episodes.
+
+Each searchable model gets a companion index table named ``<db_table>_search``
+keyed by the object's primary key:
+
+* on SQLite it is an FTS5 virtual table ranked with ``bm25``;
+* on PostgreSQL it holds a weighted ``tsvector`` behind a GIN index, ranked
+  with ``ts_rank``.
+
+Index rows are written from ``post_save``/``post_delete`` signals (see
+``movies.signals``) and can be rebuilt with ``manage.py rebuild_search_index``.
+Titles weigh more than descriptions when ranking. Other database vendors
+fall back to ``icontains`` matching.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Movie, Series, Episode
+
+
+SEARCHABLE_MODELS = (Movie, Series, Episode)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def index_table(model):
+    return f'{model._meta.db_table}_search'
+
+
+def tokenize(query):
+    return TOKEN_RE.findall((query or '').lower())
+
+
+class SQLiteBackend:
+    """FTS5 virtual tables, one per model"""
+
+    def create(self, cursor, model):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {index_table(model)} USING fts5("
+            "title, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+    def drop(self, cursor, model):
+        cursor.execute(f'DROP TABLE IF EXISTS {index_table(model)}')
+
+    def index(self, cursor, model, rows):
+        table = index_table(model)
+        cursor.executemany(f'DELETE FROM {table} WHERE rowid = %s', [(pk,) for pk, _, _ in rows])
+        cursor.executemany(f'INSERT INTO {table} (rowid, title, description) VALUES (%s, %s, %s)', rows)
+
+    def remove(self, cursor, model, pk):
+        cursor.execute(f'DELETE FROM {index_table(model)} WHERE rowid = %s', [pk])
+
+    def clear(self, cursor, model):
+        cursor.execute(f'DELETE FROM {index_table(model)}')
+
+    def match_expression(self, tokens):
+        # Quote every token so user input cannot use FTS5 syntax; the last
+        # one is a prefix so partially typed words still match.
+        terms = [f'"{token}"' for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, cursor, model, tokens, limit, within):
+        table = index_table(model)
+        sql, params = within
+        cursor.execute(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s AND rowid IN ({sql}) '
+            f'ORDER BY bm25({table}, 10.0, 1.0) LIMIT %s',
+            [self.match_expression(tokens), *params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgreSQLBackend:
+    """Weighted tsvector tables with GIN indexes, one per model"""
+
+    config = 'english'
+
+    def create(self, cursor, model):
+        table = index_table(model)
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {table} ('
+            f'object_id bigint PRIMARY KEY REFERENCES {model._meta.db_table} (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_document ON {table} USING GIN (document)')
+
+    def drop(self, cursor, model):
+        cursor.execute(f'DROP TABLE IF EXISTS {index_table(model)}')
+
+    def index(self, cursor, model, rows):
+        cursor.executemany(
+            f'INSERT INTO {index_table(model)} (object_id, document) VALUES (%s, '
+            f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+            f"setweight(to_tsvector('{self.config}', %s), 'B')) "
+            'ON CONFLICT (object_id) DO UPDATE SET document = EXCLUDED.document',
+            rows,
+        )
+
+    def remove(self, cursor, model, pk):
+        cursor.execute(f'DELETE FROM {index_table(model)} WHERE object_id = %s', [pk])
+
+    def clear(self, cursor, model):
+        cursor.execute(f'TRUNCATE {index_table(model)}')
+
+    def search(self, cursor, model, tokens, limit, within):
+        # Tokens are plain word characters, so joining them is safe.
+        query = ' & '.join(tokens) + ':*'
+        sql, params = within
+        cursor.execute(
+            f"SELECT object_id FROM {index_table(model)}, to_tsquery('{self.config}', %s) query "
+            f'WHERE document @@ query AND object_id IN ({sql}) ORDER BY ts_rank(document, query) DESC LIMIT %s',
+            [query, *params, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def get_backend():
+    """Return the index backend for the current database, or None"""
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def document_rows(objects):
+    return [(obj.pk, obj.title, obj.description) for obj in objects]
+
+
+def index_objects(model, objects):
+    """Add or refresh the index rows of ``objects``"""
+    backend = get_backend()
+    rows = document_rows(objects)
+    if backend and rows:
+        with connection.cursor() as cursor:
+            backend.index(cursor, model, rows)
+
+
+def remove_object(model, pk):
+    """Drop an object from the index"""
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, model, pk)
+
+
+def rebuild_index(model, batch_size=2000):
+    """Re-index every row of ``model``, returns the number of rows indexed"""
+    backend = get_backend()
+    if not backend:
+        return 0
+    with connection.cursor() as cursor:
+        backend.clear(cursor, model)
+    total = 0
+    queryset = model.objects.order_by('pk').only('pk', 'title', 'description')
+    batch = []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            index_objects(model, batch)
+            total += len(batch)
+            batch = []
+    index_objects(model, batch)
+    return total + len(batch)
+
+
+def ranked_ids(queryset, query, limit=None):
+    """Return primary keys of the rows of ``queryset`` matching ``query``, best match first.
+
+    The queryset's filters apply inside the index query, before ``limit``,
+    so matches outside it (drafts, other categories) never take the place
+    of matches within it.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    limit = limit or getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+    backend = get_backend()
+    if backend is None:
+        words = Q()
+        for token in tokens:
+            words &= Q(title__icontains=token) | Q(description__icontains=token)
+        return list(queryset.filter(words).values_list('pk', flat=True)[:limit])
+    within = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        return backend.search(cursor, queryset.model, tokens, limit, within)
+
+
+class SearchResults:
+    """Relevance-ordered results of a search, restricted to a queryset.
+
+    Only the matching primary keys are held in memory; objects are loaded a
+    slice at a time, so it can be handed to ``Paginator`` directly.
+    """
+
+    def __init__(self, queryset, query):
+        self.queryset = queryset
+        self.ids = ranked_ids(queryset, query)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            objects = self.queryset.in_bulk(ids)
+            return [objects[pk] for pk in ids if pk in objects]
+        return self[index:index + 1][0]
+
+
+def search(queryset, query):
+    """Filter ``queryset`` down to full-text matches of ``query``, ranked"""
+    return SearchResults(queryset, query)
@@ -0,0 +1,100 @@
+"""
+Seasons and episode navigation.
+
+Episodes belong to a Season and are numbered across their series, so the
+``(series, season, episode_number)`` index of Episode serves both ways of
+walking them. The series page lists one season at a time, a keyset page of
+``SEASON_PAGE_SIZE`` episodes (see ``movies.pagination``), and the episode
+page shows the ``EPISODE_WINDOW`` episodes on either side of the current one,
+read in a single query whose bounds come from index seeks. Neither cost
+grows with the length of the show.
+"""
+from django.conf import settings
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
+
+from .models import Season
+from .pagination import paginate
+
+
+def series_seasons(series):
+    return list(series.seasons.order_by('number'))
+
+
+def select_season(seasons, number):
+    """The season numbered ``number`` (the first one when not given); Http404 when there is none"""
+    if not number:
+        return seasons[0] if seasons else None
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        raise Http404("No such season")
+    for season in seasons:
+        if season.number == number:
+            return season
+    raise Http404("No such season")
+
+
+def season_page(series, season, cursor=None):
+    """One page of the episodes of ``season``, in order"""
+    if season is None:
+        return paginate(series.episodes.none(), None)
+    episodes = series.episodes.filter(season=season).select_related('season')
+    return paginate(episodes, cursor, getattr(settings, 'SEASON_PAGE_SIZE', 25), ('episode_number',))
+
+
+def season_context(series, number=None, cursor=None):
+    """Template variables of the series page's episode list"""
+    seasons = series_seasons(series)
+    season = select_season(seasons, number)
+    return {'seasons': seasons, 'season': season, 'episodes': season_page(series, season, cursor)}
+
+
+def episode_window(series, episode, size=None):
+    """The ``size`` episodes of ``series`` before and after ``episode``, in order"""
+    size = size or getattr(settings, 'EPISODE_WINDOW', 3)
+    siblings = series.episodes.all()
+    numbers = siblings.values('episode_number')
+    # The size-th episode on each side bounds the window, the ends of the
+    # series do when there are fewer
+    first = numbers.filter(episode_number__lt=episode.episode_number).order_by('-episode_number')[size - 1:size]
+    last = numbers.filter(episode_number__gt=episode.episode_number).order_by('episode_number')[size - 1:size]
+    final = numbers.order_by('-episode_number')[:1]
+    return list(
+        siblings.filter(
+            episode_number__gte=Coalesce(Subquery(first), Value(0)),
+            episode_number__lte=Coalesce(Subquery(last), Subquery(final)),
+        )
+        .exclude(pk=episode.pk)
+        .select_related('season')
+        .order_by('episode_number')
+    )
+
+
+def ensure_seasons(pairs):
+    """Map ``(series_id, number)`` pairs to season ids, creating the missing seasons"""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    series_ids = {series_id for series_id, _ in pairs}
+
+    def existing():
+        return {
+            (series_id, number): pk
+            for pk, series_id, number in Season.objects.filter(series_id__in=series_ids).values_list(
+                'pk', 'series_id', 'number'
+            )
+        }
+
+    found = existing()
+    missing = pairs - found.keys()
+    if missing:
+        Season.objects.bulk_create(
+            [Season(series_id=series_id, number=number) for series_id, number in sorted(missing)],
+            batch_size=500,
+            ignore_conflicts=True,  # created meanwhile by another import
+        )
+        found = existing()
+    return {pair: found[pair] for pair in pairs}
+
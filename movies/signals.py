@@ -0,0 +1,178 @@
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import autocomplete, fragments, images, search
+from .ads import invalidate_ads
+from .facets import facet_index, invalidate_facets
+from .home import invalidate_home, snapshot as home_snapshot
+from .models import Actor, Director, Category, Movie, Series, Season, Episode, Advertisement, TrendingScore
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+@receiver(post_save, sender=Episode)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Keep the full-text index in step with catalog edits"""
+    if not raw:
+        search.index_objects(sender, [instance])
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Series)
+@receiver(post_delete, sender=Episode)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_object(sender, instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Series)
+@receiver(post_delete, sender=Episode)
+def refresh_catalog_fragments(sender, instance, **kwargs):
+    """Re-render cached detail fragments of edited content"""
+    fragments.bump(sender, [instance.pk])
+    if sender is Episode:
+        # The series page lists its episodes
+        fragments.bump(Series, [instance.series_id])
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+def refresh_season_fragments(sender, instance, **kwargs):
+    """The series page lists its seasons and its episode pages show their numbers"""
+    fragments.bump(Series, [instance.series_id])
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+@receiver(m2m_changed, sender=Series.actors.through)
+def refresh_cast_fragments(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        fragments.bump(type(instance), [instance.pk])
+    elif pk_set:
+        fragments.bump(model, pk_set)
+    else:
+        fragments.bump_all(model)
+
+
+@receiver(post_save, sender=Actor)
+@receiver(post_save, sender=Director)
+def refresh_people_fragments(sender, instance, **kwargs):
+    """Names and photos of cast and directors are shown on the detail pages"""
+    fragments.bump(Movie, instance.movie_set.values_list('pk', flat=True))
+    fragments.bump(Series, instance.series_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Actor)
+@receiver(post_delete, sender=Director)
+def refresh_all_people_fragments(sender, **kwargs):
+    # The links are already gone, so the affected titles are unknown
+    fragments.bump_all(Movie)
+    fragments.bump_all(Series)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+def queue_poster_derivatives(sender, instance, raw=False, **kwargs):
+    """Have newly uploaded posters resized"""
+    if not raw:
+        images.queue_derivatives(instance.poster)
+
+
+@receiver(post_save, sender=Actor)
+@receiver(post_save, sender=Director)
+def queue_headshot_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.queue_derivatives(instance.image)
+
+
+@receiver(post_save, sender=Advertisement)
+@receiver(post_delete, sender=Advertisement)
+def refresh_ad_schedule(sender, **kwargs):
+    """Drop the cached ad schedule so the change shows up immediately"""
+    invalidate_ads()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Series)
+def refresh_home_titles(sender, instance, **kwargs):
+    """Rebuild the home page after a title is published, unpublished or a featured one edited"""
+    if instance.status == 'published' or home_snapshot.features(sender, instance.pk):
+        invalidate_home()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_home_categories(sender, **kwargs):
+    invalidate_home()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+def move_trending_category(sender, instance, raw=False, **kwargs):
+    """Keep the category copied onto the title's leaderboard row in step"""
+    if not raw:
+        TrendingScore.objects.filter(**{sender._meta.model_name: instance}).exclude(
+            category_id=instance.category_id
+        ).update(category_id=instance.category_id)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_save, sender=Series)
+def refresh_autocomplete_title(sender, instance, raw=False, **kwargs):
+    """Keep the search suggestions in step with catalog edits"""
+    if not raw:
+        autocomplete.refresh_title(sender, instance)
+
+
+@receiver(post_save, sender=Actor)
+@receiver(post_save, sender=Director)
+def refresh_autocomplete_person(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.refresh_person(sender, instance)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Series)
+@receiver(post_delete, sender=Actor)
+@receiver(post_delete, sender=Director)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    autocomplete.remove(sender, instance.pk)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Actor)
+@receiver(post_delete, sender=Actor)
+@receiver(post_save, sender=Director)
+@receiver(post_delete, sender=Director)
+def refresh_facets(sender, **kwargs):
+    """Rebuild the movie facets after a movie or the name of a facet value changes"""
+    invalidate_facets()
+
+
+@receiver(m2m_changed, sender=Movie.actors.through)
+def refresh_cast_facets(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_facets()
+
+
+@receiver(request_started, dispatch_uid='movies.warm_indexes')
+def warm_indexes(sender, **kwargs):
+    """Start building the in-memory indexes when the worker serves its first request.
+
+    Not from ``MoviesConfig.ready()``: that also runs for management
+    commands, possibly before the tables exist, and in a server's master
+    process before it forks the workers, whose copies would have no thread.
+    """
+    request_started.disconnect(dispatch_uid='movies.warm_indexes')
+    autocomplete.autocomplete.warm()
+    facet_index.warm()
@@ -0,0 +1,110 @@
+"""
+Item-to-item cosine similarity over implicit feedback, computed with NumPy.
+
+Interactions arrive as three parallel arrays (user id, item id, weight). The
+user x item matrix is never materialized: co-occurring item pairs are
+generated per user with vectorized index arithmetic, a chunk of users at a
+time, and reduced with ``np.unique``/``np.bincount``. Only the top-K
+neighbours of every item are returned.
+"""
+import numpy as np
+
+
+def _reduce(codes, values):
+    codes, inverse = np.unique(codes, return_inverse=True)
+    return codes, np.bincount(inverse, weights=values), np.bincount(inverse)
+
+
+def _chunk_pairs(u_starts, u_sizes, items, weights, target_mask):
+    """Every ordered pair of distinct items that one user interacted with"""
+    sizes_per_element = np.repeat(u_sizes, u_sizes)
+    starts_per_element = np.repeat(u_starts, u_sizes)
+    elements = starts_per_element + (np.arange(sizes_per_element.size) - np.repeat(
+        np.cumsum(u_sizes) - u_sizes, u_sizes))
+
+    total = int(sizes_per_element.sum())
+    left = np.repeat(elements, sizes_per_element)
+    offsets = np.repeat(np.cumsum(sizes_per_element) - sizes_per_element, sizes_per_element)
+    right = np.repeat(starts_per_element, sizes_per_element) + (np.arange(total) - offsets)
+
+    keep = left != right
+    if target_mask is not None:
+        keep &= target_mask[items[left]]
+    left, right = left[keep], right[keep]
+    return items[left], items[right], weights[left] * weights[right]
+
+
+def item_neighbours(user_ids, item_ids, weights, top_k=20, targets=None,
+                    max_items_per_user=500, shrinkage=5.0, chunk_pairs=2_000_000):
+    """Return ``(source, neighbour, score, rank)`` arrays of top-K neighbours.
+
+    ``targets`` limits which items get neighbours computed (for incremental
+    rebuilds); norms always use every interaction. Heavy users only
+    contribute their ``max_items_per_user`` strongest interactions, which
+    bounds the pair count. ``shrinkage`` damps scores backed by few users.
+    """
+    empty = (np.array([], dtype=np.int64),) * 2 + (np.array([]), np.array([], dtype=np.int64))
+    if len(item_ids) == 0:
+        return empty
+
+    item_values, item_idx = np.unique(np.asarray(item_ids), return_inverse=True)
+    _, user_idx = np.unique(np.asarray(user_ids), return_inverse=True)
+    n_items = item_values.size
+
+    # Sum repeated (user, item) interactions into one weight
+    codes, w, _ = _reduce(user_idx.astype(np.int64) * n_items + item_idx, np.asarray(weights, dtype=float))
+    u, i = codes // n_items, codes % n_items
+    norms = np.sqrt(np.bincount(i, weights=w * w, minlength=n_items))
+
+    # Strongest interactions first within each user, then cap per user
+    order = np.lexsort((-w, u))
+    u, i, w = u[order], i[order], w[order]
+    starts = np.flatnonzero(np.r_[True, u[1:] != u[:-1]])
+    position = np.arange(u.size) - np.repeat(starts, np.diff(np.r_[starts, u.size]))
+    keep = position < max_items_per_user
+
+    target_mask = None
+    if targets is not None:
+        target_mask = np.isin(item_values, np.asarray(list(targets)))
+        if not target_mask.any():
+            return empty
+        # Only users who touched a target item can contribute pairs
+        touched = np.zeros(u.max() + 1, dtype=bool)
+        touched[u[target_mask[i]]] = True
+        keep &= touched[u]
+    u, i, w = u[keep], i[keep], w[keep]
+    if u.size == 0:
+        return empty
+
+    starts = np.flatnonzero(np.r_[True, u[1:] != u[:-1]])
+    sizes = np.diff(np.r_[starts, u.size])
+
+    # Walk users in chunks whose pair count stays under chunk_pairs
+    codes, co, support = [], [], []
+    pair_counts = np.cumsum(sizes.astype(np.int64) ** 2)
+    begin = 0
+    while begin < starts.size:
+        base = pair_counts[begin - 1] if begin else 0
+        end = max(int(np.searchsorted(pair_counts, base + chunk_pairs, side='right')), begin + 1)
+        a, b, value = _chunk_pairs(starts[begin:end], sizes[begin:end], i, w, target_mask)
+        chunk_codes, chunk_co, chunk_support = _reduce(a * n_items + b, value)
+        codes.append(chunk_codes)
+        co.append(chunk_co)
+        support.append(chunk_support)
+        begin = end
+
+    codes, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+    co = np.bincount(inverse, weights=np.concatenate(co))
+    support = np.bincount(inverse, weights=np.concatenate(support))
+    a, b = codes // n_items, codes % n_items
+
+    score = co / (norms[a] * norms[b])
+    score *= support / (support + shrinkage)
+
+    # Keep the top_k best neighbours per source item
+    order = np.lexsort((-score, a))
+    a, b, score = a[order], b[order], score[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+    rank = np.arange(a.size) - np.repeat(starts, np.diff(np.r_[starts, a.size]))
+    keep = rank < top_k
+    return item_values[a[keep]], item_values[b[keep]], score[keep], rank[keep]
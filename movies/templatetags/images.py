@@ -0,0 +1,34 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from ..images import SIZES, VARIANTS, derivative_name, derivatives_ready, image_name, srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(image, variant, alt='', css_class='', lazy=True):
+    """``<picture>`` with WebP and JPEG derivatives of ``image``, a FieldFile or storage name.
+
+    Falls back to the original file until its derivatives exist.
+    """
+    name = image_name(image)
+    if not name:
+        return ''
+    loading = 'lazy' if lazy else 'eager'
+    if not derivatives_ready(name):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            default_storage.url(name), alt, css_class, loading,
+        )
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        srcset(name, variant, 'webp'), SIZES[variant],
+        default_storage.url(derivative_name(name, variant, VARIANTS[variant][0], 'jpg')),
+        srcset(name, variant, 'jpg'), SIZES[variant],
+        alt, css_class, loading,
+    )
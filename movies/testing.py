@@ -0,0 +1,117 @@
+"""
+Fixtures and assertions shared by the test suites of the project's apps.
+"""
+import datetime
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .models import Category, Movie, Series, Episode
+
+
+SCAN_RE = re.compile(r'SCAN (\w+)')
+
+
+def default_category():
+    return Category.objects.get_or_create(slug='drama', defaults={'name': 'Drama'})[0]
+
+
+def create_movie(number, **fields):
+    """Published movie number ``number``, in the Drama category unless ``fields`` says otherwise"""
+    if 'category' not in fields:
+        fields['category'] = default_category()
+    return Movie.objects.create(**{
+        'title': f'Movie {number}',
+        'slug': f'movie-{number}',
+        'description': 'A movie',
+        'release_date': datetime.date(2020, 1, 1),
+        'duration': 90,
+        'status': 'published',
+        **fields,
+    })
+
+
+def create_series(number, **fields):
+    """Published show number ``number``, in the Drama category unless ``fields`` says otherwise"""
+    if 'category' not in fields:
+        fields['category'] = default_category()
+    return Series.objects.create(**{
+        'title': f'Show {number}',
+        'slug': f'show-{number}',
+        'description': 'A show',
+        'release_date': datetime.date(2020, 1, 1),
+        'status': 'published',
+        **fields,
+    })
+
+
+def create_episodes(series, count):
+    """Episodes 1 to ``count`` of ``series``"""
+    return [
+        Episode.objects.create(
+            series=series,
+            episode_number=number,
+            title=f'Episode {number}',
+            slug=f'{series.slug}-episode-{number}',
+            description='An episode',
+            duration=45,
+            release_date=datetime.date(2020, 1, 1),
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+class QueryPlanTestMixin:
+    """Assertions on SQLite ``EXPLAIN QUERY PLAN`` output.
+
+    A query regresses when it scans a whole table, or when it sorts rows in
+    a temporary B-tree to return only a LIMITed page of them. Scans of the
+    small lookup tables in ``SCAN_ALLOWED`` are fine.
+    """
+
+    SCAN_ALLOWED = {'movies_category', 'movies_advertisement'}
+
+    def query_plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def plan_problems(self, sql):
+        plan = self.query_plan(sql)
+        problems = []
+        for step in plan:
+            match = SCAN_RE.match(step)
+            if match and 'USING' not in step and match.group(1) not in self.SCAN_ALLOWED:
+                problems.append(step)
+            if step.startswith('USE TEMP B-TREE FOR ORDER BY') and ' LIMIT ' in sql:
+                problems.append(step)
+        return problems
+
+    def assertIndexedQueries(self, queries):
+        for query in queries:
+            problems = self.plan_problems(query['sql'])
+            if problems:
+                self.fail(f'{problems} in query plan of:\n{query["sql"]}')
+
+    def assertIndexedView(self, url):
+        """Request ``url`` with cold caches and check the plan of every query it runs"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIndexedQueries(queries.captured_queries)
+
+    def assertSeeks(self, queryset, index):
+        """``queryset`` seeks into ``index`` rather than scanning a table or the index"""
+        with CaptureQueriesContext(connection) as queries:
+            list(queryset)
+        self.assertPlanSeeks(queries.captured_queries[-1]['sql'], index)
+
+    def assertPlanSeeks(self, sql, index):
+        plan = self.query_plan(sql)
+        self.assertTrue(
+            any(step.startswith('SEARCH') and f'INDEX {index} ' in f'{step} ' for step in plan),
+            f'{index} not searched in {plan}:\n{sql}',
+        )
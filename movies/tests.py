@@ -1,3 +1,1521 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import math
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from moviewebsite import middleware
+from moviewebsite.routers import (
+    PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinningMiddleware, replica_configured, use_primary,
+)
+from user_interactions.models import DownloadEvent, Rating, Review
+from theme import views as theme_views
+from user_interactions.ratings import rate
+
+from . import ads, autocomplete, benchmark, facets, fragments, home, images, search, signals, trending, views
+from .buffering import discard_all
+from .conditional import is_shared_page
+from .context_processors import ads_processor
+from .importer import CatalogImporter, read_records
+from .models import Advertisement, Category, Director, Actor, Movie, Series, Episode, RelatedMovie, TrendingScore
+from .pagination import KeysetPaginator, encode_cursor
+from .recommendations import build_neighbours, related_movies_for
+from .seasons import episode_window
+from .similarity import item_neighbours
+from .templatetags.images import responsive_img
+from .testing import QueryPlanTestMixin, create_episodes, create_movie, create_series
+from .view_counter import CacheViewCounter, MemoryViewCounter, apply_view_counts, flush_views, record_view
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class CatalogQueryPlanTests(QueryPlanTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        director = Director.objects.create(name='Director')
+        actor = Actor.objects.create(name='Actor')
+        for number in range(15):
+            movie = Movie.objects.create(
+                title=f'Movie {number}',
+                slug=f'movie-{number}',
+                description='A movie',
+                release_date=datetime.date(2020, 1, 1),
+                duration=90,
+                director=director,
+                category=cls.category,
+                status='published',
+            )
+            movie.actors.add(actor)
+        for number in range(8):
+            cls.series = Series.objects.create(
+                title=f'Show {number}',
+                slug=f'show-{number}',
+                description='A show',
+                release_date=datetime.date(2020, 1, 1),
+                category=cls.category,
+                status='published',
+            )
+        for number in range(1, 4):
+            Episode.objects.create(
+                series=cls.series,
+                episode_number=number,
+                title=f'Episode {number}',
+                slug=f'show-7-episode-{number}',
+                description='An episode',
+                duration=45,
+                release_date=datetime.date(2020, 1, 1),
+            )
+        cls.user = User.objects.create_user('viewer')
+
+    def test_movie_list(self):
+        self.assertIndexedView('/movies/')
+        self.assertIndexedView(f'/movies/?category={self.category.pk}')
+
+    def test_movie_detail(self):
+        self.assertIndexedView('/movies/movie-1/')
+        self.client.force_login(self.user)
+        self.assertIndexedView('/movies/movie-1/')
+
+    def test_series_list(self):
+        self.assertIndexedView('/movies/series/')
+
+    def test_series_detail(self):
+        self.assertIndexedView('/movies/series/show-7/')
+        self.assertIndexedView('/movies/series/show-7/?season=1')
+        self.assertIndexedView('/movies/series/show-7/episode/2/')
+
+    def test_published_indexes(self):
+        for model in (Movie, Series):
+            name = model._meta.model_name
+            published = model.objects.filter(status='published')
+            self.assertSeeks(published.filter(category=self.category).order_by('-created_at', '-id')[:13],
+                             f'{name}_category_published_idx')
+
+    def test_keyset_pages_seek(self):
+        for model in (Movie, Series):
+            paginator = KeysetPaginator(model.objects.filter(status='published'), 5)
+            first = paginator.get_page()
+            with CaptureQueriesContext(connection) as queries:
+                second = paginator.get_page(first.next_cursor)
+                paginator.get_page(second.previous_cursor)
+            for query in queries.captured_queries:
+                self.assertPlanSeeks(query['sql'], f'{model._meta.model_name}_published_idx')
+
+
+class CatalogPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        cls.movie = create_movie(0, category=cls.category)
+        cls.series = create_series(0, category=cls.category)
+        cls.episode = create_episodes(cls.series, 1)[0]
+
+    def setUp(self):
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def test_absolute_urls(self):
+        for obj in (self.category, self.movie, self.series, self.episode, self.episode.season):
+            with self.subTest(obj=obj):
+                self.assertEqual(self.client.get(obj.get_absolute_url()).status_code, 200)
+
+    def test_fixed_routes_before_movie_slugs(self):
+        # Movies named like the fixed routes must not hide them
+        for slug in ('search', 'category', 'series', 'autocomplete'):
+            create_movie(slug, slug=slug, category=self.category)
+        for url, view in [
+            ('/movies/search/?q=movie', 'search'),
+            ('/movies/category/', 'categories_list'),
+            ('/movies/series/', 'series_list'),
+            ('/movies/autocomplete/?q=mo', 'autocomplete'),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.resolver_match.url_name, view)
+
+
+class ViewCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Drama', slug='drama')
+        cls.movies = [create_movie(number, category=category) for number in range(3)]
+        cls.series = create_series(0, category=category)
+
+    def setUp(self):
+        cache.clear()
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def views(self, obj):
+        obj.refresh_from_db(fields=['views_count'])
+        return obj.views_count
+
+    def test_record_view(self):
+        first, second, _ = self.movies
+        for obj in (first, first, second, self.series):
+            record_view(obj)
+        flush_views()
+        self.assertEqual([self.views(first), self.views(second), self.views(self.series)], [2, 1, 1])
+
+    def test_views_wait_for_flush(self):
+        counter = MemoryViewCounter(flush_interval=3600)
+        counter.add(('movies.movie', self.movies[0].pk), 1)
+        self.assertEqual(self.views(self.movies[0]), 0)
+        counter.flush()
+        self.assertEqual(self.views(self.movies[0]), 1)
+
+    def test_apply_view_counts(self):
+        first, second, third = self.movies
+        with CaptureQueriesContext(connection) as queries:
+            apply_view_counts({
+                ('movies.movie', first.pk): 3,
+                ('movies.movie', second.pk): 3,
+                ('movies.movie', third.pk): 0,
+                ('movies.series', self.series.pk): 1,
+            })
+        # One UPDATE per model and count
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual([self.views(movie) for movie in self.movies], [3, 3, 0])
+        self.assertEqual(self.views(self.series), 1)
+
+    def test_shared_counts_written_once(self):
+        key = ('movies.movie', self.movies[0].pk)
+        workers = [CacheViewCounter(flush_interval=3600), CacheViewCounter(flush_interval=3600)]
+        for worker in workers:
+            worker.add(key, 1)
+            worker.add(key, 1)
+        for worker in workers:
+            worker.flush()
+        self.assertEqual(self.views(self.movies[0]), 4)
+
+    def test_shared_count_claimed_once(self):
+        worker, other = CacheViewCounter(), CacheViewCounter()
+        cache_key = worker.cache_key(('movies.movie', self.movies[0].pk))
+        cache.set(cache_key, 5, timeout=None)
+        claims = []
+        real_decr = cache.decr
+
+        def saturating_decr(key, delta=1):
+            # The other worker flushes between this one's read and its
+            # decrement, against a cache whose decr stops at zero like Memcached's
+            claims.append(other.claim(cache_key))
+            return max(0, real_decr(key, delta))
+
+        with mock.patch.object(cache, 'decr', saturating_decr):
+            claims.append(worker.claim(cache_key))
+        self.assertEqual(claims, [None, 5])
+        self.assertEqual(cache.get(cache_key), 0)
+        # Released for the next flush
+        cache.set(cache_key, 2, timeout=None)
+        self.assertEqual(other.claim(cache_key), 2)
+
+    def test_busy_counter_flushed_later(self):
+        key = ('movies.movie', self.movies[0].pk)
+        worker, other = CacheViewCounter(flush_interval=3600), CacheViewCounter(flush_interval=3600)
+        worker.add(key, 1)
+        other.add(key, 2)
+        real_decr = cache.decr
+
+        def interleaved_decr(key, delta=1):
+            other.flush()  # finds the counter locked
+            return real_decr(key, delta)
+
+        with mock.patch.object(cache, 'decr', interleaved_decr):
+            worker.flush()
+        self.assertEqual(self.views(self.movies[0]), 3)
+        self.assertEqual(other.pending(), {key: True})
+        other.add(key, 1)
+        other.flush()
+        self.assertEqual(self.views(self.movies[0]), 4)
+
+
+class TrendingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        cls.movies = [create_movie(number, category=cls.category) for number in range(3)]
+        cls.series = create_series(0, category=cls.category)
+        cls.episodes = create_episodes(cls.series, 2)
+
+    def setUp(self):
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def score(self, **title):
+        return TrendingScore.objects.get(**title).score
+
+    def test_log_add(self):
+        self.assertIsNone(trending.log_add(None, None))
+        self.assertEqual(trending.log_add(None, 1.5), 1.5)
+        self.assertAlmostEqual(trending.log_add(math.log(2), math.log(3)), math.log(5))
+        # Stored sums are far too large to exponentiate
+        self.assertAlmostEqual(trending.log_add(5000.0, 5000.0), 5000.0 + math.log(2))
+
+    @override_settings(TRENDING_HALF_LIFE_HOURS=48)
+    def test_decay_ordering(self):
+        now = timezone.now()
+        old, recent, older = self.movies
+        trending.write_scores({
+            ('movies.movie', old.pk): trending.log_contribution(1.0, now - datetime.timedelta(hours=48)),
+            ('movies.movie', recent.pk): trending.log_contribution(0.6, now),
+            ('movies.movie', older.pk): trending.log_contribution(3.0, now - datetime.timedelta(hours=96)),
+        })
+        titles = trending.top_titles()
+        self.assertEqual(titles, [older, recent, old])
+        self.assertAlmostEqual(titles[0].trending_score, 0.75, places=3)
+        self.assertAlmostEqual(titles[2].trending_score, 0.5, places=3)
+        self.assertEqual(trending.top_titles(1, category=self.category), [older])
+
+    def test_write_scores_merges(self):
+        movie = self.movies[0]
+        trending.write_scores({('movies.movie', movie.pk): math.log(2)})
+        trending.write_scores({
+            ('movies.movie', movie.pk): math.log(3),
+            # Episodes count for their series
+            ('movies.episode', self.episodes[0].pk): math.log(1),
+            ('movies.episode', self.episodes[1].pk): math.log(4),
+            ('movies.series', self.series.pk): math.log(2),
+        })
+        self.assertEqual(TrendingScore.objects.count(), 2)
+        self.assertAlmostEqual(self.score(movie=movie), math.log(5))
+        self.assertAlmostEqual(self.score(series=self.series), math.log(7))
+        self.assertEqual(TrendingScore.objects.get(series=self.series).category, self.category)
+
+    def test_record_events(self):
+        movie = self.movies[0]
+        now = timezone.now()
+        trending.record_events([
+            ('movies.movie', movie.pk, 'view', 2, now),
+            ('movies.movie', movie.pk, 'rating', 0, now),  # weightless, dropped
+        ])
+        self.assertEqual(TrendingScore.objects.count(), 0)
+        trending.flush_trending()
+        self.assertAlmostEqual(self.score(movie=movie), trending.log_contribution(2 * trending.weight('view'), now))
+
+    def test_rebuild_scores(self):
+        movie, stale, _ = self.movies
+        trending.write_scores({('movies.movie', movie.pk): 100.0, ('movies.movie', stale.pk): 100.0})
+        user = User.objects.create_user('rater')
+        rating = Rating.objects.create(user=user, movie=movie, rating=5)
+        self.assertEqual(trending.rebuild_scores(), 1)
+        self.assertEqual(list(TrendingScore.objects.values_list('movie', flat=True)), [movie.pk])
+        self.assertAlmostEqual(
+            self.score(movie=movie), trending.log_contribution(trending.weight('rating'), rating.created_at)
+        )
+
+
+    def test_rebuild_counts_download_starts(self):
+        movie = self.movies[0]
+        user = User.objects.create_user('downloader')
+        now = timezone.now()
+        for range_start, range_end in [(None, None), (0, 99), (100, 199), (100, None), (None, 24)]:
+            DownloadEvent.objects.create(
+                user=user, movie=movie, created_at=now, range_start=range_start, range_end=range_end
+            )
+        trending.rebuild_scores()
+        self.assertAlmostEqual(
+            self.score(movie=movie), trending.log_contribution(2 * trending.weight('download'), now)
+        )
+
+class AutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Drama', slug='drama')
+        cls.director = Director.objects.create(name='Morgan Stone')
+        cls.movies = [
+            create_movie(0, title='Mountain Road', views_count=5, category=category, director=cls.director),
+            create_movie(1, title='The Mountain', views_count=50, category=category),
+            create_movie(2, title='Moonrise', views_count=1, category=category),
+        ]
+
+    def setUp(self):
+        autocomplete.invalidate_autocomplete()
+        self.addCleanup(autocomplete.invalidate_autocomplete)
+
+    def labels(self, query):
+        return [entry.label for entry in autocomplete.suggest(query)]
+
+    def test_suggest(self):
+        # Names starting with the query first, then by views
+        self.assertEqual(self.labels('moun'), ['Mountain Road', 'The Mountain'])
+        self.assertEqual(self.labels('mo'), ['Morgan Stone', 'Mountain Road', 'Moonrise', 'The Mountain'])
+        self.assertEqual(self.labels('road moun'), ['Mountain Road'])
+        self.assertEqual(self.labels('m'), [])
+
+    def test_updates(self):
+        self.labels('mo')
+        movie = self.movies[2]
+        movie.title = 'Moonlight'
+        movie.save()
+        self.assertEqual(self.labels('moon'), ['Moonlight'])
+        movie.status = 'draft'
+        movie.save()
+        self.assertEqual(self.labels('moon'), [])
+
+    @override_settings(INDEX_BACKGROUND_BUILD=True)
+    def test_background_build(self):
+        index = autocomplete.Autocomplete()
+        released = threading.Event()
+
+        def entries(*titles):
+            def load():
+                released.wait(5)
+                return {
+                    ('movie', pk): autocomplete.make_entry('movie', title, '/', 0) for pk, title in enumerate(titles)
+                }
+            return load
+
+        with mock.patch('movies.autocomplete.load_entries', entries('Mountain Road')):
+            # Nothing to serve until the first build is ready
+            self.assertEqual(index.suggest('moun', 5), [])
+            released.set()
+            index.wait()
+        self.assertEqual([entry.label for entry in index.suggest('moun', 5)], ['Mountain Road'])
+
+        released.clear()
+        index.invalidate()
+        with mock.patch('movies.autocomplete.load_entries', entries('Mountain Road', 'Moonrise')):
+            # The previous index answers while the next one is built
+            self.assertEqual([entry.label for entry in index.suggest('mo', 5)], ['Mountain Road'])
+            # An edit made meanwhile is kept by the new index
+            index.update(('movie', 2), autocomplete.make_entry('movie', 'Moonlight', '/', 0))
+            released.set()
+            index.wait()
+        self.assertEqual(
+            sorted(entry.label for entry in index.suggest('mo', 5)), ['Moonlight', 'Moonrise', 'Mountain Road']
+        )
+
+
+    def test_warm(self):
+        index = autocomplete.Autocomplete()
+        entries = {('movie', 1): autocomplete.make_entry('movie', 'Mountain Road', '/', 0)}
+        with mock.patch('movies.autocomplete.load_entries', return_value=entries) as load:
+            # Tests build on the request
+            index.warm()
+            self.assertFalse(index.built())
+            with override_settings(INDEX_BACKGROUND_BUILD=True):
+                index.warm()
+                index.wait()
+                self.assertEqual([entry.label for entry in index.suggest('moun', 5)], ['Mountain Road'])
+                # Current already
+                index.warm()
+                index.wait()
+        self.assertEqual(load.call_count, 1)
+
+    def test_warm_on_first_request(self):
+        request_started.connect(signals.warm_indexes, dispatch_uid='movies.warm_indexes')
+        self.addCleanup(request_started.disconnect, dispatch_uid='movies.warm_indexes')
+        with mock.patch.object(autocomplete.autocomplete, 'warm') as warm_suggestions:
+            with mock.patch.object(facets.facet_index, 'warm') as warm_facets:
+                self.client.get('/about/')
+                self.client.get('/about/')
+        warm_suggestions.assert_called_once_with()
+        warm_facets.assert_called_once_with()
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama = Category.objects.create(name='Drama', slug='drama')
+        cls.comedy = Category.objects.create(name='Comedy', slug='comedy')
+        cls.directors = [Director.objects.create(name=name) for name in ('Ann Lee', 'Bo Park')]
+        cls.movies = [
+            create_movie(number, category=category, release_date=datetime.date(year, 1, 1), duration=duration,
+                         director=director, rating_sum=rating_sum, rating_count=rating_count)
+            for number, (category, year, duration, director, rating_sum, rating_count) in enumerate([
+                (cls.drama, 2001, 80, cls.directors[0], 5, 1),
+                (cls.drama, 2005, 100, cls.directors[1], 6, 2),
+                (cls.drama, 2012, 130, None, 0, 0),
+                (cls.comedy, 2003, 95, cls.directors[0], 8, 2),
+                (cls.comedy, 2015, 160, None, 0, 0),
+                (cls.comedy, 2016, 85, None, 2, 1),
+            ])
+        ]
+
+    def setUp(self):
+        facets.invalidate_facets()
+        self.addCleanup(facets.invalidate_facets)
+
+    def browse(self, **selected):
+        return facets.browse_movies({name: [str(value) for value in values] for name, values in selected.items()})
+
+    def test_counts(self):
+        browse = self.browse(category=[self.drama.pk], duration=['short', 'standard'])
+        counts = {name: dict(values) for name, values in browse.counts.items()}
+        self.assertEqual(browse.matches.bit_count(), 2)
+        # Each facet counts with every picked facet but its own
+        self.assertEqual(counts['category'], {str(self.comedy.pk): 2, str(self.drama.pk): 2})
+        self.assertEqual(counts['duration'], {'short': 1, 'standard': 1, 'long': 1, 'epic': 0})
+        self.assertEqual(counts['decade'], {'2000': 2, '2010': 0})
+        self.assertEqual(counts['director'], {str(self.directors[0].pk): 1, str(self.directors[1].pk): 1})
+
+    def test_values_of_a_facet_are_alternatives(self):
+        browse = self.browse(decade=[2000, 2010], director=[self.directors[0].pk])
+        self.assertEqual(browse.matches.bit_count(), 2)
+        self.assertEqual(dict(browse.counts['decade']), {'2000': 2, '2010': 0})
+
+    def test_results_pages(self):
+        queryset = Movie.objects.filter(status='published')
+        newest_first = self.movies[::-1]
+        results = self.browse().results(queryset)
+        self.assertEqual(len(results), 6)
+        for start in (0, 2, 4):
+            self.assertEqual(results[start:start + 2], newest_first[start:start + 2])
+        self.assertEqual(results[1], newest_first[1])
+        results = self.browse(category=[self.drama.pk]).results(queryset)
+        self.assertEqual(results[1:], [self.movies[1], self.movies[0]])
+        # Best rated first, unrated last
+        results = facets.browse_movies({}, rating_order=True).results(queryset)
+        self.assertEqual(results[:6], [self.movies[i] for i in (0, 3, 1, 5, 4, 2)])
+        # Movies unpublished since the index was built are left out
+        Movie.objects.filter(pk=newest_first[0].pk).update(status='draft')
+        self.assertEqual(self.browse().results(queryset)[0:2], [newest_first[1]])
+
+    @override_settings(FACET_PEOPLE_LIMIT=1)
+    def test_label_of_unlisted_person(self):
+        index = facets.facet_index.get()
+        labels = index.labels['director']
+        other = str(self.directors[1].pk)
+        self.assertNotIn(other, labels)
+        self.assertEqual(index.label('director', other), 'Bo Park')
+        # Replaced rather than changed under the requests reading it
+        self.assertNotIn(other, labels)
+        self.assertIn(other, index.labels['director'])
+
+    @override_settings(INDEX_BACKGROUND_BUILD=True)
+    def test_background_build(self):
+        cache = facets.FacetIndexCache()
+        released = threading.Event()
+        builds = iter(['first', 'second'])
+
+        def build():
+            released.wait(5)
+            return next(builds)
+
+        with mock.patch('movies.facets.FacetIndex', build):
+            # The first request waits for an index
+            released.set()
+            self.assertEqual(cache.get(), 'first')
+            released.clear()
+            cache.invalidate()
+            # Later ones use the previous index while the next is built
+            self.assertEqual(cache.get(), 'first')
+            released.set()
+            cache.wait()
+            self.assertEqual(cache.get(), 'second')
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        cls.road = create_movie(0, title='Mountain Road', description='Two friends drive north', category=cls.category)
+        cls.lake = create_movie(1, title='The Lake', description='A mountain lake in winter', category=cls.category)
+        cls.cafe = create_movie(2, title='Café Nights', description='Coffee and jazz', category=cls.category)
+
+    def titles(self, query, queryset=None):
+        queryset = queryset if queryset is not None else Movie.objects.filter(status='published')
+        return [movie.title for movie in search.search(queryset, query)[:10]]
+
+    def test_matching(self):
+        self.assertEqual(self.titles('road'), ['Mountain Road'])
+        # The last word may be typed halfway, accents do not matter
+        self.assertEqual(self.titles('mountain ro'), ['Mountain Road'])
+        self.assertEqual(self.titles('cafe'), ['Café Nights'])
+        self.assertEqual(self.titles('nothing'), [])
+        self.assertEqual(self.titles('   '), [])
+        # Query syntax is taken as words
+        self.assertEqual(self.titles('road OR "lake* NEAR('), [])
+
+    def test_ranking(self):
+        # A title match weighs more than a description match
+        self.assertEqual(self.titles('mountain'), ['Mountain Road', 'The Lake'])
+
+    def test_signals_update_index(self):
+        self.road.title = 'Desert Road'
+        self.road.save()
+        self.assertEqual(self.titles('desert'), ['Desert Road'])
+        self.assertEqual(self.titles('mountain'), ['The Lake'])
+        self.lake.delete()
+        self.assertEqual(self.titles('mountain'), [])
+        self.assertEqual(search.rebuild_index(Movie), 2)
+        self.assertEqual(self.titles('desert'), ['Desert Road'])
+
+    @override_settings(SEARCH_MAX_RESULTS=2)
+    def test_filters_apply_before_limit(self):
+        # Drafts rank best but must not crowd out the published match
+        for number in range(3, 6):
+            create_movie(number, title=f'Mountain Mountain {number}', category=self.category, status='draft')
+        self.assertEqual(self.titles('mountain'), ['Mountain Road', 'The Lake'])
+        other = Category.objects.create(name='Comedy', slug='comedy')
+        Movie.objects.filter(pk=self.lake.pk).update(category=other)
+        self.assertEqual(self.titles('mountain', Movie.objects.filter(category=other)), ['The Lake'])
+
+    def test_search_page(self):
+        series = create_series(0, title='Mountain Rescue', category=self.category)
+        create_episodes(series, 1)
+        create_episodes(create_series(1, title='Mountain Drafts', category=self.category, status='draft'), 1)
+        response = self.client.get('/movies/search/', {'q': 'mountain'})
+        self.assertEqual([movie.title for movie in response.context['movies']], ['Mountain Road', 'The Lake'])
+        self.assertEqual([show.title for show in response.context['series']], ['Mountain Rescue'])
+        response = self.client.get('/movies/search/', {'q': 'episode'})
+        self.assertEqual([episode.series for episode in response.context['episodes']], [series])
+
+
+class AdTests(TestCase):
+
+    def setUp(self):
+        ads.invalidate_ads()
+        self.addCleanup(ads.invalidate_ads)
+        self.now = timezone.now()
+
+    def create_ad(self, title, start, end, **fields):
+        return Advertisement.objects.create(**{
+            'title': title,
+            'ad_type': 'banner',
+            'content': 'Buy now',
+            'start_date': self.now + start,
+            'end_date': self.now + end,
+            **fields,
+        })
+
+    def live(self, resolver, later=datetime.timedelta()):
+        return [ad.title for ad in resolver.active_ads(self.now + later)]
+
+    def test_boundaries(self):
+        hour = datetime.timedelta(hours=1)
+        self.create_ad('Now', -hour, hour / 2)
+        self.create_ad('Later', hour, 2 * hour)
+        self.create_ad('Inactive', -hour, hour, is_active=False)
+        self.create_ad('Over', -2 * hour, -hour)
+        resolver = ads.AdResolver()
+        self.assertEqual(self.live(resolver), ['Now'])
+        # Read from memory until the schedule gets too old
+        with self.assertNumQueries(0):
+            self.assertEqual(self.live(resolver, hour / 2), ['Now'])  # end_date is inclusive
+            self.assertEqual(self.live(resolver, hour / 2 + datetime.timedelta(microseconds=1)), [])
+            self.assertEqual(self.live(resolver, hour), ['Later'])
+            self.assertEqual(self.live(resolver, 2 * hour + datetime.timedelta(seconds=1)), [])
+
+    def test_no_queries_in_steady_state(self):
+        self.create_ad('Now', -datetime.timedelta(hours=1), datetime.timedelta(hours=1))
+        request = RequestFactory().get('/')
+        context = ads_processor(request)
+        self.assertEqual([ad.title for ad in context['active_ads']], ['Now'])
+        with self.assertNumQueries(0):
+            context = ads_processor(request)
+            ads.resolver.version()
+        self.assertEqual(list(context['active_ads_by_type']), ['banner'])
+        self.client.get('/movies/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/movies/').status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if 'movies_advertisement' in query['sql']])
+
+    def test_admin_save_invalidates(self):
+        self.assertEqual(self.live(ads.resolver), [])
+        version = ads.resolver.version(self.now)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        start, end = self.now - datetime.timedelta(hours=1), self.now + datetime.timedelta(hours=1)
+        response = self.client.post('/admin/movies/advertisement/add/', {
+            'title': 'Fresh',
+            'ad_type': 'banner',
+            'content': 'Buy now',
+            'url': '',
+            'start_date_0': start.strftime('%Y-%m-%d'),
+            'start_date_1': start.strftime('%H:%M:%S'),
+            'end_date_0': end.strftime('%Y-%m-%d'),
+            'end_date_1': end.strftime('%H:%M:%S'),
+            'is_active': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.live(ads.resolver), ['Fresh'])
+        self.assertNotEqual(ads.resolver.version(self.now), version)
+        Advertisement.objects.get(title='Fresh').delete()
+        self.assertEqual(self.live(ads.resolver), [])
+
+
+class SimilarityTests(SimpleTestCase):
+
+    def brute_force(self, users, items, weights, top_k, shrinkage):
+        """Top-K neighbours from the dense user x item matrix"""
+        user_values, item_values = sorted(set(users)), sorted(set(items))
+        matrix = np.zeros((len(user_values), len(item_values)))
+        for user, item, weight in zip(users, items, weights):
+            matrix[user_values.index(user), item_values.index(item)] += weight
+        norms = np.linalg.norm(matrix, axis=0)
+        expected = {}
+        for a, source in enumerate(item_values):
+            scores = []
+            for b, neighbour in enumerate(item_values):
+                support = np.count_nonzero(matrix[:, a] * matrix[:, b])
+                if a != b and support:
+                    cosine = matrix[:, a] @ matrix[:, b] / (norms[a] * norms[b])
+                    scores.append((cosine * support / (support + shrinkage), neighbour))
+            expected[source] = [(neighbour, score) for score, neighbour in sorted(scores, reverse=True)[:top_k]]
+        return expected
+
+    def neighbours(self, *args, **kwargs):
+        found = {}
+        sources, neighbours, scores, ranks = item_neighbours(*args, **kwargs)
+        for source, neighbour, score, rank in zip(sources, neighbours, scores, ranks):
+            found.setdefault(int(source), []).append((int(rank), int(neighbour), float(score)))
+        return {source: [(neighbour, score) for _, neighbour, score in sorted(rows)] for source, rows in found.items()}
+
+    def assertNeighbours(self, found, expected):
+        self.assertEqual(set(found), {source for source, rows in expected.items() if rows})
+        for source, rows in found.items():
+            self.assertEqual([neighbour for neighbour, _ in rows], [neighbour for neighbour, _ in expected[source]])
+            for (_, score), (_, expected_score) in zip(rows, expected[source]):
+                self.assertAlmostEqual(score, expected_score)
+
+    def test_top_k_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        users = rng.integers(0, 40, 400)
+        items = rng.integers(100, 130, 400)  # ids need not start at zero
+        weights = rng.uniform(0.1, 1.0, 400)  # repeated pairs add up
+        expected = self.brute_force(users.tolist(), items.tolist(), weights.tolist(), top_k=5, shrinkage=5.0)
+        # Tiny chunks walk the users a few at a time
+        for chunk_pairs in (2_000_000, 50):
+            with self.subTest(chunk_pairs=chunk_pairs):
+                found = self.neighbours(users, items, weights, top_k=5, chunk_pairs=chunk_pairs)
+                self.assertNeighbours(found, expected)
+        # Targets only limit whose neighbours are computed
+        found = self.neighbours(users, items, weights, top_k=5, targets={100, 101})
+        self.assertEqual(set(found), {100, 101})
+        self.assertNeighbours(found, {source: expected[source] for source in (100, 101)})
+
+    def test_empty(self):
+        self.assertEqual(self.neighbours([], [], []), {})
+        self.assertEqual(self.neighbours([1, 2], [10, 11], [1.0, 1.0]), {})  # nothing in common
+        self.assertEqual(self.neighbours([1], [10], [1.0], targets={99}), {})
+
+
+class RecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.drama = Category.objects.create(name='Drama', slug='drama')
+        comedy = Category.objects.create(name='Comedy', slug='comedy')
+        cls.movies = [create_movie(number, category=cls.drama) for number in range(4)]
+        cls.cold = create_movie(4, category=comedy)
+        cls.cold_peer = create_movie(5, category=comedy)
+        cls.users = [User.objects.create_user(f'viewer{number}') for number in range(3)]
+
+    def rate(self, user, movie, stars):
+        Rating.objects.create(user=self.users[user], movie=self.movies[movie], rating=stars)
+
+    def related(self, movie):
+        return [related.pk for related in related_movies_for(movie)]
+
+    def test_build_and_incremental_rebuild(self):
+        first, second, third, fourth = self.movies
+        self.rate(0, 0, 5)
+        self.rate(0, 1, 5)
+        self.rate(1, 0, 4)
+        self.rate(1, 1, 4)
+        self.rate(1, 2, 1)
+        self.assertEqual(build_neighbours('movie'), (3, 6))
+        self.assertEqual(self.related(first), [second.pk, third.pk])
+        self.assertEqual(self.related(third), [first.pk, second.pk])
+        # Nothing new, nothing to do
+        self.assertEqual(build_neighbours('movie', incremental=True), (0, 0))
+
+        # Only titles with new interactions are recomputed
+        self.rate(2, 2, 5)
+        self.rate(2, 3, 5)
+        items, _ = build_neighbours('movie', incremental=True)
+        self.assertEqual(items, 2)
+        self.assertEqual(self.related(fourth), [third.pk])
+        self.assertEqual(self.related(third)[0], fourth.pk)
+        stale = RelatedMovie.objects.filter(movie=first).values_list('computed_at', flat=True)
+        self.assertEqual(len(set(stale)), 1)
+        self.assertLess(stale[0], RelatedMovie.objects.get(movie=fourth).computed_at)
+
+    def test_cold_items_fall_back_to_category(self):
+        self.rate(0, 0, 5)
+        self.rate(0, 1, 5)
+        build_neighbours('movie')
+        self.assertEqual(self.related(self.cold), [self.cold_peer.pk])
+        # Unpublished neighbours are not shown, which can leave none
+        Movie.objects.filter(pk=self.movies[1].pk).update(status='draft')
+        self.assertCountEqual(self.related(self.movies[0]), [self.movies[2].pk, self.movies[3].pk])
+
+
+class FragmentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Director.objects.create(name='Ann Lee')
+        cls.actor = Actor.objects.create(name='Bo Park')
+        cls.movie = create_movie(0, director=cls.director)
+        cls.movie.actors.add(cls.actor)
+        cls.other = create_movie(1)
+        cls.series = create_series(0)
+        cls.episode, = create_episodes(cls.series, 1)
+        cls.users = [User.objects.create_user(f'viewer{number}') for number in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBumps(self, change, *bumped, kept=()):
+        before = {obj: fragments.object_version(obj) for obj in (*bumped, *kept)}
+        change()
+        for obj in bumped:
+            self.assertNotEqual(fragments.object_version(obj), before[obj], obj)
+        for obj in kept:
+            self.assertEqual(fragments.object_version(obj), before[obj], obj)
+
+    def test_saves_bump_versions(self):
+        self.assertBumps(self.movie.save, self.movie, kept=[self.other, self.series])
+        self.assertBumps(self.series.save, self.series, kept=[self.movie])
+        # The series page lists its episodes
+        self.assertBumps(self.episode.save, self.episode, self.series, kept=[self.movie])
+        # People are shown on the pages of their titles
+        self.assertBumps(self.actor.save, self.movie, kept=[self.other])
+        self.assertBumps(self.director.save, self.movie, kept=[self.other])
+        self.assertBumps(lambda: self.other.actors.add(self.actor), self.other, kept=[self.series])
+
+    def test_reviews_bump_versions(self):
+        self.assertBumps(
+            lambda: Review.objects.create(user=self.users[0], movie=self.movie, title='Good', content='Text'),
+            self.movie,
+            kept=[self.other],
+        )
+        self.assertBumps(
+            lambda: Review.objects.create(user=self.users[0], episode=self.episode, title='Good', content='Text'),
+            self.episode,
+            kept=[self.movie],
+        )
+
+    def test_personal_parts_not_cached(self):
+        Rating.objects.create(user=self.users[0], movie=self.movie, rating=5)
+        self.client.force_login(self.users[0])
+        response = self.client.get('/movies/movie-0/')
+        self.assertContains(response, 'justify-center text-yellow-400"', count=5)
+        version = response.context['fragment_version']
+        cached = [
+            caches['default'].get(make_template_fragment_key(name, [self.movie.pk, version]))
+            for name in ('movie_header', 'movie_body', 'movie_reviews', 'movie_related')
+        ]
+        self.assertTrue(all(cached))
+        for html in cached:
+            self.assertNotIn('csrfmiddlewaretoken', html)
+            self.assertNotIn('Rate this movie', html)
+        # Another user gets the cached fragments with their own rating form
+        self.client.force_login(self.users[1])
+        response = self.client.get('/movies/movie-0/')
+        self.assertEqual(response.context['fragment_version'], version)
+        self.assertNotContains(response, 'justify-center text-yellow-400"')
+        self.assertContains(response, 'Rate this movie')
+
+
+class HomeSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        cls.user = User.objects.create_user('viewer')
+
+    def setUp(self):
+        home.invalidate_home()
+        self.addCleanup(home.invalidate_home)
+
+    def anonymous_request(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    def test_anonymous_from_snapshot(self):
+        page = self.client.get('/').content
+        self.assertIn(b'Movie 0', page)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/').content, page)
+        # No signal, so the snapshot still shows the old title
+        Movie.objects.filter(pk=self.movie.pk).update(title='Renamed')
+        self.assertEqual(self.client.get('/').content, page)
+
+    def test_logged_in_bypasses_page(self):
+        anonymous = self.client.get('/').content
+        self.client.force_login(self.user)
+        response = self.client.get('/')
+        self.assertContains(response, 'Welcome, viewer')
+        self.assertContains(response, 'Movie 0')
+        # Nor was the personal page kept for anonymous visitors
+        self.client.logout()
+        self.assertEqual(self.client.get('/').content, anonymous)
+
+    def test_messages_bypass_page(self):
+        request = self.anonymous_request()
+        self.assertTrue(is_shared_page(request))
+        anonymous = theme_views.home(request).content
+
+        request = self.anonymous_request()
+        messages.info(request, 'Signed out')
+        self.assertFalse(is_shared_page(request))
+        response = theme_views.home(request)
+        self.assertContains(response, 'Signed out')
+        # The shared page did not pick the message up
+        self.assertEqual(theme_views.home(self.anonymous_request()).content, anonymous)
+
+    def test_publishing_rebuilds(self):
+        context = home.home_context()
+        draft = create_movie(1, status='draft')
+        self.assertIs(home.home_context(), context)
+
+        draft.status = 'published'
+        draft.save()
+        self.assertContains(self.client.get('/'), 'Movie 1')
+        # Unpublishing a featured title drops it again
+        draft.status = 'draft'
+        draft.save()
+        self.assertNotContains(self.client.get('/'), 'Movie 1')
+
+    def test_category_change_rebuilds(self):
+        self.assertNotContains(self.client.get('/'), 'Comedy')
+        category = Category.objects.create(name='Comedy', slug='comedy')
+        self.assertContains(self.client.get('/'), 'Comedy')
+        category.delete()
+        self.assertNotContains(self.client.get('/'), 'Comedy')
+
+    @override_settings(HOME_SNAPSHOT_MAX_AGE=0)
+    def test_max_age(self):
+        context = home.home_context()
+        self.assertIsNot(home.home_context(), context)
+
+class CursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Drama', slug='drama')
+        for number in range(15):
+            create_movie(number, category=category)
+        create_episodes(create_series(0, category=category), 30)
+
+    def test_pages(self):
+        paginator = KeysetPaginator(Movie.objects.all(), 6)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual(len(third), 3)
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.get_page(second.previous_cursor)), list(first))
+        titles = [movie.title for page in (first, second, third) for movie in page]
+        self.assertEqual(len(set(titles)), 15)
+
+    def test_bad_cursors_show_first_page(self):
+        cursors = [
+            encode_cursor('n', ['notadate', 'x']),
+            encode_cursor('p', ['x']),
+            encode_cursor('n', ['x', 'notadate', 1]),
+            encode_cursor('n', [None, None]),
+            encode_cursor('n', [[1], {'a': 1}]),
+            'garbage',
+        ]
+        pages = [
+            ('/movies/', {}),
+            ('/movies/', {'sort': 'rating'}),
+            ('/api/movies/', {}),
+            ('/movies/series/show-0/', {'season': 1}),
+        ]
+        for url, params in pages:
+            for cursor in cursors:
+                with self.subTest(url=url, params=params, cursor=cursor):
+                    response = self.client.get(url, {**params, 'cursor': cursor})
+                    self.assertEqual(response.status_code, 200)
+
+
+class SeasonTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        cls.series = create_series(0, category=cls.category)
+        cls.episodes = create_episodes(cls.series, 25)  # seasons of 10, 10 and 5
+
+    def window(self, number, size=3):
+        episode = self.episodes[number - 1]
+        with self.assertNumQueries(1):
+            return [other.episode_number for other in episode_window(self.series, episode, size)]
+
+    def test_episode_window(self):
+        self.assertEqual(self.window(12), [9, 10, 11, 13, 14, 15])
+        self.assertEqual(self.window(1), [2, 3, 4])
+        self.assertEqual(self.window(2), [1, 3, 4, 5])
+        self.assertEqual(self.window(25), [22, 23, 24])
+        self.assertEqual(self.window(24), [21, 22, 23, 25])
+        self.assertEqual(self.window(5, size=30), [number for number in range(1, 26) if number != 5])
+
+    def test_episode_window_gaps(self):
+        # Missing numbers do not shrink the window
+        Episode.objects.filter(series=self.series, episode_number__in=[10, 11]).delete()
+        self.assertEqual(self.window(12), [7, 8, 9, 13, 14, 15])
+
+    def test_season_selection(self):
+        response = self.client.get('/movies/series/show-0/')
+        self.assertEqual(response.context['season'].number, 1)
+        self.assertEqual([season.number for season in response.context['seasons']], [1, 2, 3])
+        response = self.client.get('/movies/series/show-0/', {'season': 3})
+        self.assertEqual(response.context['season'].number, 3)
+        self.assertEqual([episode.episode_number for episode in response.context['episodes']], list(range(21, 26)))
+        for number in ['4', '0', 'two']:
+            with self.subTest(season=number):
+                self.assertEqual(self.client.get('/movies/series/show-0/', {'season': number}).status_code, 404)
+
+    def test_series_without_episodes(self):
+        create_series(1, category=self.category)
+        response = self.client.get('/movies/series/show-1/')
+        self.assertIsNone(response.context['season'])
+        self.assertEqual(self.client.get('/movies/series/show-1/', {'season': 1}).status_code, 404)
+
+
+class SeasonBackfillMigrationTests(TransactionTestCase):
+    before = [('movies', '0008_trending_scores')]
+    after = [('movies', '0009_seasons')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.addCleanup(self.migrate_forward)
+        apps = executor.loader.project_state(self.before).apps
+        category = apps.get_model('movies', 'Category').objects.create(name='Drama', slug='drama')
+        Series = apps.get_model('movies', 'Series')
+        Episode = apps.get_model('movies', 'Episode')
+        for slug, count in [('long', 23), ('short', 3)]:
+            series = Series.objects.create(
+                title=slug, slug=slug, description='', release_date=datetime.date(2020, 1, 1), category=category
+            )
+            for number in range(1, count + 1):
+                Episode.objects.create(
+                    series=series, episode_number=number, title=f'Episode {number}', slug=f'{slug}-{number}',
+                    description='', duration=45, release_date=datetime.date(2020, 1, 1),
+                )
+
+    def migrate_forward(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        apps = executor.loader.project_state(self.after).apps
+        # Read what the migration wrote, wherever catalog reads are routed
+        seasons = apps.get_model('movies', 'Season').objects.using(connection.alias)
+        episodes = apps.get_model('movies', 'Episode').objects.using(connection.alias)
+        self.assertEqual(
+            list(seasons.order_by('series__slug', 'number').values_list('series__slug', 'number')),
+            [('long', 1), ('long', 2), ('long', 3), ('short', 1)],
+        )
+        self.assertFalse(episodes.filter(season__isnull=True).exists())
+        numbers = dict(episodes.filter(series__slug='long').values_list('episode_number', 'season__number'))
+        self.assertEqual([numbers[number] for number in (1, 10, 11, 20, 21, 23)], [1, 1, 2, 2, 3, 3])
+
+
+class ImporterTests(TestCase):
+
+    def write_feed(self, records, suffix='.jsonl'):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            if suffix == '.csv':
+                f.write(records)
+            else:
+                f.write('\n'.join(record if isinstance(record, str) else json.dumps(record) for record in records))
+        return path
+
+    def import_feed(self, records, suffix='.jsonl'):
+        importer = CatalogImporter()
+        errors = importer.import_batch(list(read_records(self.write_feed(records, suffix))))
+        return importer, dict(errors)
+
+    def test_import(self):
+        importer, errors = self.import_feed([
+            {'type': 'movie', 'title': 'First Movie', 'release_date': '2020-05-01', 'duration': 100,
+             'category': 'Drama', 'director': 'Someone', 'actors': ['Ann', 'Bob'], 'status': 'published'},
+            {'type': 'series', 'title': 'A Show', 'slug': 'a-show', 'release_date': '2021-01-01', 'category': 'drama'},
+            {'type': 'episode', 'series': 'a-show', 'episode_number': 1, 'title': 'Pilot', 'release_date': '2021-01-01',
+             'duration': 40},
+            {'type': 'episode', 'series': 'a-show', 'episode_number': 12, 'title': 'Later', 'release_date': '2021-03-01',
+             'duration': 40},
+            {'type': 'episode', 'series': 'a-show', 'episode_number': 13, 'season': 5, 'title': 'Special',
+             'release_date': '2021-03-08', 'duration': 40},
+        ])
+        self.assertEqual(errors, {})
+        self.assertEqual(importer.stats, {'created': 5, 'updated': 0, 'skipped': 0})
+        movie = Movie.objects.get(slug='first-movie')
+        self.assertEqual((movie.category.slug, movie.director.name, movie.duration), ('drama', 'Someone', 100))
+        self.assertEqual(sorted(movie.actors.values_list('name', flat=True)), ['Ann', 'Bob'])
+        self.assertEqual(Category.objects.count(), 1)
+        seasons = dict(Episode.objects.values_list('episode_number', 'season__number'))
+        self.assertEqual(seasons, {1: 1, 12: 2, 13: 5})
+
+    def test_update_keeps_missing_fields(self):
+        self.import_feed([
+            {'type': 'movie', 'slug': 'movie', 'title': 'Movie', 'release_date': '2020-05-01', 'duration': 100,
+             'category': 'Drama', 'actors': 'Ann|Bob'},
+        ])
+        importer, errors = self.import_feed([{'type': 'movie', 'slug': 'movie', 'duration': 120, 'actors': ['Cy']}])
+        self.assertEqual((errors, importer.stats['updated']), ({}, 1))
+        movie = Movie.objects.get(slug='movie')
+        self.assertEqual((movie.title, movie.duration, movie.release_date), ('Movie', 120, datetime.date(2020, 5, 1)))
+        self.assertEqual(list(movie.actors.values_list('name', flat=True)), ['Cy'])
+
+    def test_invalid_records_are_skipped(self):
+        movie = {'type': 'movie', 'release_date': '2020-05-01', 'duration': 100, 'category': 'Drama'}
+        importer, errors = self.import_feed([
+            {**movie, 'title': 'Good'},
+            {**movie, 'title': 'Director object', 'director': {'name': 'Someone'}},
+            {**movie, 'title': 'Category list', 'category': ['Drama']},
+            {**movie, 'title': 'Actor numbers', 'actors': [1, 2]},
+            {**movie, 'title': 'Bad date', 'release_date': 'soon'},
+            {**movie, 'title': 'No category', 'category': None},
+            {'type': 'trailer', 'title': 'Unknown type'},
+            '{not json',
+            {'type': 'episode', 'series': 'missing', 'episode_number': 1, 'title': 'Orphan',
+             'release_date': '2020-01-01', 'duration': 40},
+        ])
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(list(Movie.objects.values_list('title', flat=True)), ['Good'])
+        self.assertEqual(importer.stats, {'created': 1, 'updated': 0, 'skipped': 8})
+
+    def test_csv(self):
+        _, errors = self.import_feed(
+            'type,title,release_date,duration,category,actors\n'
+            'movie,From CSV,2020-05-01,95,Drama,Ann|Bob\n',
+            suffix='.csv',
+        )
+        self.assertEqual(errors, {})
+        movie = Movie.objects.get(slug='from-csv')
+        self.assertEqual(sorted(movie.actors.values_list('name', flat=True)), ['Ann', 'Bob'])
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.enterContext(mock.patch.dict(images._widths, clear=True))
+        self.enterContext(mock.patch.dict(images._missing, clear=True))
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (200, 100), 'red').save(buffer, 'PNG')
+        self.name = default_storage.save('posters/small.png', ContentFile(buffer.getvalue()))
+
+    def test_original_until_generated(self):
+        self.assertNotIn('<picture>', responsive_img(self.name, 'card'))
+        self.assertEqual(images.generate_derivatives(self.name), 12)
+        self.assertIn('<picture>', responsive_img(self.name, 'card'))
+
+    def test_real_widths_in_srcset(self):
+        images.generate_derivatives(self.name)
+        self.assertEqual(images.derivative_widths(self.name)['card'], [200, 200])
+        card = images.srcset(self.name, 'card', 'webp')
+        self.assertEqual(card, f"{default_storage.url('derivatives/posters/small/card-320.webp')} 200w")
+        thumb = images.srcset(self.name, 'thumb', 'jpg').split(', ')
+        self.assertEqual([entry.rsplit(' ', 1)[1] for entry in thumb], ['64w', '128w'])
+
+    def test_missing_derivatives_checked_once_in_a_while(self):
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            for _ in range(3):
+                self.assertFalse(images.derivatives_ready(self.name))
+            self.assertEqual(exists.call_count, 1)
+            with mock.patch.object(images.time, 'monotonic', return_value=images.time.monotonic() + 60):
+                self.assertFalse(images.derivatives_ready(self.name))
+            self.assertEqual(exists.call_count, 2)
+
+    def test_generated_with_upload_when_not_async(self):
+        category = Category.objects.create(name='Drama', slug='drama')
+        with self.settings(IMAGE_DERIVATIVES_ASYNC=True):
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                create_movie(0, category=category, poster=self.name)
+        self.assertEqual(callbacks, [])
+        with self.settings(IMAGE_DERIVATIVES_ASYNC=False):
+            with self.captureOnCommitCallbacks(execute=True):
+                create_movie(1, category=category, poster=self.name)
+        self.assertTrue(images.derivatives_ready(self.name))
+
+
+class InstrumentationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.series = create_series(0)
+        create_episodes(cls.series, 3)
+
+    def test_headers(self):
+        response = self.client.get('/movies/series/show-0/')
+        self.assertGreater(int(response['X-DB-Query-Count']), 0)
+        self.assertEqual(response['X-DB-Duplicate-Queries'], '0')
+        float(response['X-DB-Time-Ms'])
+        self.assertGreater(float(response['X-Template-Time-Ms']), 0)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+, template;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_duplicate_fingerprints(self):
+        self.assertEqual(
+            middleware.fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            middleware.fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+        )
+        stats = middleware.RequestStats()
+        with connection.execute_wrapper(stats):
+            for episode in Episode.objects.all():
+                episode.series  # one query per episode
+        self.assertEqual((stats.queries, stats.duplicates), (4, 2))
+        [(sql, count)] = stats.top_duplicates()
+        self.assertEqual(count, 3)
+        self.assertIn('movies_series', sql)
+
+    def test_budget(self):
+        with override_settings(QUERY_BUDGETS={'movies:series_detail': 1}):
+            with self.assertRaises(middleware.QueryBudgetExceeded):
+                self.client.get('/movies/series/show-0/')
+        with override_settings(QUERY_BUDGETS={'movies:series_detail': 1}, QUERY_BUDGET_ACTION='log'):
+            with self.assertLogs('moviewebsite.middleware', 'WARNING'):
+                self.assertEqual(self.client.get('/movies/series/show-0/').status_code, 200)
+
+    def test_request_stats(self):
+        self.client.get('/movies/series/show-0/')
+        self.client.get('/movies/series/show-0/')
+        self.assertEqual(self.client.get('/_stats/requests/').status_code, 302)  # staff only
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        data = self.client.get('/_stats/requests/').json()
+        entry = data['views']['movies:series_detail']
+        self.assertGreaterEqual(entry['requests'], 2)
+        self.assertEqual(set(entry['queries']), {'mean', 'p95', 'max'})
+        self.assertLessEqual(entry['queries']['max'], settings.QUERY_BUDGETS['movies:series_detail'])
+
+
+class AsyncViewTests(TransactionTestCase):
+    """The async views answer like the sync ones; the worker threads of the
+    async ones have their own connections, so the data must be committed"""
+
+    databases = '__all__'
+    urls = ['/', '/movies/movie-0/', '/movies/series/show-0/', '/movies/series/show-0/episode/1/']
+
+    def setUp(self):
+        create_movie(0)
+        series = create_series(0)
+        create_episodes(series, 3)
+        self.user = User.objects.create_user('viewer')
+        rate(self.user, Movie.objects.get(), 4)
+
+    def tearDown(self):
+        benchmark.use_async_views(False)
+        cache.clear()
+
+    def sync_responses(self):
+        benchmark.use_async_views(False)
+        responses = {}
+        for url in self.urls:
+            cache.clear()
+            responses[url] = self.client.get(url)
+        return responses
+
+    def async_responses(self):
+        benchmark.use_async_views(True)
+
+        async def get_all():
+            responses = {}
+            for url in self.urls:
+                cache.clear()
+                responses[url] = await self.async_client.get(url)
+            return responses
+        return asyncio.run(get_all())
+
+    def test_parity(self):
+        sync = self.sync_responses()
+        responses = self.async_responses()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(responses[url].status_code, 200)
+                self.assertHTMLEqual(responses[url].content.decode(), sync[url].content.decode())
+
+    def test_parity_logged_in(self):
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        sync = self.sync_responses()
+        responses = self.async_responses()
+        for url in self.urls[1:]:
+            with self.subTest(url=url):
+                self.assertEqual(responses[url].status_code, 200)
+                self.assertEqual(responses[url].context['user_rating'], sync[url].context['user_rating'])
+
+    def test_not_found(self):
+        benchmark.use_async_views(True)
+        response = asyncio.run(self.async_client.get('/movies/series/show-0/episode/9/'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_worker_thread_queries_counted(self):
+        sync = self.sync_responses()
+        responses = self.async_responses()
+        for url in self.urls[1:]:
+            with self.subTest(url=url):
+                # The async episode page finds its series in the same query as the episode
+                expected = int(sync[url]['X-DB-Query-Count']) - url.count('/episode/')
+                self.assertEqual(int(responses[url]['X-DB-Query-Count']), expected)
+
+    def test_benchmark_views(self):
+        out = StringIO()
+        call_command('benchmark_views', '/movies/movie-0/', requests=3, concurrency=2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ['path', 'views', 'p50', 'p95', 'p99', 'max', 'req/s'])
+        rows = [line.split() for line in lines[1:3]]
+        self.assertEqual([row[:2] for row in rows], [['/movies/movie-0/', 'sync'], ['/movies/movie-0/', 'async']])
+        for row in rows:
+            p50, p95, p99, maximum, rps = map(float, row[2:])
+            self.assertLessEqual(p50, p95)
+            self.assertLessEqual(p95, p99)
+            self.assertLessEqual(p99, maximum)
+            self.assertGreater(rps, 0)
+        self.assertIn('CONN_MAX_AGE is 0', out.getvalue())
+        # Back to the views the settings ask for
+        self.assertIs(resolve('/movies/movie-0/').func, views.movie_detail)
+
+
+@mock.patch('moviewebsite.routers.replica_configured', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions, as made with a replica configured"""
+
+    router = PrimaryReplicaRouter()
+
+    def test_catalog_reads(self, configured):
+        self.assertEqual(self.router.db_for_read(Movie), 'replica')
+        self.assertEqual(self.router.db_for_read(Rating), 'default')
+        self.assertEqual(self.router.db_for_write(Movie), 'default')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(Movie), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+    def test_no_replica(self, configured):
+        configured.return_value = False
+        self.assertEqual(self.router.db_for_read(Movie), 'default')
+
+    def request(self, method='get', cookies=None, write=False):
+        """Run a request through the middleware; returns the response and where it read the catalog from"""
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Movie))
+            if write:
+                self.router.db_for_write(Rating)
+                reads.append(self.router.db_for_read(Movie))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinningMiddleware(view)(request), reads
+
+    def test_pinning(self, configured):
+        response, reads = self.request()
+        self.assertEqual(reads, ['replica'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        # Reads after a write in the same request stay on the primary
+        response, reads = self.request(write=True)
+        self.assertEqual(reads, ['replica', 'default'])
+        # but only writes from a POST pin the user
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response, reads = self.request('post', write=True)
+        self.assertEqual(reads, ['default', 'default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        response, reads = self.request('post')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        _, reads = self.request(cookies={PIN_COOKIE: '1'})
+        self.assertEqual(reads, ['default'])
+
+    def test_middleware_unused_without_replica(self, configured):
+        configured.return_value = False
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaPinningMiddleware(lambda request: HttpResponse())
+
+
+@unittest.skipUnless(replica_configured(), 'Set REPLICA_DB_NAME to test against a replica')
+class ReplicaQueryTests(TransactionTestCase):
+    """Queries really reach the replica.
+
+    Its settings have ``'TEST': {'MIRROR': 'default'}``, so under test it is
+    a second connection to the primary's test database.
+    """
+
+    databases = {'default', 'replica'} if replica_configured() else {'default'}
+
+    def test_reads_and_writes(self):
+        category = Category.objects.create(name='Drama', slug='drama')
+        create_movie(0, category=category)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            with CaptureQueriesContext(connections['default']) as primary:
+                self.assertEqual(self.client.get('/movies/').status_code, 200)
+                self.assertEqual(self.client.get('/movies/movie-0/').status_code, 200)
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse([query for query in primary.captured_queries if 'movies_movie' in query['sql']])
+
+        user = User.objects.create_user('viewer')
+        self.client.force_login(user)
+        response = self.client.post(f'/user/rate-movie/{Movie.objects.get().pk}/', {'rating': 4})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get('/movies/movie-0/')
+        self.assertFalse(replica.captured_queries)
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Drama', slug='drama')
+        director = Director.objects.create(name='Director')
+        actors = [Actor.objects.create(name=f'Actor {number}') for number in range(3)]
+        for number in range(5):
+            movie = create_movie(number, category=category, director=director)
+            movie.actors.set(actors)
+        for number in range(3):
+            series = create_series(number, category=category, director=director)
+            series.actors.set(actors[:2])
+            create_episodes(series, 4)
+
+    def get(self, url, **params):
+        return self.client.get(url, params)
+
+    def test_fields(self):
+        data = self.get('/api/movies/', fields='title,slug').json()['data']
+        self.assertEqual(len(data), 5)
+        self.assertEqual(set(data[0]), {'title', 'slug'})
+        data = self.get('/api/movies/movie-1/', include='actors', **{'fields': 'title', 'fields[actors]': 'name'}).json()
+        self.assertEqual(data['data']['actors'][0], {'name': 'Actor 0'})
+
+    def test_invalid_queries(self):
+        for params in [
+            {'fields': 'title,nope'},
+            {'include': 'reviews'},
+            {'include': 'actors', 'fields[actors]': 'title'},
+            {'fields[actors]': 'name'},  # without include=actors
+            {'limit': 'many'},
+            {'limit': '1000'},
+        ]:
+            with self.subTest(params=params):
+                response = self.get('/api/movies/', **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertEqual(self.get('/api/nothing/').status_code, 404)
+        self.assertEqual(self.get('/api/movies/missing/').status_code, 404)
+        self.assertEqual(self.get('/api/actors/abc/').status_code, 404)
+
+    def test_include_query_counts(self):
+        # One query for the page, one per to-many include, to-one includes are joined
+        with self.assertNumQueries(1):
+            data = self.get('/api/movies/', include='category,director').json()['data']
+        self.assertEqual(data[0]['category']['slug'], 'drama')
+        with self.assertNumQueries(2):
+            data = self.get('/api/movies/', include='category,director,actors').json()['data']
+        self.assertEqual([len(movie['actors']) for movie in data], [3] * 5)
+        with self.assertNumQueries(3):
+            data = self.get('/api/series/', include='actors,episodes').json()['data']
+        self.assertEqual([len(series['episodes']) for series in data], [4] * 3)
+        with self.assertNumQueries(3):
+            data = self.get('/api/series/show-1/', include='actors,episodes').json()['data']
+        self.assertEqual([episode['episode_number'] for episode in data['episodes']], [1, 2, 3, 4])
+        with self.assertNumQueries(1):
+            data = self.get('/api/episodes/', include='series', fields='season_number,url').json()['data']
+        self.assertEqual(data[0]['season_number'], 1)
+
+    def test_pages(self):
+        first = self.get('/api/movies/', limit=2, fields='slug').json()
+        second = self.client.get(first['links']['next']).json()
+        self.assertEqual(len(second['data']), 2)
+        self.assertFalse({movie['slug'] for movie in first['data']} & {movie['slug'] for movie in second['data']})
+        self.assertIsNone(first['links']['previous'])
+
+    def test_etag(self):
+        response = self.get('/api/movies/movie-1/')
+        etag = response['ETag']
+        response = self.client.get('/api/movies/movie-1/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        Movie.objects.filter(slug='movie-1').update(title='Renamed')
+        response = self.client.get('/api/movies/movie-1/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ConditionalPageTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Drama', slug='drama')
+        cls.movies = [create_movie(number, category=cls.category) for number in range(2)]
+        cls.users = [User.objects.create_user(f'user{number}') for number in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRevalidates(self, url, change):
+        """A 304 for the current copy, a full page once ``change`` has run"""
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        change()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_page_rating(self):
+        self.assertRevalidates('/movies/movie-0/', lambda: rate(self.users[0], self.movies[0], 4))
+
+    def test_category_page_rating(self):
+        self.assertRevalidates('/movies/category/drama/', lambda: rate(self.users[0], self.movies[1], 3))
+
+    def test_category_page_swapped_ratings(self):
+        # Same totals over the category, different averages on the cards
+        rate(self.users[0], self.movies[0], 4)
+        rate(self.users[1], self.movies[1], 2)
+
+        def swap():
+            rate(self.users[0], self.movies[0], 2)
+            rate(self.users[1], self.movies[1], 4)
+        self.assertRevalidates('/movies/category/drama/', swap)
+
+    def test_logged_in(self):
+        self.client.force_login(self.users[0])
+        self.assertNotIn('ETag', self.client.get('/movies/movie-0/'))
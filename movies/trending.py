@@ -0,0 +1,238 @@
+"""
+Trending movies and series.
+
+Views, ratings, downloads and watching sessions are events with a weight
+(``TRENDING_WEIGHTS``) whose contribution halves every
+``TRENDING_HALF_LIFE_HOURS``. Scores use forward decay: an event at time
+``t`` adds ``weight * exp(rate * (t - EPOCH))`` to the title's sum instead of
+every sum shrinking as time passes. Sums of titles that saw no event keep
+their relative order, so the stored values rank the titles correctly at any
+moment, a new event only touches its own title, and the leaderboard is read
+straight from the ``(category, -score)`` and ``(-score)`` indexes of
+TrendingScore without looking at the interaction tables. Sums are stored as
+natural logs so they never overflow; ``decayed_score`` turns one back into
+today's value.
+
+Events are buffered in process and merged per title, episodes counting for
+their series, then written every ``TRENDING_FLUSH_INTERVAL`` seconds. Views
+reach the buffer when the view counter flushes, downloads and watching
+sessions when their own buffers do. ``manage.py rebuild_trending`` recomputes
+every score from the rating, download and watch history tables, after the
+half-life or the weights were changed for example. Individual views are not
+logged, so a rebuild starts their share from zero.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .buffering import FlushingBuffer
+from .models import Movie, Series, Episode, TrendingScore
+
+
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+DEFAULT_WEIGHTS = {
+    'view': 1.0,
+    'watch': 2.0,
+    'rating': 3.0,  # for five stars, scaled down for fewer
+    'download': 5.0,
+}
+
+TITLE_MODELS = {'movies.movie': Movie, 'movies.series': Series}
+
+
+def weight(kind):
+    return getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_WEIGHTS)[kind]
+
+
+def decay_rate():
+    """Decay per second"""
+    return math.log(2) / (getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48) * 3600)
+
+
+def log_contribution(event_weight, at):
+    """Logarithm of the forward-decayed contribution of an event"""
+    return math.log(event_weight) + decay_rate() * (at - EPOCH).total_seconds()
+
+
+def log_add(a, b):
+    """``log(exp(a) + exp(b))`` without leaving log space, ``None`` being an empty sum"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def decayed_score(score, now=None):
+    """Today's value of a stored score"""
+    if score is None:
+        return 0.0
+    now = now or timezone.now()
+    return math.exp(score - decay_rate() * (now - EPOCH).total_seconds())
+
+
+class TrendingBuffer(FlushingBuffer):
+    """Pending contributions, summed per ``(model_label, pk)``"""
+
+    def merge(self, pending, key, value):
+        pending[key] = log_add(pending.get(key), value)
+
+    def write(self, batch):
+        write_scores(batch)
+
+
+def title_totals(contributions):
+    """Fold ``{(model_label, pk): log sum}`` into ``{model: {pk: log sum}}`` of movies and series"""
+    contributions = dict(contributions)
+    episode_ids = [pk for (label, pk) in contributions if label == 'movies.episode']
+    series_of = dict(Episode.objects.filter(pk__in=episode_ids).values_list('pk', 'series_id'))
+
+    totals = {Movie: {}, Series: {}}
+    for (label, pk), value in contributions.items():
+        if label == 'movies.episode':
+            model, pk = Series, series_of.get(pk)
+            if pk is None:
+                continue  # deleted meanwhile
+        else:
+            model = TITLE_MODELS[label]
+        totals[model][pk] = log_add(totals[model].get(pk), value)
+    return totals
+
+
+def write_scores(contributions):
+    """Add buffered contributions to the leaderboard"""
+    now = timezone.now()
+    for model, values in title_totals(contributions).items():
+        if not values:
+            continue
+        field = model._meta.model_name
+        with transaction.atomic():
+            categories = dict(model.objects.filter(pk__in=values).values_list('pk', 'category_id'))
+            # Empty rows for new titles first, so that concurrent writers
+            # serialize on the row locks below instead of racing on inserts
+            TrendingScore.objects.bulk_create(
+                [
+                    TrendingScore(category_id=category_id, updated_at=now, **{field + '_id': pk})
+                    for pk, category_id in categories.items()
+                ],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+            rows = list(TrendingScore.objects.select_for_update().filter(**{f'{field}_id__in': categories}))
+            for row in rows:
+                row.score = log_add(row.score, values[getattr(row, f'{field}_id')])
+                row.updated_at = now
+            TrendingScore.objects.bulk_update(rows, ['score', 'updated_at'], batch_size=500)
+
+
+# Created on import, before the view, download and progress buffers that
+# feed it, so that it is always registered when their last writes at exit
+# reach it
+_buffer = TrendingBuffer(
+    flush_interval=getattr(settings, 'TRENDING_FLUSH_INTERVAL', 30),
+    max_pending=getattr(settings, 'TRENDING_MAX_PENDING', 1000),
+)
+
+
+def get_trending_buffer():
+    return _buffer
+
+
+def record_events(events):
+    """Buffer ``(model_label, pk, kind, amount, at)`` events.
+
+    ``kind`` is a ``TRENDING_WEIGHTS`` key and ``amount`` scales its weight:
+    the number of views, or a rating's stars out of five.
+    """
+    buffer = get_trending_buffer()
+    for label, pk, kind, amount, at in events:
+        event_weight = weight(kind) * amount
+        if event_weight > 0:
+            buffer.add((label, pk), log_contribution(event_weight, at))
+
+
+def flush_trending():
+    """Write all pending events of this process to the leaderboard"""
+    get_trending_buffer().flush()
+
+
+def top_titles(limit=10, category=None):
+    """The ``limit`` published movies and series trending most, best first.
+
+    Each is returned with a ``trending_score`` attribute, today's decayed score.
+    """
+    rows = TrendingScore.objects.filter(score__isnull=False)
+    if category is not None:
+        rows = rows.filter(category=category)
+    rows = (
+        rows.filter(Q(movie__status='published') | Q(series__status='published'))
+        .select_related('movie', 'series')
+        .order_by('-score')[:limit]
+    )
+    now = timezone.now()
+    titles = []
+    for row in rows:
+        title = row.movie or row.series
+        title.trending_score = decayed_score(row.score, now)
+        titles.append(title)
+    return titles
+
+
+def rebuild_scores(batch_size=2000):
+    """Recompute the whole leaderboard from the interaction tables; returns the number of titles scored"""
+    from user_interactions.download_log import FROM_START
+    from user_interactions.models import Rating, DownloadEvent, WatchHistory, WatchDailyAggregate
+
+    # Older events add less than a thousandth of their weight
+    since = timezone.now() - timedelta(hours=10 * getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 48))
+    sources = [
+        (Rating, 'created_at', 'rating', Q()),
+        # Range requests continuing a download are not downloads of their own
+        (DownloadEvent, 'created_at', 'download', FROM_START),
+        (WatchHistory, 'watched_at', 'watch', Q()),
+        (WatchDailyAggregate, 'last_watched_at', 'watch', Q()),
+    ]
+    contributions = {}
+    for model, time_field, kind, condition in sources:
+        fields = [field.name for field in model._meta.fields if field.name in ('movie', 'series', 'episode')]
+        columns = [f'{name}_id' for name in fields] + [time_field] + (['rating'] if kind == 'rating' else [])
+        rows = model.objects.filter(condition, **{f'{time_field}__gte': since}).values_list(*columns)
+        for row in rows.iterator(chunk_size=batch_size):
+            ids, at = row[:len(fields)], row[len(fields)]
+            event_weight = weight(kind) * (row[-1] / 5 if kind == 'rating' else 1)
+            if event_weight <= 0:
+                continue
+            for name, pk in zip(fields, ids):
+                if pk is not None:
+                    key = (f'movies.{name}', pk)
+                    contributions[key] = log_add(contributions.get(key), log_contribution(event_weight, at))
+
+    totals = title_totals(contributions)
+    now = timezone.now()
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        for model, values in totals.items():
+            field = model._meta.model_name
+            categories = dict(model.objects.filter(pk__in=values).values_list('pk', 'category_id'))
+            # A concurrent write_scores may have inserted a row since the
+            # delete; skip it here and overwrite its score below
+            TrendingScore.objects.bulk_create(
+                [
+                    TrendingScore(category_id=category_id, updated_at=now, **{field + '_id': pk})
+                    for pk, category_id in categories.items()
+                ],
+                batch_size=500,
+                ignore_conflicts=True,
+            )
+            rows = list(TrendingScore.objects.select_for_update().filter(**{f'{field}_id__in': categories}))
+            for row in rows:
+                row.score = values[getattr(row, f'{field}_id')]
+                row.updated_at = now
+            TrendingScore.objects.bulk_update(rows, ['score', 'updated_at'], batch_size=500)
+    return sum(len(values) for values in totals.values())
@@ -1,20 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Detail pages that run their queries concurrently when served over ASGI
+detail_views = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 app_name = 'movies'
 
 urlpatterns = [
     # Movie-related URLs
     path('', views.movies_list, name='movies_list'),
-    path('<slug:slug>/', views.movie_detail, name='movie_detail'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
     path('category/', views.categories_list, name='categories_list'),
     
     # Series-related URLs
     path('series/', views.series_list, name='series_list'),
-    path('series/<slug:slug>/', views.series_detail, name='series_detail'),
-    path('series/<slug:series_slug>/episode/<int:episode_number>/', views.episode_detail, name='episode_detail'),
+    path('series/<slug:slug>/', detail_views.series_detail, name='series_detail'),
+    path('series/<slug:series_slug>/episode/<int:episode_number>/', detail_views.episode_detail, name='episode_detail'),
     
     # Search
     path('search/', views.search, name='search'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    
+    # Catch-all movie slugs go last so they don't shadow the routes above
+    path('<slug:slug>/', detail_views.movie_detail, name='movie_detail'),
 ]
\ No newline at end of file
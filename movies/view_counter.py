@@ -0,0 +1,168 @@
+"""
+Buffered view counting for movies, series and episodes.
+
+Detail views call :func:`record_view` instead of saving ``views_count`` on every
+hit. Increments are coalesced per object and flushed periodically as
+``UPDATE ... SET views_count = views_count + n`` statements, so concurrent
+requests never lose increments and the hot read path does not write.
+
+Two backends are available through the ``VIEW_COUNTER_BACKEND`` setting:
+
+* ``'memory'`` keeps pending counts in the worker process.
+* ``'cache'`` keeps them in the Django cache so that every worker sharing the
+  cache contributes to the same counters.
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import trending
+from .buffering import FlushingBuffer
+
+
+def _key(obj):
+    return (obj._meta.label_lower, obj.pk)
+
+
+def apply_view_counts(counts):
+    """Add buffered view counts to the database.
+
+    ``counts`` maps ``(model_label, pk)`` to the number of new views. Objects
+    that received the same number of views share a single UPDATE statement.
+    """
+    grouped = defaultdict(lambda: defaultdict(list))
+    for (label, pk), count in counts.items():
+        if count:
+            grouped[label][count].append(pk)
+
+    with transaction.atomic():
+        for label, by_count in grouped.items():
+            model = apps.get_model(label)
+            for count, pks in by_count.items():
+                model.objects.filter(pk__in=pks).update(views_count=F('views_count') + count)
+
+    now = timezone.now()
+    trending.record_events((label, pk, 'view', count, now) for (label, pk), count in counts.items() if count)
+
+
+class MemoryViewCounter(FlushingBuffer):
+    """Counts views in process memory"""
+
+    def merge(self, pending, key, value):
+        pending[key] = pending.get(key, 0) + value
+
+    def write(self, batch):
+        apply_view_counts(batch)
+
+
+class CacheViewCounter(FlushingBuffer):
+    """Counts views in the shared Django cache.
+
+    The local buffer only remembers which counters this process touched. On
+    flush each shared counter is claimed under a short lock taken with the
+    atomic ``cache.add``: the holder reads the value and decrements the
+    counter by it, so two workers flushing the same counter never take the
+    same views and the decrement never has to go below zero, which
+    Memcached's ``decr`` cannot do. A counter locked by another worker is
+    looked at again on the next flush. Increments made by other workers in
+    the meantime are kept for the next flush.
+    """
+
+    key_prefix = 'views'
+    lock_timeout = 60  # seconds; frees the counter of a worker that died while claiming it
+
+    def cache_key(self, key):
+        label, pk = key
+        return f'{self.key_prefix}:{label}:{pk}'
+
+    def increment(self, cache_key, value):
+        if not cache.add(cache_key, value, timeout=None):
+            try:
+                cache.incr(cache_key, value)
+            except ValueError:
+                # Evicted between the two calls
+                cache.add(cache_key, value, timeout=None)
+
+    def claim(self, cache_key):
+        """Take the views off a shared counter; returns how many, None when another worker is claiming it"""
+        lock_key = f'{cache_key}:claim'
+        if not cache.add(lock_key, 1, timeout=self.lock_timeout):
+            return None
+        try:
+            count = cache.get(cache_key)
+            if not count or count <= 0:
+                return 0
+            try:
+                cache.decr(cache_key, count)
+            except ValueError:
+                return 0  # evicted, the views are lost
+            return count
+        finally:
+            cache.delete(lock_key)
+
+    def merge(self, pending, key, value):
+        self.increment(self.cache_key(key), value)
+        pending[key] = True
+
+    def requeue(self, pending, batch):
+        # The counts are still in the cache, only the keys need remembering.
+        pending.update(batch)
+
+    def write(self, batch):
+        cache_keys = {self.cache_key(key): key for key in batch}
+        counts = {}
+        busy = []
+        for cache_key, count in cache.get_many(cache_keys).items():
+            if not count or count <= 0:
+                continue
+            taken = self.claim(cache_key)
+            if taken is None:
+                busy.append(cache_keys[cache_key])
+            elif taken:
+                counts[cache_keys[cache_key]] = taken
+        if busy:
+            with self._lock:
+                self.requeue(self._pending, dict.fromkeys(busy, True))
+        if not counts:
+            return
+        try:
+            apply_view_counts(counts)
+        except Exception:
+            for key, count in counts.items():
+                self.increment(self.cache_key(key), count)
+            raise
+
+
+BACKENDS = {
+    'memory': MemoryViewCounter,
+    'cache': CacheViewCounter,
+}
+
+_counter = None
+
+
+def get_view_counter():
+    """Return the process-wide view counter configured in settings"""
+    global _counter
+    if _counter is None:
+        backend = BACKENDS[getattr(settings, 'VIEW_COUNTER_BACKEND', 'memory')]
+        _counter = backend(
+            flush_interval=getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10),
+            max_pending=getattr(settings, 'VIEW_COUNTER_MAX_PENDING', 1000),
+        )
+    return _counter
+
+
+def record_view(obj):
+    """Count one view of a Movie, Series or Episode"""
+    get_view_counter().add(_key(obj), 1)
+
+
+def flush_views():
+    """Write all pending view counts of this process to the database"""
+    get_view_counter().flush()
@@ -1,48 +1,71 @@
+from functools import partial
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Avg
-from django.core.paginator import Paginator
-from django.utils import timezone
-from .models import Movie, Series, Episode, Category, Advertisement
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from .ads import get_active_ads
+from .autocomplete import suggest
+from .conditional import category_validators, detail_validators, not_modified, set_validators
+from .facets import browse_movies, clear_url, selected_facets
+from .fragments import fragment_context
+from .models import Movie, Series, Episode, Category, CatalogQuerySet
+from .pagination import DEFAULT_ORDERING, paginate
+from .recommendations import related_movies_for, related_series_for
+from .search import search as search_catalog
+from .seasons import episode_window, season_context
+from .trending import top_titles
+from .view_counter import record_view
 from user_interactions.models import Rating, Review
 
 
 def display_ads():
     """Display active advertisements"""
-    active_ads = Advertisement.objects.filter(is_active=True).filter(
-        start_date__lte=timezone.now(),
-        end_date__gte=timezone.now()
-    )
-    return {'active_ads': active_ads}
+    return {'active_ads': get_active_ads()}
 
 
 def movies_list(request):
     """Display a list of all movies"""
-    movies = Movie.objects.filter(status='published').order_by('-created_at')
+    movies = Movie.objects.filter(status='published').select_related('category').order_by('-created_at')
     
-    # Apply filters if present
-    category_id = request.GET.get('category')
-    if category_id:
-        movies = movies.filter(category_id=category_id)
+    # Genre, year, decade, duration, rating, director and cast filters,
+    # each taking several values
+    selected = selected_facets(request.GET)
+    
+    sort = request.GET.get('sort')
+    ordering = DEFAULT_ORDERING
+    if sort == 'rating':
+        movies = movies.order_by_rating()
+        ordering = CatalogQuerySet.RATING_ORDERING
     
     search_query = request.GET.get('search')
     if search_query:
-        movies = movies.filter(Q(title__icontains=search_query) | Q(description__icontains=search_query))
+        movies = search_catalog(movies, search_query)
     
-    # Pagination
-    paginator = Paginator(movies, 12)  # Show 12 movies per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Facet counts, and the movies matching the picked facets, come from
+    # the in-memory facet index instead of COUNT queries
+    browse = browse_movies(selected, rating_order=sort == 'rating', search=movies if search_query else None)
+    if selected:
+        movies = browse.results(Movie.objects.filter(status='published').select_related('category'))
     
-    categories = Category.objects.all()
-    advertisements = Advertisement.objects.filter(is_active=True)
+    # Cursor pagination, 12 movies per page
+    page_obj = paginate(movies, request.GET.get('cursor'), 12, ordering)
+    
+    advertisements = get_active_ads()
+    
+    filters = request.GET.copy()
+    filters.pop('cursor', None)
     
     context = {
         'movies': page_obj,
-        'categories': categories,
+        'facets': browse.facets(request.GET),
+        'selected': selected,
+        'filter_query': filters.urlencode(),
+        'clear_url': clear_url(request.GET),
         'advertisements': advertisements,
-        'current_category': category_id,
+        'current_sort': sort,
         'search_query': search_query,
     }
     return render(request, 'movies/list.html', context)
@@ -50,30 +73,38 @@ def movies_list(request):
 
 def movie_detail(request, slug):
     """Display details for a specific movie"""
-    movie = get_object_or_404(Movie, slug=slug, status='published')
+    movie = get_object_or_404(
+        Movie.objects.select_related('category', 'director'),
+        slug=slug,
+        status='published'
+    )
     
-    # Increment view count
-    movie.views_count += 1
-    movie.save(update_fields=['views_count'])
+    # Count the view; increments are buffered and flushed in batches
+    record_view(movie)
     
-    # Get related content
-    related_movies = Movie.objects.filter(
-        category=movie.category, 
-        status='published'
-    ).exclude(id=movie.id)[:6]
+    # Anonymous visitors whose copy is current get a 304, the view still counts
+    fragments = fragment_context(movie)
+    validators = detail_validators(request, movie, fragments['fragment_version'])
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    
+    # Related content from the precomputed neighbours, only loaded when
+    # the cached fragment has to be rendered again
+    related_movies = partial(related_movies_for, movie)
     
     # Get user's rating if logged in
     user_rating = None
     if request.user.is_authenticated:
         user_rating = Rating.objects.filter(user=request.user, movie=movie).first()
     
-    # Get average rating
-    avg_rating = Rating.objects.filter(movie=movie).aggregate(Avg('rating'))['rating__avg']
+    # Average rating is stored on the content itself
+    avg_rating = movie.average_rating
     
     # Get reviews
-    reviews = Review.objects.filter(movie=movie).order_by('-created_at')
+    reviews = Review.objects.filter(movie=movie).select_related('user').order_by('-created_at')
     
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'movie': movie,
@@ -82,36 +113,42 @@ def movie_detail(request, slug):
         'avg_rating': avg_rating,
         'reviews': reviews,
         'advertisements': advertisements,
+        **fragments,
     }
-    return render(request, 'movies/detail.html', context)
+    return set_validators(render(request, 'movies/detail.html', context), validators)
 
 
 def series_list(request):
     """Display a list of all series"""
-    series = Series.objects.filter(status='published').order_by('-created_at')
+    series = Series.objects.filter(status='published').select_related('category').order_by('-created_at')
     
     # Apply filters if present
     category_id = request.GET.get('category')
     if category_id:
         series = series.filter(category_id=category_id)
     
+    sort = request.GET.get('sort')
+    ordering = DEFAULT_ORDERING
+    if sort == 'rating':
+        series = series.order_by_rating()
+        ordering = CatalogQuerySet.RATING_ORDERING
+    
     search_query = request.GET.get('search')
     if search_query:
-        series = series.filter(Q(title__icontains=search_query) | Q(description__icontains=search_query))
+        series = search_catalog(series, search_query)
     
-    # Pagination
-    paginator = Paginator(series, 12)  # Show 12 series per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Cursor pagination, 12 series per page
+    page_obj = paginate(series, request.GET.get('cursor'), 12, ordering)
     
     categories = Category.objects.all()
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'series_list': page_obj,
         'categories': categories,
         'advertisements': advertisements,
         'current_category': category_id,
+        'current_sort': sort,
         'search_query': search_query,
     }
     return render(request, 'movies/series_list.html', context)
@@ -119,62 +156,81 @@ def series_list(request):
 
 def series_detail(request, slug):
     """Display details for a specific series"""
-    series = get_object_or_404(Series, slug=slug, status='published')
+    series = get_object_or_404(
+        Series.objects.select_related('category', 'director'),
+        slug=slug,
+        status='published'
+    )
+    record_view(series)
     
-    # Get episodes
-    episodes = Episode.objects.filter(series=series).order_by('episode_number')
+    # Anonymous visitors whose copy is current get a 304, the view still counts
+    fragments = fragment_context(series)
+    validators = detail_validators(request, series, fragments['fragment_version'])
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
     
-    # Get related content
-    related_series = Series.objects.filter(
-        category=series.category, 
-        status='published'
-    ).exclude(id=series.id)[:6]
+    # One season at a time, a page of its episodes
+    episode_list = season_context(series, request.GET.get('season'), request.GET.get('cursor'))
+    
+    # Related content from the precomputed neighbours, only loaded when
+    # the cached fragment has to be rendered again
+    related_series = partial(related_series_for, series)
     
     # Get user's rating if logged in
     user_rating = None
     if request.user.is_authenticated:
         user_rating = Rating.objects.filter(user=request.user, series=series).first()
     
-    # Get average rating
-    avg_rating = Rating.objects.filter(series=series).aggregate(Avg('rating'))['rating__avg']
+    # Average rating is stored on the content itself
+    avg_rating = series.average_rating
     
     # Get reviews
-    reviews = Review.objects.filter(series=series).order_by('-created_at')
+    reviews = Review.objects.filter(series=series).select_related('user').order_by('-created_at')
     
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'series': series,
-        'episodes': episodes,
+        **episode_list,
         'related_series': related_series,
         'user_rating': user_rating,
         'avg_rating': avg_rating,
         'reviews': reviews,
         'advertisements': advertisements,
+        **fragments,
     }
-    return render(request, 'movies/series_detail.html', context)
+    return set_validators(render(request, 'movies/series_detail.html', context), validators)
 
 
 def episode_detail(request, series_slug, episode_number):
     """Display details for a specific episode"""
     series = get_object_or_404(Series, slug=series_slug, status='published')
-    episode = get_object_or_404(Episode, series=series, episode_number=episode_number)
+    episode = get_object_or_404(series.episodes.select_related('season'), episode_number=episode_number)
+    record_view(episode)
+    
+    # Anonymous visitors whose copy is current get a 304, the view still counts
+    fragments = fragment_context(episode, series)
+    validators = detail_validators(request, episode, fragments['fragment_version'], series)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
     
-    # Get related episodes
-    other_episodes = Episode.objects.filter(series=series).exclude(id=episode.id).order_by('episode_number')
+    # The episodes around this one
+    other_episodes = episode_window(series, episode)
     
     # Get user's rating if logged in
     user_rating = None
     if request.user.is_authenticated:
         user_rating = Rating.objects.filter(user=request.user, episode=episode).first()
     
-    # Get average rating
-    avg_rating = Rating.objects.filter(episode=episode).aggregate(Avg('rating'))['rating__avg']
+    # Average rating is stored on the content itself
+    avg_rating = episode.average_rating
     
     # Get reviews
-    reviews = Review.objects.filter(episode=episode).order_by('-created_at')
+    reviews = Review.objects.filter(episode=episode).select_related('user').order_by('-created_at')
     
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'series': series,
@@ -184,14 +240,15 @@ def episode_detail(request, series_slug, episode_number):
         'avg_rating': avg_rating,
         'reviews': reviews,
         'advertisements': advertisements,
+        **fragments,
     }
-    return render(request, 'movies/episode_detail.html', context)
+    return set_validators(render(request, 'movies/episode_detail.html', context), validators)
 
 
 def categories_list(request):
     """Display a list of all categories"""
     categories = Category.objects.all()
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'categories': categories,
@@ -204,27 +261,31 @@ def category_detail(request, slug):
     """Display movies and series in a specific category"""
     category = get_object_or_404(Category, slug=slug)
     
+    # Read from the leaderboard's category index, see movies.trending
+    trending = top_titles(6, category=category)
+    
+    validators = category_validators(request, category, trending)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    
     movies = Movie.objects.filter(category=category, status='published')
     series = Series.objects.filter(category=category, status='published')
     
-    # Pagination
-    paginator_movies = Paginator(movies, 12)  # Show 12 movies per page
-    page_number_movies = request.GET.get('page_movies')
-    page_obj_movies = paginator_movies.get_page(page_number_movies)
-    
-    paginator_series = Paginator(series, 12)  # Show 12 series per page
-    page_number_series = request.GET.get('page_series')
-    page_obj_series = paginator_series.get_page(page_number_series)
+    # Cursor pagination, 12 items per page
+    page_obj_movies = paginate(movies, request.GET.get('cursor_movies'))
+    page_obj_series = paginate(series, request.GET.get('cursor_series'))
     
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'category': category,
+        'trending': trending,
         'movies': page_obj_movies,
         'series': page_obj_series,
         'advertisements': advertisements,
     }
-    return render(request, 'movies/category_detail.html', context)
+    return set_validators(render(request, 'movies/category_detail.html', context), validators)
 
 
 def search(request):
@@ -232,33 +293,43 @@ def search(request):
     query = request.GET.get('q')
     
     if query:
-        movies = Movie.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query),
-            status='published'
-        )
-        series = Series.objects.filter(
-            Q(title__icontains=query) | Q(description__icontains=query),
-            status='published'
-        )
+        # Results come from the full-text index, best match first
+        movies = search_catalog(Movie.objects.filter(status='published'), query)
+        series = search_catalog(Series.objects.filter(status='published'), query)
+        episodes = search_catalog(Episode.objects.filter(series__status='published').select_related('series', 'season'), query)
     else:
         movies = Movie.objects.none()
         series = Series.objects.none()
+        episodes = Episode.objects.none()
     
-    # Pagination
-    paginator_movies = Paginator(movies, 12)  # Show 12 movies per page
-    page_number_movies = request.GET.get('page_movies')
-    page_obj_movies = paginator_movies.get_page(page_number_movies)
+    # Cursor pagination, 12 items per page
+    page_obj_movies = paginate(movies, request.GET.get('cursor_movies'))
+    page_obj_series = paginate(series, request.GET.get('cursor_series'))
+    page_obj_episodes = paginate(episodes, request.GET.get('cursor_episodes'))
     
-    paginator_series = Paginator(series, 12)  # Show 12 series per page
-    page_number_series = request.GET.get('page_series')
-    page_obj_series = paginator_series.get_page(page_number_series)
-    
-    advertisements = Advertisement.objects.filter(is_active=True)
+    advertisements = get_active_ads()
     
     context = {
         'query': query,
         'movies': page_obj_movies,
         'series': page_obj_series,
+        'episodes': page_obj_episodes,
         'advertisements': advertisements,
     }
-    return render(request, 'movies/search_results.html', context)
\ No newline at end of file
+    return render(request, 'movies/search_results.html', context)
+
+
+@require_GET
+def autocomplete(request):
+    """Suggestions for the search box as the query is typed, as JSON"""
+    suggestions = suggest(request.GET.get('q', ''))
+    
+    response = JsonResponse({
+        'results': [
+            {'label': entry.label, 'kind': entry.kind, 'url': entry.url}
+            for entry in suggestions
+        ],
+    })
+    # Every keystroke asks again, let the browser keep answers for a minute
+    patch_cache_control(response, max_age=60)
+    return response
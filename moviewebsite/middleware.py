@@ -0,0 +1,204 @@
+"""
+Opt-in per-request instrumentation.
+
+With ``REQUEST_INSTRUMENTATION = True`` every request records how many SQL
+queries it ran, how many of those repeat an earlier statement (the usual
+sign of an N+1), the time spent in the database and in template rendering.
+The numbers are sent back as ``X-DB-*`` and ``Server-Timing`` headers and
+folded into a rolling summary per URL name, which staff can read from
+``request_stats``. ``QUERY_BUDGETS`` maps URL names to the number of
+queries a view may run; going over is logged, or raises QueryBudgetExceeded
+when ``QUERY_BUDGET_ACTION = 'raise'`` (use that in tests). Code running
+queries on threads of its own installs ``current_stats().instrument()``
+there, as ``movies.async_views`` does.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+from django.template.base import Template
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Statement with parameters left out, ``IN (...)`` lists collapsed"""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class RequestStats:
+    """Queries and timings collected while one request is handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.fingerprints = Counter()
+        # Async views run their queries on several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.db_time += elapsed
+                self.queries += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def instrument(self):
+        """Context manager counting the queries of this thread's connections"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    @property
+    def duplicates(self):
+        """Queries that repeat a statement already run in this request"""
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def top_duplicates(self, limit=3):
+        return [(sql, count) for sql, count in self.fingerprints.most_common(limit) if count > 1]
+
+
+def current_stats():
+    """RequestStats of the request being handled, None when not instrumented"""
+    return _current.get()
+
+
+def _instrumented_render(render):
+    def wrapper(self, context=None, *args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return render(self, context, *args, **kwargs)
+        # Included and extended templates render inside the outer one, only time that
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, *args, **kwargs)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_time += time.perf_counter() - started
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+class RollingSummary:
+    """Last ``window`` samples per URL name"""
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, name, sample):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(sample)
+
+    def summary(self):
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+        result = {}
+        for name, samples in sorted(snapshot.items()):
+            entry = {'requests': len(samples)}
+            for field in ('queries', 'duplicates', 'db_ms', 'template_ms', 'total_ms'):
+                values = sorted(sample[field] for sample in samples)
+                entry[field] = {
+                    'mean': round(sum(values) / len(values), 2),
+                    'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                    'max': values[-1],
+                }
+            result[name] = entry
+        return result
+
+
+summary = RollingSummary(getattr(settings, 'REQUEST_STATS_WINDOW', 200))
+
+
+class QueryInstrumentationMiddleware:
+    """Collect RequestStats for each request, see the module docstring"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if not getattr(Template.render, 'instrumented', False):
+            Template.render = _instrumented_render(Template.render)
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            with stats.instrument():
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = request.resolver_match
+        name = match.view_name if match else '<unresolved>'
+        total = time.perf_counter() - stats.started
+        sample = {
+            'queries': stats.queries,
+            'duplicates': stats.duplicates,
+            'db_ms': round(stats.db_time * 1000, 2),
+            'template_ms': round(stats.template_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }
+        summary.add(name, sample)
+
+        response['X-DB-Query-Count'] = str(sample['queries'])
+        response['X-DB-Duplicate-Queries'] = str(sample['duplicates'])
+        response['X-DB-Time-Ms'] = str(sample['db_ms'])
+        response['X-Template-Time-Ms'] = str(sample['template_ms'])
+        response['Server-Timing'] = (
+            f"db;dur={sample['db_ms']}, template;dur={sample['template_ms']}, total;dur={sample['total_ms']}"
+        )
+
+        self.check_budget(name, request, stats)
+        return response
+
+    def check_budget(self, name, request, stats):
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(name)
+        if budget is None or stats.queries <= budget:
+            return
+        message = (
+            f'{name} ran {stats.queries} queries for {request.path}, budget is {budget}. '
+            f'Most repeated: {stats.top_duplicates()}'
+        )
+        if getattr(settings, 'QUERY_BUDGET_ACTION', 'log') == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+@staff_member_required
+def request_stats(request):
+    """Rolling per-URL-name query and timing summary as JSON"""
+    return JsonResponse({'window': summary.window, 'views': summary.summary()})
@@ -0,0 +1,110 @@
+"""
+Primary/replica routing.
+
+When a ``replica`` database is configured, reads of the catalog apps
+(``CATALOG_APPS``) go to it so they stop contending with the rating,
+review, progress and download writes on the primary. Everything else, and
+every write, uses ``default``.
+
+A replica lags behind the primary, so users must still see their own
+writes. POST requests read from the primary throughout, as does any
+request once it has written, and ReplicaPinningMiddleware sets a
+short-lived cookie after a write from a POST so that the user's next pages
+do too. Reads inside a transaction on the primary stay there as well. Code
+outside requests that reads what it just wrote can use :func:`use_primary`.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+CATALOG_APPS = {'movies', 'theme'}
+
+PIN_COOKIE = 'pin_primary'
+
+
+class PinState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('replica_pin', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def use_primary():
+    """Send every read made inside the block to the primary"""
+    token = _state.set(PinState(pinned=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Catalog reads to the replica unless pinned, see the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in CATALOG_APPS or not replica_configured():
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None and (state.pinned or state.wrote):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinningMiddleware:
+    """Pin a user's reads to the primary for ``REPLICA_PIN_SECONDS`` after they write"""
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Requests that change data read what they are about to change from the primary
+        unsafe = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        state = PinState(pinned=unsafe or PIN_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        # Buffered view counts can be flushed by any request, only pin the
+        # user after their own change (rating, review, download...)
+        if state.wrote and unsafe:
+            response.set_cookie(
+                PIN_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'moviewebsite.middleware.QueryInstrumentationMiddleware',  # off unless REQUEST_INSTRUMENTATION
+    'moviewebsite.routers.ReplicaPinningMiddleware',  # off unless a replica is configured
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +73,20 @@ DATABASES = {
     }
 }
 
+# Catalog reads go to a 'replica' alias when one is configured (see
+# moviewebsite.routers). REPLICA_DB_NAME adds one with the same engine as
+# 'default'; locally that is a second SQLite file, refreshed from the
+# primary with `manage.py sync_replica`
+if os.environ.get('REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['REPLICA_DB_NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['moviewebsite.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 10  # reads stay on the primary this long after a user writes
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -140,3 +157,123 @@ MEDIA_ROOT = BASE_DIR / 'media'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = 'login'
+
+# View counting
+# 'memory' buffers per worker process, 'cache' shares pending counts through the cache
+VIEW_COUNTER_BACKEND = 'memory'
+VIEW_COUNTER_FLUSH_INTERVAL = 10  # seconds between flushes to the database
+VIEW_COUNTER_MAX_PENDING = 1000  # flush early once this many objects are pending
+
+# Write buffers
+# Views, downloads, playback progress and trending events are buffered per
+# worker (movies.buffering) and written by a background thread once their
+# flush interval has passed, whether or not requests keep coming
+WRITE_BUFFER_BACKGROUND_FLUSH = True  # False leaves flushing to requests and process exit
+TEST_RUNNER = 'moviewebsite.test_runner.TestRunner'  # keeps pending writes away from the real database
+
+# Full-text search
+SEARCH_MAX_RESULTS = 1000  # matches kept per search, best ranked first
+
+# Advertisements
+ADS_SCHEDULE_MAX_AGE = 60  # seconds before a worker reloads the ad schedule
+
+# Downloads
+# None streams files from Django; 'x-sendfile' (Apache, lighttpd) or
+# 'x-accel-redirect' (nginx) hands the transfer to the front web server
+DOWNLOAD_OFFLOAD = None
+DOWNLOAD_ACCEL_REDIRECT_PREFIX = '/protected-media/'  # internal nginx location serving MEDIA_ROOT
+DOWNLOAD_LOG_FLUSH_INTERVAL = 10  # seconds between bulk writes of the download log
+DOWNLOAD_LOG_MAX_PENDING = 1000  # write early once this many downloads are waiting
+
+# Playback progress
+PROGRESS_FLUSH_INTERVAL = 5  # seconds; bounds how much progress a crash can lose
+PROGRESS_MAX_PENDING = 5000  # flush early once this many (user, content) pairs are waiting
+PROGRESS_BATCH_MAX_SAMPLES = 500  # samples accepted per batch request
+
+# Request instrumentation
+# Adds X-DB-Query-Count, X-DB-Time-Ms, X-Template-Time-Ms and Server-Timing
+# headers and keeps a per-URL-name summary at /_stats/requests/ (staff only)
+REQUEST_INSTRUMENTATION = False
+REQUEST_STATS_WINDOW = 200  # requests kept per URL name
+QUERY_BUDGETS = {
+    'home': 12,
+    'movies:movies_list': 8,
+    'movies:movie_detail': 10,
+    'movies:series_list': 8,
+    'movies:series_detail': 10,
+    'movies:episode_detail': 10,
+    'api:list': 4,  # one query plus one per to-many include
+    'api:detail': 4,
+}
+QUERY_BUDGET_ACTION = 'log'  # or 'raise', which the test runner uses so that tests fail on views over budget
+
+# Caching
+# Use a cache shared by all workers (Redis, Memcached) in production so that
+# fragment version bumps reach every process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moviewebsite',
+    }
+}
+FRAGMENT_CACHE_TIMEOUT = 3600  # seconds; versioned keys make stale fragments unreachable before that
+
+# Image derivatives
+# Uploads are resized by `manage.py build_image_derivatives --watch`, not by the web workers
+IMAGE_DERIVATIVES_ASYNC = True  # False resizes during the upload request instead, for development
+
+# Async views
+# Serve the home and detail pages with views that run their independent
+# queries concurrently. Only worth it under ASGI (moviewebsite.asgi)
+ASYNC_VIEWS = False
+
+if ASYNC_VIEWS:
+    # Their worker threads keep a connection each instead of opening one per query batch
+    for database in DATABASES.values():
+        database.setdefault('CONN_MAX_AGE', 60)
+
+# Watch history
+WATCH_HISTORY_RETENTION_DAYS = 365  # daily viewing aggregates kept by `manage.py compact_watch_history`
+
+# Conditional GET
+# Detail and category pages send an ETag to anonymous visitors and answer
+# revalidations of unchanged pages with a 304
+CONDITIONAL_PAGES = True
+PAGE_ETAG_RELEASE = os.environ.get('RELEASE', '')  # set per deploy so template changes reach cached copies
+
+# Home page
+HOME_SNAPSHOT_MAX_AGE = 300  # seconds before a worker rebuilds the home page content on its own
+
+# Trending
+TRENDING_HALF_LIFE_HOURS = 48  # an event counts half as much after this long; run `manage.py rebuild_trending` after changing it
+TRENDING_WEIGHTS = {
+    'view': 1.0,
+    'watch': 2.0,  # a watching session: first progress of a title, or first of a new day
+    'rating': 3.0,  # for five stars, scaled down for fewer
+    'download': 5.0,  # a request for the file from its first byte, not the range requests resuming it
+}
+TRENDING_FLUSH_INTERVAL = 30  # seconds between leaderboard writes
+TRENDING_MAX_PENDING = 1000  # write early once this many titles are waiting
+
+# In-memory indexes
+# Search suggestions and movie facets are served from indexes each worker
+# builds in a background thread (movies.rebuilding) from its first request
+# on, and rebuilds there, using the previous ones meanwhile
+INDEX_BACKGROUND_BUILD = True  # False rebuilds on the request instead, as tests do
+
+# Search suggestions
+AUTOCOMPLETE_MIN_LENGTH = 2  # characters typed before suggestions are offered
+AUTOCOMPLETE_LIMIT = 8  # suggestions per answer
+AUTOCOMPLETE_MAX_AGE = 600  # seconds before a worker rebuilds its index, refreshing popularity
+
+# Movie facets
+FACET_INDEX_MAX_AGE = 300  # seconds before a worker rebuilds its facet index, picking up rating changes
+FACET_PEOPLE_LIMIT = 15  # directors and actors listed as facets, those with most movies
+
+# Series
+SEASON_PAGE_SIZE = 25  # episodes per page of a season on the series page
+EPISODE_WINDOW = 3  # episodes listed before and after the current one on an episode page
+
+# Profile
+PROFILE_SECTION_LIMIT = 5  # rows of each activity feed rendered with the profile page
+PROFILE_PAGE_SIZE = 20  # rows per "Load more" page of a feed
@@ -0,0 +1,42 @@
+"""
+Test runner keeping the write buffers of ``movies.buffering`` to the test databases.
+
+Views, downloads, progress and trending events recorded by tests would
+otherwise be written by the buffers' background threads, outside the
+tests' transactions, or when the process exits, after the test databases
+are gone and into the database named in the settings. Background flushing
+is turned off for the run, tests flush explicitly, and whatever is still
+pending is dropped before the test databases are destroyed.
+
+In-memory indexes (``movies.rebuilding``) are built on the request for the
+same reason: a background thread would not see the tests' uncommitted data.
+
+Requests are instrumented (``moviewebsite.middleware``) with
+``QUERY_BUDGET_ACTION = 'raise'``, so a test requesting a view that runs
+more queries than its ``QUERY_BUDGETS`` entry fails.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from movies.buffering import discard_all
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(
+            WRITE_BUFFER_BACKGROUND_FLUSH=False,
+            INDEX_BACKGROUND_BUILD=False,
+            REQUEST_INSTRUMENTATION=True,
+            QUERY_BUDGET_ACTION='raise',
+        )
+        self._test_settings.enable()
+
+    def teardown_databases(self, old_config, **kwargs):
+        discard_all()
+        super().teardown_databases(old_config, **kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
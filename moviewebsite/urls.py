@@ -19,11 +19,13 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
+from theme import async_views
 from theme.views import home, about, contact, register
+from .middleware import request_stats
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', home, name='home'),
+    path('', async_views.home if getattr(settings, 'ASYNC_VIEWS', False) else home, name='home'),
     path('about/', about, name='about'),
     path('contact/', contact, name='contact'),
     path('register/', register, name='register'),
@@ -31,6 +33,8 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(template_name='registration/logged_out.html'), name='logout'),
     path('movies/', include('movies.urls')),
     path('user/', include('user_interactions.urls')),
+    path('api/', include('movies.api_urls')),
+    path('_stats/requests/', request_stats, name='request_stats'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,9 @@
+from movies.async_views import in_thread
+from . import views
+
+
+async def home(request):
+    """Home page view showing featured content"""
+    # Served from the in-memory snapshot; only a rebuild touches the database
+    request.user = await request.auser()
+    return await in_thread(views.home, request)
@@ -1,22 +1,19 @@
+from django.http import HttpResponse
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from movies.models import Movie, Series, Category
+from movies.conditional import is_shared_page
+from movies.home import anonymous_home_page, home_context
 
 
 def home(request):
     """Home page view showing featured content"""
-    featured_movies = Movie.objects.filter(status='published').order_by('-created_at')[:6]
-    featured_series = Series.objects.filter(status='published').order_by('-created_at')[:6]
-    categories = Category.objects.all()[:8]
-    
-    context = {
-        'featured_movies': featured_movies,
-        'featured_series': featured_series,
-        'categories': categories,
-    }
-    return render(request, 'theme/home.html', context)
+    # The content is a precomputed snapshot, see movies.home
+    if is_shared_page(request):
+        return HttpResponse(anonymous_home_page(lambda context: render_to_string('theme/home.html', context, request)))
+    return render(request, 'theme/home.html', home_context())
 
 
 def about(request):
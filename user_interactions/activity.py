@@ -0,0 +1,104 @@
+"""
+Activity feeds of the profile page.
+
+Each section of the profile (ratings, reviews, downloads, watch history)
+shows the user's ``PROFILE_SECTION_LIMIT`` newest rows, read with one keyset
+query on a (user, newest first) index. Further pages come as HTML fragments
+from ``/user/profile/<section>/?cursor=...``, so the profile costs the same
+queries and bytes however active the user has been.
+
+The total shown next to each section is stored on UserProfile instead of
+being counted. Single ratings, reviews and downloads adjust it from signals
+(see ``user_interactions.signals``); the writers that insert or delete in
+bulk (the download log, playback progress and the watch history compaction)
+recount the users they touched. ``manage.py rebuild_activity_totals``
+recounts everybody.
+"""
+from django.conf import settings
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from movies.pagination import paginate
+from .models import Rating, Review, Download, WatchHistory, UserProfile
+
+
+class Section:
+    """One activity feed of the profile"""
+
+    def __init__(self, name, title, model, ordering, related, empty_message):
+        self.name = name
+        self.title = title
+        self.model = model
+        self.ordering = ordering
+        self.related = related
+        self.empty_message = empty_message
+        self.total_field = f'{name}_count'
+        self.item_template = f'user_interactions/activity/{name}.html'
+
+    def queryset(self, user):
+        return self.model.objects.filter(user=user).select_related(*self.related)
+
+    def page(self, user, cursor=None, per_page=None):
+        per_page = per_page or getattr(settings, 'PROFILE_PAGE_SIZE', 20)
+        return paginate(self.queryset(user), cursor, per_page, self.ordering)
+
+
+SECTIONS = {
+    section.name: section for section in [
+        Section('ratings', 'My Ratings', Rating, ('-created_at', '-id'), ('movie', 'series', 'episode'),
+                "You haven't rated anything yet."),
+        Section('reviews', 'My Reviews', Review, ('-created_at', '-id'), ('movie', 'series', 'episode'),
+                "You haven't written any reviews yet."),
+        Section('downloads', 'My Downloads', Download, ('-download_date', '-id'), ('movie', 'episode'),
+                "You haven't downloaded anything yet."),
+        Section('history', 'Watch History', WatchHistory, ('-watched_at', '-id'), ('movie', 'episode'),
+                "Your watch history is empty."),
+    ]
+}
+
+
+def adjust_total(user_id, section, delta):
+    """Add ``delta`` to one of the user's totals"""
+    field = SECTIONS[section].total_field
+    UserProfile.objects.filter(user_id=user_id).update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def recount_totals(user_ids, sections=None):
+    """Count the rows of ``sections`` (all by default) again for the given users"""
+    user_ids = set(user_ids)
+    profiles = list(UserProfile.objects.filter(user_id__in=user_ids))
+    if not profiles:
+        return
+    sections = [SECTIONS[name] for name in (sections or SECTIONS)]
+    for section in sections:
+        counts = dict(
+            section.model.objects.filter(user_id__in=user_ids)
+            .values_list('user_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        for profile in profiles:
+            setattr(profile, section.total_field, counts.get(profile.user_id, 0))
+    UserProfile.objects.bulk_update(profiles, [section.total_field for section in sections], batch_size=500)
+
+
+def get_profile(user):
+    """The user's profile, created with its totals counted on first use"""
+    profile, created = UserProfile.objects.get_or_create(user=user)
+    if created:
+        recount_totals([user.pk])
+        profile.refresh_from_db()
+    return profile
+
+
+def profile_sections(user, profile):
+    """First page and total of every section, for the profile page"""
+    limit = getattr(settings, 'PROFILE_SECTION_LIMIT', 5)
+    return [
+        {
+            'section': section,
+            'total': getattr(profile, section.total_field),
+            'page': section.page(user, per_page=limit),
+        }
+        for section in SECTIONS.values()
+    ]
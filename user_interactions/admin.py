@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Rating, Review, Download, WatchHistory, UserProfile
+from .models import Rating, Review, Download, DownloadEvent, WatchHistory, WatchDailyAggregate, UserProfile
 
 
 @admin.register(Rating)
@@ -57,6 +57,23 @@ class DownloadAdmin(admin.ModelAdmin):
         return obj.movie or obj.episode
 
 
+@admin.register(DownloadEvent)
+class DownloadEventAdmin(admin.ModelAdmin):
+    list_display = ['user', 'content_type', 'content_object', 'created_at', 'ip_address', 'range_start', 'range_end']
+    list_filter = ['created_at']
+    search_fields = ['user__username', 'movie__title', 'episode__title', 'ip_address']
+    
+    def content_type(self, obj):
+        if obj.movie:
+            return f"Movie: {obj.movie.title}"
+        elif obj.episode:
+            return f"Episode: {obj.episode.title}"
+        return "Unknown"
+    
+    def content_object(self, obj):
+        return obj.movie or obj.episode
+
+
 @admin.register(WatchHistory)
 class WatchHistoryAdmin(admin.ModelAdmin):
     list_display = ['user', 'content_type', 'content_object', 'watched_at', 'progress']
@@ -74,6 +91,23 @@ class WatchHistoryAdmin(admin.ModelAdmin):
         return obj.movie or obj.episode
 
 
+@admin.register(WatchDailyAggregate)
+class WatchDailyAggregateAdmin(admin.ModelAdmin):
+    list_display = ['user', 'content_type', 'content_object', 'day', 'events', 'max_progress']
+    list_filter = ['day']
+    search_fields = ['user__username', 'movie__title', 'episode__title']
+    
+    def content_type(self, obj):
+        if obj.movie:
+            return f"Movie: {obj.movie.title}"
+        elif obj.episode:
+            return f"Episode: {obj.episode.title}"
+        return "Unknown"
+    
+    def content_object(self, obj):
+        return obj.movie or obj.episode
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'preferred_language', 'country']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class UserInteractionsConfig(AppConfig):
     name = 'user_interactions'
+
+    def ready(self):
+        from . import signals  # noqa: F401
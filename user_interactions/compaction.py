@@ -0,0 +1,142 @@
+"""
+Watch history rollup and retention.
+
+WatchHistory is the hot table read by the history and profile pages: it
+should hold a single row per (user, content) with the latest progress, so
+reading it scales with the titles a user watched rather than with how long
+they watched them. Older viewing events, the extra rows left by earlier
+versions of progress tracking or by two workers flushing the same pair, and
+the previous day's state of a row that progress moves to a new day (see
+``user_interactions.progress``), are folded into WatchDailyAggregate, one
+row per (user, content, day). ``manage.py compact_watch_history`` does the
+folding and deletes aggregates older than ``WATCH_HISTORY_RETENTION_DAYS``,
+in chunks so that no statement holds locks for long.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .activity import recount_totals
+from .models import WatchHistory, WatchDailyAggregate
+
+
+CONTENT_FIELDS = ('movie', 'episode')
+
+
+def roll_up(events):
+    """Add viewing events to the daily aggregates.
+
+    ``events`` are ``(user_id, field, content_id, watched_at, progress)``
+    tuples, ``field`` being ``'movie'`` or ``'episode'``.
+    """
+    totals = {}
+    for user_id, field, content_id, watched_at, progress in events:
+        key = (user_id, field, content_id, timezone.localdate(watched_at))
+        count, best, last = totals.get(key, (0, 0.0, watched_at))
+        totals[key] = (count + 1, max(best, progress), max(last, watched_at))
+
+    for field in CONTENT_FIELDS:
+        keys = [key for key in totals if key[1] == field]
+        if not keys:
+            continue
+        existing = {
+            (aggregate.user_id, field, getattr(aggregate, f'{field}_id'), aggregate.day): aggregate
+            for aggregate in WatchDailyAggregate.objects.filter(
+                user_id__in={key[0] for key in keys},
+                day__in={key[3] for key in keys},
+                **{f'{field}_id__in': {key[2] for key in keys}},
+            )
+        }
+
+        to_update, to_create = [], []
+        for key in keys:
+            count, best, last = totals[key]
+            aggregate = existing.get(key)
+            if aggregate is None:
+                to_create.append(WatchDailyAggregate(
+                    user_id=key[0],
+                    day=key[3],
+                    events=count,
+                    max_progress=best,
+                    last_watched_at=last,
+                    **{f'{field}_id': key[2]},
+                ))
+            else:
+                aggregate.events += count
+                aggregate.max_progress = max(aggregate.max_progress, best)
+                aggregate.last_watched_at = max(aggregate.last_watched_at, last)
+                to_update.append(aggregate)
+
+        WatchDailyAggregate.objects.bulk_update(
+            to_update, ['events', 'max_progress', 'last_watched_at'], batch_size=500
+        )
+        WatchDailyAggregate.objects.bulk_create(to_create, batch_size=500)
+
+
+def delete_in_chunks(queryset, chunk_size=500):
+    """Delete the rows of ``queryset`` ``chunk_size`` at a time; returns how many went"""
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def duplicate_pairs(field):
+    """``(user_id, content_id)`` pairs with more than one history row"""
+    rows = (
+        WatchHistory.objects.filter(**{f'{field}__isnull': False})
+        .values_list('user_id', f'{field}_id')
+        .annotate(rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    return [(user_id, content_id) for user_id, content_id, _ in rows]
+
+
+def fold_pairs(field, pairs, chunk_size=500):
+    """Keep the latest history row of each pair, rolling the others up; returns rows folded"""
+    pairs = set(pairs)
+    with transaction.atomic():
+        rows = WatchHistory.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            **{f'{field}_id__in': {content_id for _, content_id in pairs}},
+        ).order_by('watched_at', 'id').values_list('id', 'user_id', f'{field}_id', 'watched_at', 'progress')
+
+        by_pair = defaultdict(list)
+        for row in rows:
+            if (row[1], row[2]) in pairs:
+                by_pair[row[1], row[2]].append(row)
+
+        stale, events = [], []
+        for pair_rows in by_pair.values():
+            # The last row is the latest and stays in the hot table
+            for pk, user_id, content_id, watched_at, progress in pair_rows[:-1]:
+                stale.append(pk)
+                events.append((user_id, field, content_id, watched_at, progress))
+
+        roll_up(events)
+        for start in range(0, len(stale), chunk_size):
+            WatchHistory.objects.filter(pk__in=stale[start:start + chunk_size]).delete()
+        recount_totals({user_id for user_id, _ in by_pair}, ['history'])
+    return len(stale)
+
+
+def compact_duplicates(chunk_size=500):
+    """Fold every duplicated (user, content) pair, ``chunk_size`` pairs per transaction"""
+    folded = 0
+    for field in CONTENT_FIELDS:
+        pairs = duplicate_pairs(field)
+        for start in range(0, len(pairs), chunk_size):
+            folded += fold_pairs(field, pairs[start:start + chunk_size], chunk_size)
+    return folded
+
+
+def enforce_retention(days, chunk_size=500):
+    """Delete daily aggregates older than ``days``; returns how many were deleted"""
+    cutoff = timezone.localdate() - timedelta(days=days)
+    return delete_in_chunks(WatchDailyAggregate.objects.filter(day__lt=cutoff), chunk_size)
@@ -0,0 +1,129 @@
+"""
+Buffered download log.
+
+Every served download request is logged as a DownloadEvent with the
+client's IP and the byte range it asked for. Events are buffered in memory
+and written with one ``bulk_create`` every ``DOWNLOAD_LOG_FLUSH_INTERVAL``
+seconds or once ``DOWNLOAD_LOG_MAX_PENDING`` are waiting, so a download
+never waits on a database write. The same flush adds first downloads to
+Download, the per-user set of downloaded titles, whose cached copy answers
+"has this user downloaded it before" without a query. Only requests that
+fetch the file from its first byte count for trending; a client resuming or
+seeking sends many range requests for what is a single download.
+"""
+import itertools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from movies.buffering import FlushingBuffer
+from movies.trending import record_events
+from .activity import recount_totals
+from .models import Download, DownloadEvent
+
+
+DOWNLOADED_SET_TIMEOUT = 24 * 60 * 60  # seconds
+
+# Events of requests without a Range header or with one starting at byte 0
+FROM_START = Q(range_start=0) | Q(range_start__isnull=True, range_end__isnull=True)
+
+
+def from_start(range_start, range_end):
+    """Whether a request for the given byte range starts a download, see FROM_START"""
+    return range_start == 0 or (range_start is None and range_end is None)
+
+
+class DownloadLogBuffer(FlushingBuffer):
+    """Pending events, each under a key of its own"""
+
+    def merge(self, pending, key, value):
+        pending[key] = value
+
+    def write(self, batch):
+        write_events(batch.values())
+
+
+def write_events(events):
+    """Append ``(user_id, field, content_id, created_at, ip, start, end)`` events to the log"""
+    rows, first = [], {}
+    for user_id, field, content_id, created_at, ip_address, range_start, range_end in events:
+        content = {f'{field}_id': content_id}
+        rows.append(DownloadEvent(
+            user_id=user_id,
+            created_at=created_at,
+            ip_address=ip_address,
+            range_start=range_start,
+            range_end=range_end,
+            **content,
+        ))
+        first.setdefault((user_id, field, content_id), Download(user_id=user_id, ip_address=ip_address, **content))
+
+    with transaction.atomic():
+        DownloadEvent.objects.bulk_create(rows, batch_size=500)
+        # Titles already in the set hit the unique constraints and are skipped
+        Download.objects.bulk_create(first.values(), batch_size=500, ignore_conflicts=True)
+        # bulk_create sends no signals and does not tell which rows were new
+        recount_totals({user_id for user_id, _, _ in first}, ['downloads'])
+
+    record_events(
+        (f'movies.{field}', content_id, 'download', 1, created_at)
+        for _, field, content_id, created_at, _, range_start, range_end in events
+        if from_start(range_start, range_end)
+    )
+
+
+_buffer = None
+_keys = itertools.count()
+
+
+def get_download_log():
+    global _buffer
+    if _buffer is None:
+        _buffer = DownloadLogBuffer(
+            flush_interval=getattr(settings, 'DOWNLOAD_LOG_FLUSH_INTERVAL', 10),
+            max_pending=getattr(settings, 'DOWNLOAD_LOG_MAX_PENDING', 1000),
+        )
+    return _buffer
+
+
+def _set_key(user_id):
+    return f'downloaded:{user_id}'
+
+
+def forget_downloaded_set(user_id):
+    cache.delete(_set_key(user_id))
+
+
+def downloaded_set(user_id):
+    """``(field, content_id)`` of every title the user has downloaded"""
+    downloaded = cache.get(_set_key(user_id))
+    if downloaded is None:
+        downloaded = set()
+        for movie_id, episode_id in Download.objects.filter(user_id=user_id).values_list('movie_id', 'episode_id'):
+            downloaded.add(('movie', movie_id) if movie_id else ('episode', episode_id))
+        cache.set(_set_key(user_id), downloaded, DOWNLOADED_SET_TIMEOUT)
+    return downloaded
+
+
+def record_download(user_id, content, ip_address=None, byte_range=(None, None)):
+    """Log one download of a Movie or Episode; returns whether it is the user's first of it"""
+    field = content._meta.model_name
+    downloaded = downloaded_set(user_id)
+    first = (field, content.pk) not in downloaded
+    if first:
+        cache.set(_set_key(user_id), downloaded | {(field, content.pk)}, DOWNLOADED_SET_TIMEOUT)
+
+    range_start, range_end = byte_range
+    get_download_log().add(
+        next(_keys),
+        (user_id, field, content.pk, timezone.now(), ip_address, range_start, range_end),
+    )
+    return first
+
+
+def flush_download_log():
+    """Write all pending events of this process to the database"""
+    get_download_log().flush()
@@ -0,0 +1,152 @@
+"""
+File responses for movie and episode downloads.
+
+Supports single byte-range requests (206 Partial Content) validated with
+If-Range against a strong ETag or Last-Modified date, so paused or seeking
+clients only fetch what they need. Multi-range requests are rejected with
+416. With ``DOWNLOAD_OFFLOAD`` set, Django only authorizes the download and
+hands the transfer to the front web server through ``X-Sendfile`` or
+``X-Accel-Redirect``; the server then handles ranges itself.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/\d+$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(stat):
+    """Strong validator derived from the file's size and modification time"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """Return ``(start, end)`` (inclusive) for a Range header, or None to ignore it.
+
+    Raises RangeNotSatisfiable for multi-range requests and ranges that lie
+    outside the file.
+    """
+    header = header.strip()
+    if ',' in header:
+        raise RangeNotSatisfiable('Multiple ranges are not supported')
+    match = RANGE_RE.match(header)
+    if not match:
+        # Unknown units or bad syntax: serve the whole file
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable('Empty suffix range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable('Range outside of file')
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, mtime):
+    """Whether a Range request may be honoured according to If-Range"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # Weak validators never match (RFC 9110, section 13.1.5)
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_response(fieldfile, path):
+    mode = settings.DOWNLOAD_OFFLOAD
+    response = HttpResponse()
+    if mode == 'x-sendfile':
+        response['X-Sendfile'] = path
+    elif mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(fieldfile.name)
+    else:
+        raise ValueError(f'Unknown DOWNLOAD_OFFLOAD mode: {mode!r}')
+    # Let the front server fill in the real type and length
+    del response['Content-Type']
+    return response
+
+
+def serve_file(request, fieldfile, filename, content_type='video/mp4'):
+    """Send ``fieldfile`` as an attachment named ``filename``"""
+    path = fieldfile.path
+    stat = os.stat(path)
+    etag = file_etag(stat)
+
+    if getattr(settings, 'DOWNLOAD_OFFLOAD', None):
+        response = offload_response(fieldfile, path)
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and if_range_matches(request, etag, stat.st_mtime):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                response['Accept-Ranges'] = 'bytes'
+                return response
+
+        if byte_range:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(iter_range(path, start, length), status=206, content_type=content_type)
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def served_range(request, response):
+    """``(start, end)`` of the bytes a download response covers, ``(None, None)`` for all of them.
+
+    Offloaded transfers are ranged by the web server, so the requested range
+    is reported instead; an open end or a suffix range leaves one side empty.
+    """
+    match = CONTENT_RANGE_RE.match(response.get('Content-Range', ''))
+    if match:
+        return int(match[1]), int(match[2])
+    if response.has_header('X-Sendfile') or response.has_header('X-Accel-Redirect'):
+        match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+        if match and any(match.groups()):
+            first, last = match.groups()
+            return (int(first) if first else None), (int(last) if last else None)
+    return None, None
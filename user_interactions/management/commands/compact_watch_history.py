@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from user_interactions.compaction import compact_duplicates, enforce_retention
+
+
+class Command(BaseCommand):
+    help = 'Fold old watch history rows into daily aggregates and delete aggregates past retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-days',
+            type=int,
+            default=getattr(settings, 'WATCH_HISTORY_RETENTION_DAYS', 365),
+            help='Days of daily aggregates to keep',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows deleted (and pairs folded) per statement',
+        )
+
+    def handle(self, *args, **options):
+        folded = compact_duplicates(options['chunk_size'])
+        self.stdout.write(f'Folded {folded} older history rows into daily aggregates')
+
+        deleted = enforce_retention(options['retention_days'], options['chunk_size'])
+        self.stdout.write(f"Deleted {deleted} daily aggregates older than {options['retention_days']} days")
+
+        self.stdout.write(self.style.SUCCESS('Watch history compacted successfully!'))
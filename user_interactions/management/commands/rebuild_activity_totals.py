@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from user_interactions.activity import recount_totals
+from user_interactions.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recount the ratings, reviews, downloads and watch history totals shown on user profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Profiles recounted per batch')
+
+    def handle(self, *args, **options):
+        user_ids = list(UserProfile.objects.order_by('user_id').values_list('user_id', flat=True))
+        for start in range(0, len(user_ids), options['batch_size']):
+            recount_totals(user_ids[start:start + options['batch_size']])
+        self.stdout.write(f'Recounted activity totals of {len(user_ids)} profiles')
+
+        self.stdout.write(self.style.SUCCESS('Activity totals rebuilt successfully!'))
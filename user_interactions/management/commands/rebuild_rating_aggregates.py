@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from movies.models import Movie, Series, Episode
+from user_interactions.ratings import rebuild_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored rating totals of movies, series and episodes'
+
+    def handle(self, *args, **options):
+        for model in (Movie, Series, Episode):
+            total = rebuild_aggregates(model)
+            self.stdout.write(f'Updated rating totals for {total} rated {model.__name__} rows')
+
+        self.stdout.write(self.style.SUCCESS('Rating aggregates rebuilt successfully!'))
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:40
+
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Rating = apps.get_model('user_interactions', 'Rating')
+    fields = ['rating_sum', 'rating_count'] + [f'rating_count_{stars}' for stars in range(1, 6)]
+    for field in ('movie', 'series', 'episode'):
+        model = apps.get_model('movies', field)
+        totals = defaultdict(lambda: defaultdict(int))
+        rows = (
+            Rating.objects.filter(**{f'{field}__isnull': False})
+            .values_list(field, 'rating')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for pk, stars, count in rows:
+            totals[pk]['rating_sum'] += stars * count
+            totals[pk]['rating_count'] += count
+            totals[pk][f'rating_count_{stars}'] += count
+        objects = []
+        for pk, values in totals.items():
+            obj = model(pk=pk)
+            for name in fields:
+                setattr(obj, name, values[name])
+            objects.append(obj)
+        model.objects.bulk_update(objects, fields, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_rating_aggregates'),
+        ('user_interactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
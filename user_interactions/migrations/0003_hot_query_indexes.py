@@ -0,0 +1,44 @@
+# Generated by Django 6.0.2 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_hot_query_indexes'),
+        ('user_interactions', '0002_backfill_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(condition=models.Q(('movie__isnull', False)), fields=['user', 'movie'], name='rating_user_movie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(condition=models.Q(('series__isnull', False)), fields=['user', 'series'], name='rating_user_series_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(condition=models.Q(('episode__isnull', False)), fields=['user', 'episode'], name='rating_user_episode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('movie__isnull', False)), fields=['movie', '-created_at'], name='review_movie_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('series__isnull', False)), fields=['series', '-created_at'], name='review_series_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('episode__isnull', False)), fields=['episode', '-created_at'], name='review_episode_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='watchhistory',
+            index=models.Index(fields=['user', '-watched_at'], name='watch_user_recent_idx'),
+        ),
+    ]
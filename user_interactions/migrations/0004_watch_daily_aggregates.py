@@ -0,0 +1,62 @@
+# Generated by Django 6.0.2 on 2026-10-18 07:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_hot_query_indexes'),
+        ('user_interactions', '0003_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchDailyAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('max_progress', models.FloatField(default=0.0)),
+                ('last_watched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='watchhistory',
+            name='watch_user_recent_idx',
+        ),
+        migrations.AddIndex(
+            model_name='watchhistory',
+            index=models.Index(fields=['user', '-watched_at', '-id'], name='watch_user_recent_idx'),
+        ),
+        migrations.AddField(
+            model_name='watchdailyaggregate',
+            name='episode',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.episode'),
+        ),
+        migrations.AddField(
+            model_name='watchdailyaggregate',
+            name='movie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.movie'),
+        ),
+        migrations.AddField(
+            model_name='watchdailyaggregate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='watchdailyaggregate',
+            index=models.Index(fields=['day'], name='watch_daily_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchdailyaggregate',
+            constraint=models.UniqueConstraint(condition=models.Q(('movie__isnull', False)), fields=('user', 'movie', 'day'), name='watch_daily_user_movie_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='watchdailyaggregate',
+            constraint=models.UniqueConstraint(condition=models.Q(('episode__isnull', False)), fields=('user', 'episode', 'day'), name='watch_daily_user_episode_day'),
+        ),
+    ]
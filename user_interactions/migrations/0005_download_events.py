@@ -0,0 +1,84 @@
+# Generated by Django 6.0.2 on 2026-10-18 07:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def log_and_deduplicate_downloads(apps, schema_editor):
+    """Copy every recorded download into the event log, then keep only the first per user and title"""
+    Download = apps.get_model('user_interactions', 'Download')
+    DownloadEvent = apps.get_model('user_interactions', 'DownloadEvent')
+    events = (
+        DownloadEvent(
+            user_id=download.user_id,
+            movie_id=download.movie_id,
+            episode_id=download.episode_id,
+            created_at=download.download_date,
+            ip_address=download.ip_address,
+        )
+        for download in Download.objects.order_by('id').iterator()
+    )
+    DownloadEvent.objects.bulk_create(events, batch_size=1000)
+
+    seen = set()
+    duplicates = []
+    for pk, user_id, movie_id, episode_id in Download.objects.order_by('download_date', 'id').values_list(
+        'id', 'user_id', 'movie_id', 'episode_id'
+    ):
+        key = (user_id, movie_id, episode_id)
+        if key in seen:
+            duplicates.append(pk)
+        seen.add(key)
+    for start in range(0, len(duplicates), 500):
+        Download.objects.filter(pk__in=duplicates[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_hot_query_indexes'),
+        ('user_interactions', '0004_watch_daily_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DownloadEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('range_start', models.BigIntegerField(blank=True, null=True)),
+                ('range_end', models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='downloadevent',
+            name='episode',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.episode'),
+        ),
+        migrations.AddField(
+            model_name='downloadevent',
+            name='movie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='movies.movie'),
+        ),
+        migrations.AddField(
+            model_name='downloadevent',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='downloadevent',
+            index=models.Index(fields=['created_at'], name='download_event_created_idx'),
+        ),
+        migrations.RunPython(log_and_deduplicate_downloads, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='download',
+            constraint=models.UniqueConstraint(condition=models.Q(('movie__isnull', False)), fields=('user', 'movie'), name='download_user_movie_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='download',
+            constraint=models.UniqueConstraint(condition=models.Q(('episode__isnull', False)), fields=('user', 'episode'), name='download_user_episode_unique'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_activity(apps, schema_editor):
+    """Fill the activity totals of existing profiles"""
+    UserProfile = apps.get_model('user_interactions', 'UserProfile')
+    sources = {
+        'ratings_count': apps.get_model('user_interactions', 'Rating'),
+        'reviews_count': apps.get_model('user_interactions', 'Review'),
+        'downloads_count': apps.get_model('user_interactions', 'Download'),
+        'history_count': apps.get_model('user_interactions', 'WatchHistory'),
+    }
+    counts = {
+        field: dict(model.objects.values_list('user_id').annotate(total=models.Count('id')).order_by())
+        for field, model in sources.items()
+    }
+    profiles = list(UserProfile.objects.all())
+    for profile in profiles:
+        for field in sources:
+            setattr(profile, field, counts[field].get(profile.user_id, 0))
+    UserProfile.objects.bulk_update(profiles, list(sources), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_interactions', '0005_download_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='downloads_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='history_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='ratings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='download',
+            index=models.Index(fields=['user', '-download_date', '-id'], name='download_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='rating_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='review_user_recent_idx'),
+        ),
+        migrations.RunPython(count_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.2 on 2026-10-18 08:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_interactions', '0006_profile_activity_feeds'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_user_movie_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_user_series_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='rating',
+            name='rating_user_episode_idx',
+        ),
+    ]
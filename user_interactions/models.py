@@ -13,6 +13,10 @@ class Rating(models.Model):
     
     class Meta:
         unique_together = ('user', 'movie', 'series', 'episode')  # A user can rate each content once
+        indexes = [
+            # The user's ratings feed on the profile, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='rating_user_recent_idx'),
+        ]
     
     def __str__(self):
         content = self.movie or self.series or self.episode
@@ -29,6 +33,28 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # The user's reviews feed on the profile, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='review_user_recent_idx'),
+            # Newest reviews of one piece of content, as shown on its page
+            models.Index(
+                fields=['movie', '-created_at'],
+                condition=models.Q(movie__isnull=False),
+                name='review_movie_recent_idx',
+            ),
+            models.Index(
+                fields=['series', '-created_at'],
+                condition=models.Q(series__isnull=False),
+                name='review_series_recent_idx',
+            ),
+            models.Index(
+                fields=['episode', '-created_at'],
+                condition=models.Q(episode__isnull=False),
+                name='review_episode_recent_idx',
+            ),
+        ]
+    
     def __str__(self):
         content = self.movie or self.series or self.episode
         return f"Review by {self.user.username} on {content}"
@@ -41,11 +67,52 @@ class Download(models.Model):
     download_date = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     
+    class Meta:
+        # The set of titles each user has downloaded; every single download
+        # is logged in DownloadEvent
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'movie'],
+                condition=models.Q(movie__isnull=False),
+                name='download_user_movie_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'episode'],
+                condition=models.Q(episode__isnull=False),
+                name='download_user_episode_unique',
+            ),
+        ]
+        indexes = [
+            # The user's downloads feed on the profile, newest first
+            models.Index(fields=['user', '-download_date', '-id'], name='download_user_recent_idx'),
+        ]
+    
     def __str__(self):
         content = self.movie or self.episode
         return f"{self.user.username} downloaded {content}"
 
 
+class DownloadEvent(models.Model):
+    """One served download request, append-only (see ``user_interactions.download_log``)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True)
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField()
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    # Inclusive byte range, both empty when the whole file was requested
+    range_start = models.BigIntegerField(null=True, blank=True)
+    range_end = models.BigIntegerField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='download_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        content = self.movie or self.episode
+        return f"{self.user.username} downloaded {content} at {self.created_at}"
+
+
 class WatchHistory(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True)
@@ -53,17 +120,60 @@ class WatchHistory(models.Model):
     watched_at = models.DateTimeField(auto_now_add=True)
     progress = models.FloatField(default=0.0)  # Progress percentage (0.0 to 100.0)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-watched_at', '-id'], name='watch_user_recent_idx'),
+        ]
+    
     def __str__(self):
         content = self.movie or self.episode
         return f"{self.user.username} watched {content}"
 
 
+class WatchDailyAggregate(models.Model):
+    """One user's viewing of one title on one day, rolled up from WatchHistory"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, null=True, blank=True)
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE, null=True, blank=True)
+    day = models.DateField()
+    events = models.PositiveIntegerField(default=0)  # history rows folded into this one
+    max_progress = models.FloatField(default=0.0)  # furthest progress reached that day
+    last_watched_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'movie', 'day'],
+                condition=models.Q(movie__isnull=False),
+                name='watch_daily_user_movie_day',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'episode', 'day'],
+                condition=models.Q(episode__isnull=False),
+                name='watch_daily_user_episode_day',
+            ),
+        ]
+        indexes = [
+            # Retention deletes walk the oldest days
+            models.Index(fields=['day'], name='watch_daily_day_idx'),
+        ]
+    
+    def __str__(self):
+        content = self.movie or self.episode
+        return f"{self.user.username} watched {content} on {self.day}"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     favorite_genres = models.ManyToManyField('movies.Category', blank=True)
     preferred_language = models.CharField(max_length=50, default='English')
     date_of_birth = models.DateField(null=True, blank=True)
     country = models.CharField(max_length=100, blank=True)
+    # Totals of the profile's activity sections, see user_interactions.activity
+    ratings_count = models.PositiveIntegerField(default=0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    downloads_count = models.PositiveIntegerField(default=0)
+    history_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
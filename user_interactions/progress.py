@@ -0,0 +1,113 @@
+"""
+Buffered playback progress.
+
+Players report progress every few seconds. Samples are coalesced in memory
+per (user, content), keeping only the latest, and written to WatchHistory in
+bulk every ``PROGRESS_FLUSH_INTERVAL`` seconds, by the buffer's background
+thread once samples stop arriving (see ``movies.buffering``), or as soon as
+``PROGRESS_MAX_PENDING`` pairs are waiting. A crashed worker loses at most
+that much progress.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from movies.buffering import FlushingBuffer
+from movies.trending import record_events
+from .activity import recount_totals
+from .compaction import roll_up
+from .models import WatchHistory
+
+
+CONTENT_TYPES = ('movie', 'episode')
+
+
+class ProgressBuffer(FlushingBuffer):
+    """Latest ``(progress, watched_at)`` per ``(user_id, content_type, content_id)``"""
+
+    def merge(self, pending, key, value):
+        current = pending.get(key)
+        if current is None or value[1] >= current[1]:
+            pending[key] = value
+
+    def write(self, batch):
+        write_progress(batch)
+
+
+def write_progress(samples):
+    """Upsert coalesced samples into WatchHistory.
+
+    Existing rows are updated with one ``bulk_update`` and missing ones added
+    with one ``bulk_create`` per content type. A row moving on to a new day
+    leaves its previous state in the daily aggregates. New rows and rows
+    moving on to a new day count as a watching session for trending.
+    """
+    sessions, new_users = [], set()
+    with transaction.atomic():
+        previous_days = []
+        for content_type in CONTENT_TYPES:
+            field = f'{content_type}_id'
+            latest = {
+                (user_id, content_id): value
+                for (user_id, kind, content_id), value in samples.items()
+                if kind == content_type
+            }
+            if not latest:
+                continue
+
+            user_ids = {user_id for user_id, _ in latest}
+            content_ids = {content_id for _, content_id in latest}
+            existing = {}
+            rows = WatchHistory.objects.filter(
+                user_id__in=user_ids, **{f'{field}__in': content_ids}
+            ).order_by('watched_at', 'id')
+            for row in rows:
+                pair = (row.user_id, getattr(row, field))
+                if pair in latest:
+                    existing[pair] = row  # the most recent row wins
+
+            to_update, to_create = [], []
+            for (user_id, content_id), (progress, watched_at) in latest.items():
+                row = existing.get((user_id, content_id))
+                if row is None:
+                    # watched_at is auto_now_add and set on insert
+                    to_create.append(WatchHistory(user_id=user_id, progress=progress, **{field: content_id}))
+                    new_users.add(user_id)
+                    sessions.append((f'movies.{content_type}', content_id, 'watch', 1, watched_at))
+                else:
+                    if timezone.localdate(row.watched_at) != timezone.localdate(watched_at):
+                        previous_days.append((user_id, content_type, content_id, row.watched_at, row.progress))
+                        sessions.append((f'movies.{content_type}', content_id, 'watch', 1, watched_at))
+                    row.progress = progress
+                    row.watched_at = watched_at
+                    to_update.append(row)
+
+            WatchHistory.objects.bulk_update(to_update, ['progress', 'watched_at'], batch_size=500)
+            WatchHistory.objects.bulk_create(to_create, batch_size=500)
+
+        roll_up(previous_days)
+        recount_totals(new_users, ['history'])
+
+    record_events(sessions)
+
+
+_buffer = None
+
+
+def get_progress_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = ProgressBuffer(
+            flush_interval=getattr(settings, 'PROGRESS_FLUSH_INTERVAL', 5),
+            max_pending=getattr(settings, 'PROGRESS_MAX_PENDING', 5000),
+        )
+    return _buffer
+
+
+def record_progress(user_id, content_type, content_id, progress, watched_at=None):
+    """Queue one progress sample (0.0 to 100.0 percent)"""
+    progress = min(max(float(progress), 0.0), 100.0)
+    get_progress_buffer().add(
+        (user_id, content_type, content_id),
+        (progress, watched_at or timezone.now()),
+    )
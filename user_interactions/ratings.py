@@ -0,0 +1,94 @@
+"""
+Rating writes that keep the denormalized totals on Movie, Series and Episode
+(see ``movies.models.RatingAggregate``) in step with the Rating table.
+"""
+from collections import defaultdict
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from movies.trending import record_events
+from .models import Rating
+
+
+CONTENT_FIELDS = ('movie', 'series', 'episode')
+
+
+def content_field(content):
+    """Name of the Rating foreign key that points at ``content``"""
+    return content._meta.model_name
+
+
+def adjust_aggregates(model, pk, old=None, new=None):
+    """Move one rating from ``old`` to ``new`` stars on the content's totals.
+
+    ``old=None`` adds a rating, ``new=None`` removes one.
+    """
+    if old == new:
+        return
+    changes = defaultdict(int)
+    if old is not None:
+        changes['rating_sum'] -= old
+        changes['rating_count'] -= 1
+        changes[f'rating_count_{old}'] -= 1
+    if new is not None:
+        changes['rating_sum'] += new
+        changes['rating_count'] += 1
+        changes[f'rating_count_{new}'] += 1
+    model.objects.filter(pk=pk).update(**{
+        field: F(field) + delta for field, delta in changes.items() if delta
+    })
+
+
+def rate(user, content, value):
+    """Create or update ``user``'s rating of ``content``.
+
+    Returns ``(rating, created)`` like ``update_or_create``.
+    """
+    field = content_field(content)
+    with transaction.atomic():
+        rating = Rating.objects.select_for_update().filter(user=user, **{field: content}).first()
+        if rating is None:
+            rating = Rating.objects.create(user=user, rating=value, **{field: content})
+            adjust_aggregates(type(content), content.pk, new=value)
+            transaction.on_commit(partial(
+                record_events, [(content._meta.label_lower, content.pk, 'rating', value / 5, timezone.now())]
+            ))
+            return rating, True
+
+        previous = rating.rating
+        if previous != value:
+            rating.rating = value
+            rating.save(update_fields=['rating'])
+            adjust_aggregates(type(content), content.pk, old=previous, new=value)
+        return rating, False
+
+
+def rebuild_aggregates(model, batch_size=1000):
+    """Recompute the rating totals of every ``model`` row from the Rating table"""
+    field = model._meta.model_name
+    totals = defaultdict(lambda: defaultdict(int))
+    rows = (
+        Rating.objects.filter(**{f'{field}__isnull': False})
+        .values_list(field, 'rating')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for pk, stars, count in rows:
+        totals[pk]['rating_sum'] += stars * count
+        totals[pk]['rating_count'] += count
+        totals[pk][f'rating_count_{stars}'] += count
+
+    fields = ['rating_sum', 'rating_count'] + [f'rating_count_{stars}' for stars in range(1, 6)]
+    with transaction.atomic():
+        model.objects.update(**{name: 0 for name in fields})
+        objects = []
+        for pk, values in totals.items():
+            obj = model(pk=pk)
+            for name in fields:
+                setattr(obj, name, values[name])
+            objects.append(obj)
+        model.objects.bulk_update(objects, fields, batch_size=batch_size)
+    return len(objects)
@@ -0,0 +1,53 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from movies import fragments
+from .activity import adjust_total
+from .download_log import forget_downloaded_set
+from .models import Rating, Review, Download
+from .ratings import CONTENT_FIELDS, adjust_aggregates
+
+
+SECTION_OF = {Rating: 'ratings', Review: 'reviews', Download: 'downloads'}
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_aggregates(sender, instance, **kwargs):
+    """Take deleted ratings out of the content's stored totals"""
+    for field in CONTENT_FIELDS:
+        pk = getattr(instance, f'{field}_id')
+        if pk is not None:
+            model = Rating._meta.get_field(field).related_model
+            adjust_aggregates(model, pk, old=instance.rating)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_review_fragments(sender, instance, **kwargs):
+    """Reviews are part of the cached detail page fragments"""
+    for field in CONTENT_FIELDS:
+        pk = getattr(instance, f'{field}_id')
+        if pk is not None:
+            fragments.bump(Review._meta.get_field(field).related_model, [pk])
+
+
+@receiver(post_delete, sender=Download)
+def refresh_downloaded_set(sender, instance, **kwargs):
+    """Removing a download (e.g. from the admin) must show in the cached set"""
+    forget_downloaded_set(instance.user_id)
+
+
+@receiver(post_save, sender=Rating)
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Download)
+def count_new_activity(sender, instance, created=False, raw=False, **kwargs):
+    """Keep the totals shown on the profile in step, see user_interactions.activity"""
+    if created and not raw:
+        adjust_total(instance.user_id, SECTION_OF[sender], 1)
+
+
+@receiver(post_delete, sender=Rating)
+@receiver(post_delete, sender=Review)
+@receiver(post_delete, sender=Download)
+def count_removed_activity(sender, instance, **kwargs):
+    adjust_total(instance.user_id, SECTION_OF[sender], -1)
@@ -1,3 +1,573 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
+import unittest
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from movies.buffering import discard_all
+from movies.models import Movie, TrendingScore
+from movies.testing import QueryPlanTestMixin, create_episodes, create_movie, create_series
+from movies.trending import flush_trending, log_contribution, weight
+from .activity import SECTIONS, adjust_total, get_profile, recount_totals
+from .compaction import duplicate_pairs, enforce_retention, fold_pairs, roll_up
+from .download_log import downloaded_set, flush_download_log, forget_downloaded_set, record_download, write_events
+from .downloads import RangeNotSatisfiable, parse_range
+from .models import Rating, Review, Download, DownloadEvent, WatchHistory, WatchDailyAggregate, UserProfile
+from .progress import get_progress_buffer, write_progress
+from .ratings import rate, rebuild_aggregates
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class InteractionQueryPlanTests(QueryPlanTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        cls.series = create_series(0)
+        cls.episode, = create_episodes(cls.series, 1)
+        cls.user = User.objects.create_user('viewer')
+        for content in (cls.movie, cls.series, cls.episode):
+            field = content._meta.model_name
+            Rating.objects.create(user=cls.user, rating=4, **{field: content})
+            Review.objects.create(user=cls.user, title='Review', content='Text', **{field: content})
+        WatchHistory.objects.create(user=cls.user, movie=cls.movie, progress=50)
+
+    def test_profile(self):
+        self.client.force_login(self.user)
+        self.assertIndexedView('/user/profile/')
+
+    def test_user_rating_lookup(self):
+        for content in (self.movie, self.series, self.episode):
+            field = content._meta.model_name
+            with CaptureQueriesContext(connection) as queries:
+                Rating.objects.filter(user=self.user, **{field: content}).first()
+            # Through an index leading with the user, the unique constraint's or the foreign key's
+            self.assertIndexedQueries(queries.captured_queries)
+            self.assertIn('(user_id=?', ' '.join(self.query_plan(queries.captured_queries[-1]['sql'])))
+
+    def test_recent_reviews(self):
+        for content in (self.movie, self.series, self.episode):
+            field = content._meta.model_name
+            reviews = Review.objects.filter(**{field: content}).select_related('user').order_by('-created_at')
+            self.assertSeeks(reviews, f'review_{field}_recent_idx')
+
+    def test_watch_history(self):
+        history = WatchHistory.objects.filter(user=self.user).order_by('-watched_at')[:20]
+        self.assertSeeks(history, 'watch_user_recent_idx')
+
+
+class RatingAggregateTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        cls.users = [User.objects.create_user(f'viewer{number}') for number in range(3)]
+
+    def setUp(self):
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def assertTotalsMatchRatings(self):
+        """The totals stored on the movie are those of its Rating rows"""
+        self.movie.refresh_from_db()
+        ratings = Rating.objects.filter(movie=self.movie)
+        expected = ratings.aggregate(rating_sum=Sum('rating', default=0), rating_count=Count('id'))
+        for stars in range(1, 6):
+            expected[f'rating_count_{stars}'] = ratings.filter(rating=stars).count()
+        self.assertEqual({name: getattr(self.movie, name) for name in expected}, expected)
+
+    def test_create_change_delete(self):
+        first, second, third = self.users
+        _, created = rate(first, self.movie, 4)
+        self.assertTrue(created)
+        rate(second, self.movie, 2)
+        rate(third, self.movie, 5)
+        self.assertTotalsMatchRatings()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (11, 3))
+
+        _, created = rate(first, self.movie, 1)
+        self.assertFalse(created)
+        rate(second, self.movie, 2)  # unchanged
+        self.assertTotalsMatchRatings()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (8, 3))
+
+        Rating.objects.get(user=first).delete()
+        Rating.objects.filter(user=second).delete()
+        self.assertTotalsMatchRatings()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (5, 1))
+
+    def test_rebuild(self):
+        for user, stars in zip(self.users, (3, 3, 5)):
+            rate(user, self.movie, stars)
+        # Drifted totals, and a rating inserted without the adjustments
+        Movie.objects.filter(pk=self.movie.pk).update(rating_sum=100, rating_count=1, rating_count_3=0)
+        Rating.objects.bulk_create([Rating(user=User.objects.create_user('bulk'), movie=self.movie, rating=1)])
+        self.assertEqual(rebuild_aggregates(Movie), 1)
+        self.assertTotalsMatchRatings()
+        self.assertEqual((self.movie.rating_sum, self.movie.rating_count), (12, 4))
+
+
+class ParseRangeTests(SimpleTestCase):
+
+    def test_ranges(self):
+        cases = [
+            ('bytes=0-99', (0, 99)),
+            ('bytes=900-', (900, 999)),  # open-ended
+            ('bytes=900-5000', (900, 999)),  # end past the file
+            ('bytes=-100', (900, 999)),  # suffix
+            ('bytes=-5000', (0, 999)),  # suffix longer than the file
+            (' bytes=5-5 ', (5, 5)),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(parse_range(header, 1000), expected)
+
+    def test_ignored(self):
+        for header in ('bytes=-', 'items=0-10', 'bytes=a-b', 'bytes 0-10'):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=0-10,20-30', 'bytes=1000-', 'bytes=50-10', 'bytes=-0'):
+            with self.subTest(header=header):
+                with self.assertRaises(RangeNotSatisfiable):
+                    parse_range(header, 1000)
+
+
+class DownloadRangeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0, video_file='movies/movie.mp4')
+        cls.user = User.objects.create_user('viewer')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, DOWNLOAD_OFFLOAD=None))
+        self.content = bytes(range(256)) * 4
+        path = self.movie.video_file.storage.path('movies/movie.mp4')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(self.content)
+        self.url = f'/user/download-movie/{self.movie.pk}/'
+        self.client.force_login(self.user)
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_ranges(self):
+        cases = [
+            ('bytes=10-19', 10, 19),
+            ('bytes=1000-', 1000, 1023),
+            ('bytes=-24', 1000, 1023),
+        ]
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response, body = self.download(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(body, self.content[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=2000-', 'bytes=0-1,5-9'):
+            with self.subTest(header=header):
+                response, _ = self.download(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        full, _ = self.download()
+        etag, modified = full['ETag'], full['Last-Modified']
+        response, body = self.download(Range='bytes=0-9', If_Range=etag)
+        self.assertEqual((response.status_code, body), (206, self.content[:10]))
+        response, _ = self.download(Range='bytes=0-9', If_Range=modified)
+        self.assertEqual(response.status_code, 206)
+        # A changed file, or a weak validator, sends the whole file again
+        for validator in ('"other"', f'W/{etag}', 'Thu, 01 Jan 2015 00:00:00 GMT'):
+            with self.subTest(validator=validator):
+                response, body = self.download(Range='bytes=0-9', If_Range=validator)
+                self.assertEqual((response.status_code, body), (200, self.content))
+
+
+    def test_logged_events(self):
+        UserProfile.objects.create(user=self.user)
+        forget_downloaded_set(self.user.pk)
+        response, _ = self.download(X_Forwarded_For='203.0.113.5, 10.0.0.1')
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)], [
+            "'Movie 0' has been added to your downloads!",
+        ])
+        response, _ = self.download(Range='bytes=10-19')
+        # Continuing a download announces nothing; the first message was never shown
+        self.assertEqual(len(get_messages(response.wsgi_request)), 1)
+        self.download(Range='bytes=-24')
+        self.assertFalse(DownloadEvent.objects.exists())
+
+        flush_download_log()
+        events = DownloadEvent.objects.filter(user=self.user, movie=self.movie).order_by('id')
+        self.assertEqual(list(events.values_list('ip_address', 'range_start', 'range_end')), [
+            ('203.0.113.5', None, None),
+            ('127.0.0.1', 10, 19),
+            ('127.0.0.1', 1000, 1023),
+        ])
+        self.assertEqual(Download.objects.get(user=self.user).ip_address, '203.0.113.5')
+        self.assertEqual(UserProfile.objects.get(user=self.user).downloads_count, 1)
+
+    @override_settings(DOWNLOAD_OFFLOAD='x-accel-redirect')
+    def test_logged_offloaded_range(self):
+        for header in ('bytes=100-', 'bytes=-24'):
+            response, _ = self.download(Range=header)
+            self.assertIn('X-Accel-Redirect', response)
+        flush_download_log()
+        events = DownloadEvent.objects.order_by('id').values_list('range_start', 'range_end')
+        # The web server applies the range, the requested one is logged
+        self.assertEqual(list(events), [(100, None), (None, 24)])
+
+
+class DownloadLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        series = create_series(0)
+        cls.episode, = create_episodes(series, 1)
+        cls.user = User.objects.create_user('viewer')
+        UserProfile.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def test_record_download(self):
+        self.assertTrue(record_download(self.user.pk, self.movie, '192.0.2.1'))
+        # Known from the cached set before anything is written
+        with self.assertNumQueries(0):
+            self.assertFalse(record_download(self.user.pk, self.movie, '192.0.2.1', (0, 99)))
+            self.assertTrue(record_download(self.user.pk, self.episode))
+        self.assertFalse(DownloadEvent.objects.exists())
+
+        flush_download_log()
+        self.assertEqual(DownloadEvent.objects.count(), 3)
+        self.assertEqual(
+            set(Download.objects.values_list('movie', 'episode')), {(self.movie.pk, None), (None, self.episode.pk)}
+        )
+        self.assertEqual(UserProfile.objects.get(user=self.user).downloads_count, 2)
+
+    def test_downloaded_set(self):
+        Download.objects.create(user=self.user, movie=self.movie)
+        with self.assertNumQueries(1):
+            self.assertEqual(downloaded_set(self.user.pk), {('movie', self.movie.pk)})
+        with self.assertNumQueries(0):
+            self.assertEqual(downloaded_set(self.user.pk), {('movie', self.movie.pk)})
+        forget_downloaded_set(self.user.pk)
+        Download.objects.create(user=self.user, episode=self.episode)
+        self.assertEqual(downloaded_set(self.user.pk), {('movie', self.movie.pk), ('episode', self.episode.pk)})
+
+    def test_write_events_known_title(self):
+        Download.objects.create(user=self.user, movie=self.movie)
+        now = timezone.now()
+        write_events([
+            (self.user.pk, 'movie', self.movie.pk, now, '192.0.2.1', None, None),
+            (self.user.pk, 'movie', self.movie.pk, now, '192.0.2.1', 500, 999),
+        ])
+        self.assertEqual(DownloadEvent.objects.count(), 2)
+        self.assertEqual(Download.objects.count(), 1)
+        self.assertEqual(UserProfile.objects.get(user=self.user).downloads_count, 1)
+
+    def test_trending_counts_download_starts(self):
+        now = timezone.now()
+        write_events([
+            (self.user.pk, 'movie', self.movie.pk, now, None, None, None),
+            (self.user.pk, 'movie', self.movie.pk, now, None, 0, 1023),
+            # Resuming and seeking
+            (self.user.pk, 'movie', self.movie.pk, now, None, 1024, 2047),
+            (self.user.pk, 'movie', self.movie.pk, now, None, 4096, None),
+            (self.user.pk, 'movie', self.movie.pk, now, None, None, 512),
+        ])
+        flush_trending()
+        self.assertAlmostEqual(
+            TrendingScore.objects.get(movie=self.movie).score,
+            log_contribution(2 * weight('download'), now),
+        )
+
+class ProgressTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        series = create_series(0)
+        cls.episode, = create_episodes(series, 1)
+        cls.user = User.objects.create_user('viewer')
+        UserProfile.objects.create(user=cls.user)
+
+    def setUp(self):
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def post_samples(self, samples):
+        return self.client.post('/user/progress/batch/', json.dumps({'samples': samples}), 'application/json')
+
+    def test_batch_progress(self):
+        self.client.force_login(self.user)
+        response = self.post_samples([
+            {'content_type': 'movie', 'content_id': self.movie.pk, 'progress': 10},
+            {'content_type': 'movie', 'content_id': self.movie.pk, 'progress': 20.5},
+            {'content_type': 'episode', 'content_id': self.episode.pk, 'progress': 150},
+            {'content_type': 'movie', 'content_id': 0, 'progress': 5},  # unknown
+            {'content_type': 'series', 'content_id': self.movie.pk, 'progress': 5},
+            {'content_type': 'movie', 'content_id': self.movie.pk, 'progress': 'nan'},
+            {'content_type': 'movie', 'progress': 5},
+        ])
+        self.assertEqual(response.json(), {'success': True, 'accepted': 3, 'rejected': 4})
+        self.assertFalse(WatchHistory.objects.exists())
+
+        get_progress_buffer().flush()
+        history = {(row.movie_id, row.episode_id): row.progress for row in WatchHistory.objects.filter(user=self.user)}
+        self.assertEqual(history, {(self.movie.pk, None): 20.5, (None, self.episode.pk): 100.0})
+        self.assertEqual(UserProfile.objects.get(user=self.user).history_count, 2)
+
+    def test_batch_progress_rejects(self):
+        self.client.force_login(self.user)
+        response = self.client.post('/user/progress/batch/', 'not json', 'application/json')
+        self.assertEqual(response.status_code, 400)
+        with self.settings(PROGRESS_BATCH_MAX_SAMPLES=1):
+            sample = {'content_type': 'movie', 'content_id': self.movie.pk, 'progress': 1}
+            self.assertEqual(self.post_samples([sample, sample]).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.post_samples([]).status_code, 302)
+
+    def test_write_progress(self):
+        now = timezone.now()
+        write_progress({(self.user.pk, 'movie', self.movie.pk): (30.0, now)})
+        write_progress({
+            (self.user.pk, 'movie', self.movie.pk): (45.0, now + datetime.timedelta(minutes=1)),
+            (self.user.pk, 'episode', self.episode.pk): (5.0, now),
+        })
+        self.assertEqual(WatchHistory.objects.filter(movie=self.movie).get().progress, 45.0)
+        self.assertEqual(WatchHistory.objects.filter(episode=self.episode).get().progress, 5.0)
+        # Same day, nothing to roll up
+        self.assertFalse(WatchDailyAggregate.objects.exists())
+
+    def test_new_day_rolls_up(self):
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        row = WatchHistory.objects.create(user=self.user, movie=self.movie, progress=30.0)
+        WatchHistory.objects.filter(pk=row.pk).update(watched_at=yesterday)
+
+        now = timezone.now()
+        write_progress({(self.user.pk, 'movie', self.movie.pk): (60.0, now)})
+        row.refresh_from_db()
+        self.assertEqual((row.progress, row.watched_at), (60.0, now))
+        aggregate = WatchDailyAggregate.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual(aggregate.day, timezone.localdate(yesterday))
+        self.assertEqual((aggregate.events, aggregate.max_progress), (1, 30.0))
+        self.assertEqual(WatchHistory.objects.filter(user=self.user).count(), 1)
+
+
+class ActivityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movies = [create_movie(number) for number in range(7)]
+        cls.user = User.objects.create_user('viewer')
+        cls.other = User.objects.create_user('other')
+        UserProfile.objects.create(user=cls.user)
+        cls.reviews = [
+            Review.objects.create(user=cls.user, movie=movie, title=f'Review {number}', content='Text')
+            for number, movie in enumerate(cls.movies)
+        ]
+        Review.objects.create(user=cls.other, movie=cls.movies[0], title='Not mine', content='Text')
+
+    def setUp(self):
+        discard_all()
+        self.addCleanup(discard_all)
+
+    def totals(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return {name: getattr(profile, section.total_field) for name, section in SECTIONS.items()}
+
+    def test_section_pages(self):
+        section = SECTIONS['reviews']
+        seen, cursor = [], None
+        while True:
+            page = section.page(self.user, cursor, per_page=3)
+            self.assertLessEqual(len(page), 3)
+            seen.extend(page)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        # Newest first; rows created in the same instant come by id
+        self.assertEqual(seen, self.reviews[::-1])
+
+    @override_settings(PROFILE_SECTION_LIMIT=2)
+    def test_profile_sections(self):
+        rate(self.user, self.movies[0], 4)
+        self.client.force_login(self.user)
+        response = self.client.get('/user/profile/')
+        sections = {entry['section'].name: entry for entry in response.context['sections']}
+        self.assertEqual(list(sections['reviews']['page']), self.reviews[:-3:-1])
+        self.assertEqual(sections['reviews']['total'], 7)
+        self.assertEqual(len(sections['ratings']['page']), 1)
+        self.assertEqual(sections['ratings']['total'], 1)
+        self.assertEqual(sections['history']['total'], 0)
+
+    def test_totals_follow_create_delete(self):
+        self.assertEqual(self.totals(), {'ratings': 0, 'reviews': 7, 'downloads': 0, 'history': 0})
+        rating, _ = rate(self.user, self.movies[0], 4)
+        download = Download.objects.create(user=self.user, movie=self.movies[0])
+        self.reviews[0].delete()
+        self.assertEqual(self.totals(), {'ratings': 1, 'reviews': 6, 'downloads': 1, 'history': 0})
+        rating.delete()
+        download.delete()
+        self.assertEqual(self.totals(), {'ratings': 0, 'reviews': 6, 'downloads': 0, 'history': 0})
+        # Never below zero
+        adjust_total(self.user.pk, 'ratings', -1)
+        self.assertEqual(self.totals()['ratings'], 0)
+
+    def test_recount_totals(self):
+        WatchHistory.objects.create(user=self.user, movie=self.movies[0])
+        UserProfile.objects.filter(user=self.user).update(reviews_count=50, history_count=0)
+        recount_totals([self.user.pk], ['history'])
+        self.assertEqual(self.totals(), {'ratings': 0, 'reviews': 50, 'downloads': 0, 'history': 1})
+        recount_totals([self.user.pk, self.other.pk])
+        self.assertEqual(self.totals(), {'ratings': 0, 'reviews': 7, 'downloads': 0, 'history': 1})
+        # The other user has no profile yet; get_profile counts on creation
+        self.assertEqual(get_profile(self.other).reviews_count, 1)
+
+    @override_settings(PROFILE_PAGE_SIZE=4)
+    def test_profile_section_endpoint(self):
+        url = '/user/profile/reviews/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'user_interactions/profile_section.html')
+        self.assertEqual(list(response.context['page']), self.reviews[:-5:-1])
+        cursor = response.context['page'].next_cursor
+        self.assertContains(response, f'?cursor={cursor}')
+
+        response = self.client.get(url, {'cursor': cursor}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertTemplateNotUsed(response, 'user_interactions/profile_section.html')
+        self.assertNotContains(response, '<html')
+        self.assertEqual(list(response.context['page']), self.reviews[2::-1])
+        self.assertNotContains(response, 'Load more')
+        self.assertNotContains(response, 'Not mine')
+
+        self.assertEqual(self.client.get('/user/profile/unknown/').status_code, 404)
+
+class CompactionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = create_movie(0)
+        series = create_series(0)
+        cls.episode, = create_episodes(series, 1)
+        cls.user = User.objects.create_user('viewer')
+        UserProfile.objects.create(user=cls.user)
+
+    def setUp(self):
+        # Rows an hour or so apart stay on the same day
+        self.now = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def history(self, watched_at, progress, **content):
+        row = WatchHistory.objects.create(user=self.user, progress=progress, **content)
+        WatchHistory.objects.filter(pk=row.pk).update(watched_at=watched_at)
+        return row
+
+    def aggregates(self):
+        return {
+            (aggregate.movie_id, aggregate.episode_id, aggregate.day): (aggregate.events, aggregate.max_progress)
+            for aggregate in WatchDailyAggregate.objects.filter(user=self.user)
+        }
+
+    def test_roll_up(self):
+        now = self.now
+        yesterday = now - datetime.timedelta(days=1)
+        roll_up([
+            (self.user.pk, 'movie', self.movie.pk, yesterday, 40.0),
+            (self.user.pk, 'movie', self.movie.pk, yesterday, 20.0),
+            (self.user.pk, 'episode', self.episode.pk, now, 10.0),
+        ])
+        # Added to the aggregates already there
+        roll_up([(self.user.pk, 'movie', self.movie.pk, yesterday + datetime.timedelta(seconds=1), 30.0)])
+        self.assertEqual(self.aggregates(), {
+            (self.movie.pk, None, timezone.localdate(yesterday)): (3, 40.0),
+            (None, self.episode.pk, timezone.localdate(now)): (1, 10.0),
+        })
+        aggregate = WatchDailyAggregate.objects.get(movie=self.movie)
+        self.assertEqual(aggregate.last_watched_at, yesterday + datetime.timedelta(seconds=1))
+
+    def test_fold_pairs(self):
+        now = self.now
+        two_days_ago = now - datetime.timedelta(days=2)
+        self.history(two_days_ago, 10.0, movie=self.movie)
+        self.history(two_days_ago + datetime.timedelta(hours=1), 25.0, movie=self.movie)
+        self.history(now - datetime.timedelta(days=1), 50.0, movie=self.movie)
+        latest = self.history(now, 70.0, movie=self.movie)
+        single = self.history(now, 5.0, episode=self.episode)
+        UserProfile.objects.filter(user=self.user).update(history_count=5)
+
+        self.assertEqual(duplicate_pairs('movie'), [(self.user.pk, self.movie.pk)])
+        self.assertEqual(duplicate_pairs('episode'), [])
+        self.assertEqual(fold_pairs('movie', duplicate_pairs('movie')), 3)
+
+        self.assertEqual(set(WatchHistory.objects.values_list('pk', flat=True)), {latest.pk, single.pk})
+        self.assertEqual(self.aggregates(), {
+            (self.movie.pk, None, timezone.localdate(two_days_ago)): (2, 25.0),
+            (self.movie.pk, None, timezone.localdate(now - datetime.timedelta(days=1))): (1, 50.0),
+        })
+        self.assertEqual(UserProfile.objects.get(user=self.user).history_count, 2)
+
+    def test_enforce_retention(self):
+        today = timezone.localdate()
+        for age in range(8):
+            WatchDailyAggregate.objects.create(
+                user=self.user, movie=self.movie, day=today - datetime.timedelta(days=age),
+                events=1, last_watched_at=timezone.now(),
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(enforce_retention(2, chunk_size=2), 5)
+        # Three chunks of at most two rows
+        deletes = [query for query in queries.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+        days = sorted(WatchDailyAggregate.objects.values_list('day', flat=True))
+        self.assertEqual(days, [today - datetime.timedelta(days=age) for age in (2, 1, 0)])
+
+    def test_command(self):
+        now = self.now
+        for progress in (10.0, 20.0, 30.0):
+            self.history(now - datetime.timedelta(minutes=100 - progress), progress, episode=self.episode)
+        self.history(now, 50.0, movie=self.movie)
+        WatchDailyAggregate.objects.create(
+            user=self.user, movie=self.movie, day=timezone.localdate() - datetime.timedelta(days=30),
+            events=4, last_watched_at=now - datetime.timedelta(days=30),
+        )
+        out = StringIO()
+        call_command('compact_watch_history', retention_days=7, chunk_size=1, stdout=out)
+        self.assertIn('Folded 2 older history rows', out.getvalue())
+        self.assertIn('Deleted 1 daily aggregates older than 7 days', out.getvalue())
+        self.assertEqual(WatchHistory.objects.get(episode=self.episode).progress, 30.0)
+        self.assertEqual(self.aggregates(), {
+            (None, self.episode.pk, timezone.localdate(now - datetime.timedelta(minutes=90))): (2, 20.0),
+        })
@@ -21,8 +21,10 @@ urlpatterns = [
     # Watch history URLs
     path('watch-history/', views.watch_history, name='watch_history'),
     path('mark-progress/<str:content_type>/<int:content_id>/', views.mark_progress, name='mark_progress'),
+    path('progress/batch/', views.batch_progress, name='batch_progress'),
     
     # User profile URLs
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('profile/<slug:section>/', views.profile_section, name='profile_section'),
 ]
\ No newline at end of file
@@ -1,10 +1,20 @@
+import json
+import math
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
-from .models import Rating, Review, Download, WatchHistory, UserProfile
+from .models import Review, WatchHistory
+from .activity import SECTIONS, get_profile, profile_sections
+from .download_log import record_download
+from .downloads import serve_file, served_range
+from .progress import record_progress
+from .ratings import rate
 from movies.models import Movie, Series, Episode
+from movies.pagination import paginate
 
 
 @login_required
@@ -15,12 +25,8 @@ def rate_movie(request, movie_id):
         rating_value = int(request.POST.get('rating', 0))
         
         if 1 <= rating_value <= 5:
-            # Check if user already rated this movie
-            rating, created = Rating.objects.update_or_create(
-                user=request.user,
-                movie=movie,
-                defaults={'rating': rating_value}
-            )
+            # Store the rating and update the movie's rating totals
+            rating, created = rate(request.user, movie, rating_value)
             
             if created:
                 messages.success(request, f"You rated '{movie.title}' with {rating_value} stars!")
@@ -40,12 +46,8 @@ def rate_series(request, series_id):
         rating_value = int(request.POST.get('rating', 0))
         
         if 1 <= rating_value <= 5:
-            # Check if user already rated this series
-            rating, created = Rating.objects.update_or_create(
-                user=request.user,
-                series=series,
-                defaults={'rating': rating_value}
-            )
+            # Store the rating and update the series's rating totals
+            rating, created = rate(request.user, series, rating_value)
             
             if created:
                 messages.success(request, f"You rated '{series.title}' with {rating_value} stars!")
@@ -65,12 +67,8 @@ def rate_episode(request, episode_id):
         rating_value = int(request.POST.get('rating', 0))
         
         if 1 <= rating_value <= 5:
-            # Check if user already rated this episode
-            rating, created = Rating.objects.update_or_create(
-                user=request.user,
-                episode=episode,
-                defaults={'rating': rating_value}
-            )
+            # Store the rating and update the episode's rating totals
+            rating, created = rate(request.user, episode, rating_value)
             
             if created:
                 messages.success(request, f"You rated '{episode.title}' with {rating_value} stars!")
@@ -174,32 +172,23 @@ def download_movie(request, movie_id):
     """Handle movie download"""
     movie = get_object_or_404(Movie, id=movie_id)
     
-    # Record download
-    download, created = Download.objects.get_or_create(
-        user=request.user,
-        movie=movie,
-        defaults={
-            'ip_address': get_client_ip(request)
-        }
-    )
-    
-    if created:
-        messages.success(request, f"'{movie.title}' has been added to your downloads!")
-    else:
-        messages.info(request, f"You have already downloaded '{movie.title}'.")
-    
-    # Return the movie file for download
-    if movie.video_file:
-        from django.http import FileResponse
-        response = FileResponse(
-            open(movie.video_file.path, 'rb'), 
-            content_type='video/mp4'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{movie.title}.mp4"'
-        return response
-    else:
+    if not movie.video_file:
         messages.error(request, f"'{movie.title}' is not available for download.")
         return redirect('movies:movie_detail', slug=movie.slug)
+    
+    # Return the movie file for download, honouring byte ranges
+    response = serve_file(request, movie.video_file, f'{movie.title}.mp4')
+    if response.status_code in (200, 206):
+        # Log the download; events are buffered and written in bulk
+        first = record_download(request.user.id, movie, get_client_ip(request), served_range(request, response))
+        
+        # Range requests continue a download that was already announced
+        if 'HTTP_RANGE' not in request.META:
+            if first:
+                messages.success(request, f"'{movie.title}' has been added to your downloads!")
+            else:
+                messages.info(request, f"You have already downloaded '{movie.title}'.")
+    return response
 
 
 @login_required
@@ -207,43 +196,38 @@ def download_episode(request, episode_id):
     """Handle episode download"""
     episode = get_object_or_404(Episode, id=episode_id)
     
-    # Record download
-    download, created = Download.objects.get_or_create(
-        user=request.user,
-        episode=episode,
-        defaults={
-            'ip_address': get_client_ip(request)
-        }
-    )
-    
-    if created:
-        messages.success(request, f"'{episode.title}' has been added to your downloads!")
-    else:
-        messages.info(request, f"You have already downloaded '{episode.title}'.")
-    
-    # Return the episode file for download
-    if episode.video_file:
-        from django.http import FileResponse
-        response = FileResponse(
-            open(episode.video_file.path, 'rb'), 
-            content_type='video/mp4'
-        )
-        response['Content-Disposition'] = f'attachment; filename="{episode.title}.mp4"'
-        return response
-    else:
+    if not episode.video_file:
         messages.error(request, f"'{episode.title}' is not available for download.")
         return redirect('movies:episode_detail', series_slug=episode.series.slug, episode_number=episode.episode_number)
+    
+    # Return the episode file for download, honouring byte ranges
+    response = serve_file(request, episode.video_file, f'{episode.title}.mp4')
+    if response.status_code in (200, 206):
+        # Log the download; events are buffered and written in bulk
+        first = record_download(request.user.id, episode, get_client_ip(request), served_range(request, response))
+        
+        # Range requests continue a download that was already announced
+        if 'HTTP_RANGE' not in request.META:
+            if first:
+                messages.success(request, f"'{episode.title}' has been added to your downloads!")
+            else:
+                messages.info(request, f"You have already downloaded '{episode.title}'.")
+    return response
 
 
 @login_required
 def watch_history(request):
     """Display user's watch history"""
+    # One row per title watched (see compaction), newest first
     watch_history = WatchHistory.objects.filter(user=request.user).select_related(
-        'movie', 'episode'
-    ).order_by('-watched_at')
+        'movie', 'episode__series', 'episode__season'
+    )
+    
+    # Cursor pagination, 20 titles per page
+    page_obj = paginate(watch_history, request.GET.get('cursor'), 20, ('-watched_at', '-id'))
     
     context = {
-        'watch_history': watch_history,
+        'watch_history': page_obj,
     }
     return render(request, 'user_interactions/watch_history.html', context)
 
@@ -256,52 +240,108 @@ def mark_progress(request, content_type, content_id):
     
     if content_type == 'movie':
         content = get_object_or_404(Movie, id=content_id)
-        watch_history, created = WatchHistory.objects.update_or_create(
-            user=request.user,
-            movie=content,
-            defaults={'progress': progress}
-        )
     elif content_type == 'episode':
         content = get_object_or_404(Episode, id=content_id)
-        watch_history, created = WatchHistory.objects.update_or_create(
-            user=request.user,
-            episode=content,
-            defaults={'progress': progress}
-        )
     else:
         return JsonResponse({'success': False, 'error': 'Invalid content type'})
     
+    # Progress is buffered and written to the watch history in bulk
+    record_progress(request.user.id, content_type, content.id, progress)
+    
     return JsonResponse({
         'success': True, 
         'message': f'Progress saved for {content.title}'
     })
 
 
+@login_required
+@require_POST
+def batch_progress(request):
+    """Accept many progress samples in one request.
+
+    Expects a JSON body like
+    ``{"samples": [{"content_type": "movie", "content_id": 1, "progress": 42.5}]}``.
+    Later samples for the same content replace earlier ones.
+    """
+    try:
+        samples = json.loads(request.body)['samples']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON body'}, status=400)
+    
+    max_samples = getattr(settings, 'PROGRESS_BATCH_MAX_SAMPLES', 500)
+    if not isinstance(samples, list) or len(samples) > max_samples:
+        return JsonResponse({'success': False, 'error': f'Send a list of at most {max_samples} samples'}, status=400)
+    
+    valid = []
+    for sample in samples:
+        try:
+            content_type = sample['content_type']
+            content_id = int(sample['content_id'])
+            progress = float(sample['progress'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if content_type in ('movie', 'episode') and math.isfinite(progress):
+            valid.append((content_type, content_id, progress))
+    
+    # One query per content type to drop samples for unknown content
+    ids = {'movie': set(), 'episode': set()}
+    for content_type, content_id, _ in valid:
+        ids[content_type].add(content_id)
+    known = {
+        'movie': set(Movie.objects.filter(id__in=ids['movie']).values_list('id', flat=True)),
+        'episode': set(Episode.objects.filter(id__in=ids['episode']).values_list('id', flat=True)),
+    }
+    accepted = 0
+    for content_type, content_id, progress in valid:
+        if content_id in known[content_type]:
+            record_progress(request.user.id, content_type, content_id, progress)
+            accepted += 1
+    
+    return JsonResponse({
+        'success': True,
+        'accepted': accepted,
+        'rejected': len(samples) - accepted,
+    })
+
+
 @login_required
 def profile(request):
     """Display user profile"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
-    # Get user's activity
-    ratings = Rating.objects.filter(user=request.user).select_related('movie', 'series', 'episode')
-    reviews = Review.objects.filter(user=request.user).select_related('movie', 'series', 'episode')
-    downloads = Download.objects.filter(user=request.user).select_related('movie', 'episode')
-    watch_history = WatchHistory.objects.filter(user=request.user).select_related('movie', 'episode')
+    # The newest few rows of each activity feed and their stored totals,
+    # more pages load from profile_section
+    sections = profile_sections(request.user, profile)
     
     context = {
         'profile': profile,
-        'ratings': ratings,
-        'reviews': reviews,
-        'downloads': downloads,
-        'watch_history': watch_history,
+        'sections': sections,
     }
     return render(request, 'user_interactions/profile.html', context)
 
 
+@login_required
+def profile_section(request, section):
+    """Display one more page of a profile activity feed"""
+    if section not in SECTIONS:
+        raise Http404
+    section = SECTIONS[section]
+    page = section.page(request.user, request.GET.get('cursor'))
+    
+    context = {
+        'section': section,
+        'page': page,
+    }
+    # The profile page's script asks for the bare fragment
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return render(request, 'user_interactions/activity/feed.html', context)
+    return render(request, 'user_interactions/profile_section.html', context)
+
+
 @login_required
 def edit_profile(request):
     """Edit user profile"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
     if request.method == 'POST':
         # Update profile fields